@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Бенчмарк автоматической блокировки (utils/auto_ban.py).
+
+Механизм автоматической блокировки получает поток уведомлений: фоновые
+неудачные входы со случайных адресов (по 2, ниже порога) и атаки с
+--attackers адресов (брутфорс и серии неудачных входов, часть атакующих
+из одной подсети). Функция применения блокировок только записывает
+полученные пакеты, поэтому измеряется сам механизм, без межсетевого экрана
+и базы данных.
+
+Измеряется:
+    rate     - уведомлений в секунду в observe (цель - не меньше 50 000)
+    memory   - прирост пиковой памяти (RSS) за время прогона
+    batches  - количество вызовов функции применения (блокировки
+               применяются пакетами, а не по одной на уведомление)
+
+После прогона проверяется, что заблокированы все атакующие и ни один
+фоновый адрес, а число скользящих окон ограничено вытеснением
+простаивающих.
+
+Примеры:
+    python benchmarks/bench_auto_ban.py --alerts 1000000
+    python benchmarks/bench_auto_ban.py --attackers 5000 --max-entries 50000
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+import resource
+from typing import Any, Dict, List, Set, Tuple
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+
+sys.path.insert(0, os.path.join(ROOT_DIR, "hids_bot"))
+
+from utils.auto_ban import AutoBanEngine, AutoBanPolicy  # noqa: E402
+
+# Целевая скорость обработки (уведомлений в секунду)
+TARGET_RATE = 50000
+
+
+def make_alerts(args) -> Tuple[List[Tuple[str, str]], Set[str]]:
+    """
+    Формирует поток уведомлений.
+
+    Args:
+        args: Аргументы командной строки
+
+    Returns:
+        Список (IP, тип уведомления) и множество атакующих адресов
+    """
+    rng = random.Random(args.seed)
+    # Половина атакующих - из одной подсети /24 на каждые 100 адресов
+    attackers = [f"198.51.{i // 100 % 256}.{i % 100 + 1}" if i % 2 else f"203.0.{i // 256 % 256}.{i % 256}"
+                 for i in range(args.attackers)]
+
+    # Фоновые уведомления: по 2 неудачных входа с различных адресов из 10.0.0.0/8 (порог - 5)
+    background = max(0, args.alerts - args.attackers * 6) // 2
+    alerts = [(f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}", "FAILED_LOGIN")
+              for i in rng.sample(range(1, 1 << 24), background)] * 2
+    rng.shuffle(alerts)
+
+    # Атаки: серии неудачных входов и уведомления о брутфорсе, вставленные в
+    # случайные места потока; уведомления одной серии идут через --attack-gap
+    # фоновых уведомлений
+    keyed = [(idx, alert) for idx, alert in enumerate(alerts)]
+    for idx, ip in enumerate(attackers):
+        attack = [(ip, "FAILED_LOGIN")] * 5 if idx % 3 else [(ip, "BRUTE_FORCE")] * 6
+        start = rng.uniform(0, len(alerts))
+        keyed.extend((start + step * args.attack_gap, alert) for step, alert in enumerate(attack))
+    keyed.sort(key=lambda item: item[0])
+    return [alert for _, alert in keyed], set(attackers)
+
+
+async def run(args) -> Dict[str, Any]:
+    """
+    Прогоняет поток уведомлений через механизм автоматической блокировки.
+
+    Args:
+        args: Аргументы командной строки
+
+    Returns:
+        Результаты прогона
+    """
+    alerts, attackers = make_alerts(args)
+    policy = AutoBanPolicy(
+        enabled=True,
+        thresholds={"BRUTE_FORCE": (1, 300.0), "FAILED_LOGIN": (5, 300.0)},
+        subnet_threshold=(args.subnet_threshold, 300.0) if args.subnet_threshold else None,
+    )
+
+    batches: List[int] = []
+    banned: Set[str] = set()
+
+    async def apply(bans):
+        batches.append(len(bans))
+        banned.update(target for target, _, _ in bans)
+        return [target for target, _, _ in bans]
+
+    engine = AutoBanEngine(
+        policy, apply,
+        is_whitelisted=lambda ip: False,
+        is_blocked=banned.__contains__,
+        whitelist=lambda: (),
+        max_entries=args.max_entries,
+    )
+    await engine.start()
+
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    observe = engine.observe
+    chunk = args.chunk
+    # Время уведомлений растет равномерно на протяжении --duration секунд
+    step = args.duration / len(alerts)
+    base = time.monotonic()
+    elapsed = 0.0
+    for offset in range(0, len(alerts), chunk):
+        start = time.perf_counter()
+        for idx in range(offset, min(offset + chunk, len(alerts))):
+            ip, alert_type = alerts[idx]
+            observe(ip, alert_type, base + idx * step)
+        elapsed += time.perf_counter() - start
+        # Отдаем управление событийному циклу, как обработчики очереди уведомлений
+        await asyncio.sleep(0)
+    await engine.stop()
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    stats = engine.stats()
+    banned_ips = {target for target in banned if "/" not in target}
+    subnets = sorted(target for target in banned if "/" in target)
+    false_positives = [ip for ip in banned_ips if ip not in attackers]
+    missed = [ip for ip in attackers
+              if ip not in banned_ips and not any(ip.rsplit(".", 1)[0] + ".0/24" == net for net in subnets)]
+    return {
+        "alerts": len(alerts),
+        "seconds": elapsed,
+        "rate": len(alerts) / elapsed,
+        "rss_growth_mb": (rss_after - rss_before) / 1024,
+        "apply_calls": len(batches),
+        "max_batch": max(batches, default=0),
+        "banned": len(banned_ips),
+        "banned_subnets": len(subnets),
+        "attackers": len(attackers),
+        "missed": len(missed),
+        "false_positives": len(false_positives),
+        "stats": stats,
+        "ok": not missed and not false_positives and stats["windows"] <= args.max_entries,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк автоматической блокировки")
+    parser.add_argument("--alerts", type=int, default=1000000, help="Количество уведомлений")
+    parser.add_argument("--attackers", type=int, default=2000, help="Количество атакующих адресов")
+    parser.add_argument("--attack-gap", type=int, default=1000,
+                        help="Количество фоновых уведомлений между уведомлениями одной атаки")
+    parser.add_argument("--subnet-threshold", type=int, default=200,
+                        help="Порог уведомлений для подсети /24 (0 - не блокировать подсети)")
+    parser.add_argument("--duration", type=float, default=60.0,
+                        help="Интервал времени, на который приходится поток уведомлений (в секундах)")
+    parser.add_argument("--max-entries", type=int, default=200000, help="Максимальное количество скользящих окон")
+    parser.add_argument("--chunk", type=int, default=1000,
+                        help="Количество уведомлений между передачами управления событийному циклу")
+    parser.add_argument("--seed", type=int, default=1, help="Начальное значение генератора случайных чисел")
+    parser.add_argument("--output", help="Файл для результатов в JSON")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format="%(levelname)s - %(message)s")
+
+    results = asyncio.run(run(args))
+    stats = results["stats"]
+    print(f"\n== Автоматическая блокировка ({results['alerts']} уведомлений) ==")
+    print(f"  скорость: {results['rate']:,.0f} уведомлений/с ({results['seconds']:.2f} с), "
+          f"цель {TARGET_RATE:,}")
+    print(f"  прирост пиковой памяти: {results['rss_growth_mb']:.1f} МБ, "
+          f"окон {stats['windows']} (вытеснено {stats['evicted']}), подсетей {stats['subnet_windows']}")
+    print(f"  заблокировано: {results['banned']} из {results['attackers']} атакующих, "
+          f"подсетей {results['banned_subnets']}, пропущено {results['missed']}, "
+          f"ложных блокировок {results['false_positives']}")
+    print(f"  вызовов применения: {results['apply_calls']} (максимум {results['max_batch']} блокировок в пакете)")
+    print(f"  проверка: {'OK' if results['ok'] else 'ОШИБКА'}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if not results["ok"] or results["rate"] < TARGET_RATE:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Бенчмарк DatabaseManager: скорость записи инцидентов и задержка чтения.
+
+Текущая версия database/db_manager.py сравнивается с версией из любого
+коммита (--baseline), загруженной через git show, - так измеряется
+эффект изменений "до/после" на одинаковой нагрузке.
+
+Измеряется:
+    insert        - последовательная запись add_incident (включая фиксацию)
+    insert_mt     - запись из нескольких потоков одновременно
+    insert_durable - запись с ожиданием фиксации каждого инцидента (wait=True)
+    read_recent   - get_recent_incidents(10)
+    read_by_ip    - get_incidents_by_ip
+    read_page     - get_incidents_page: одна страница истории IP с курсором
+    whitelist     - is_in_whitelist
+    read_under_write - get_recent_incidents во время записи из другого потока
+                       (с заданной скоростью --write-rate)
+
+Примеры:
+    python benchmarks/bench_db.py --rows 5000
+    python benchmarks/bench_db.py --baseline HEAD~1 --output /tmp/db.json
+"""
+
+import os
+import sys
+import json
+import time
+import types
+import inspect
+import logging
+import argparse
+import tempfile
+import threading
+import subprocess
+from typing import Any, Callable, Dict, List
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+
+sys.path.insert(0, os.path.join(ROOT_DIR, "hids_bot"))
+
+from database import db_manager as current_db_manager  # noqa: E402
+
+DB_MANAGER_PATH = "hids_bot/database/db_manager.py"
+
+
+def load_revision(revision: str) -> types.ModuleType:
+    """
+    Загружает database/db_manager.py из указанного коммита.
+
+    Args:
+        revision: Коммит, ветка или тег git
+
+    Returns:
+        Модуль с классом DatabaseManager
+    """
+    source = subprocess.check_output(["git", "show", f"{revision}:{DB_MANAGER_PATH}"], cwd=ROOT_DIR, text=True)
+    module = types.ModuleType(f"db_manager_{revision}")
+    module.__file__ = f"{revision}:{DB_MANAGER_PATH}"
+    exec(compile(source, module.__file__, "exec"), module.__dict__)
+    return module
+
+
+def _summary(samples: List[float]) -> Dict[str, float]:
+    samples.sort()
+    count = len(samples)
+    return {
+        "count": count,
+        "ops_per_sec": count / sum(samples) if samples and sum(samples) else 0.0,
+        "p50_us": samples[count // 2] * 1e6 if samples else 0.0,
+        "p95_us": samples[min(count - 1, int(count * 0.95))] * 1e6 if samples else 0.0,
+        "p99_us": samples[min(count - 1, int(count * 0.99))] * 1e6 if samples else 0.0,
+        "max_us": samples[-1] * 1e6 if samples else 0.0,
+    }
+
+
+def _timed(func: Callable[[], Any], repeat: int) -> List[float]:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def run_suite(module: types.ModuleType, args) -> Dict[str, Any]:
+    """
+    Выполняет все измерения для одной версии DatabaseManager.
+
+    Args:
+        module: Модуль с классом DatabaseManager
+        args: Аргументы командной строки
+
+    Returns:
+        Результаты измерений
+    """
+    results: Dict[str, Any] = {}
+    with tempfile.TemporaryDirectory(prefix="hids-bench-db-") as workdir:
+        db = module.DatabaseManager(os.path.join(workdir, "hids.db"))
+        ips = [f"203.0.113.{idx % 250}" for idx in range(args.rows)]
+        reason = "Неудачная попытка входа: пользователь root с IP {ip}"
+
+        # Версии с отложенной записью дожидаются фиксации через flush
+        flush = getattr(db, "flush", lambda: None)
+
+        # Последовательная запись
+        counter = iter(range(args.rows))
+        start = time.perf_counter()
+        samples = _timed(lambda: db.add_incident(ips[next(counter)], reason), args.rows)
+        flush()
+        elapsed = time.perf_counter() - start
+        results["insert"] = _summary(samples)
+        results["insert"]["ops_per_sec"] = args.rows / elapsed
+
+        # Запись с ожиданием фиксации каждого инцидента
+        if "wait" in inspect.signature(db.add_incident).parameters:
+            results["insert_durable"] = _summary(_timed(
+                lambda: db.add_incident(ips[0], reason, wait=True), args.rows // 4))
+
+        # Запись из нескольких потоков
+        samples: List[float] = []
+        lock = threading.Lock()
+
+        def writer(offset):
+            local = _timed(lambda: db.add_incident(ips[offset], reason), args.rows // args.threads)
+            with lock:
+                samples.extend(local)
+
+        threads = [threading.Thread(target=writer, args=(idx,)) for idx in range(args.threads)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        flush()
+        elapsed = time.perf_counter() - start
+        results["insert_mt"] = _summary(samples)
+        results["insert_mt"]["ops_per_sec"] = len(samples) / elapsed
+
+        # Чтение
+        db.add_to_whitelist("198.51.100.1")
+        results["read_recent"] = _summary(_timed(lambda: db.get_recent_incidents(10), args.reads))
+        results["read_by_ip"] = _summary(_timed(lambda: db.get_incidents_by_ip("203.0.113.7"), args.reads))
+        if hasattr(db, "get_incidents_page"):
+            page = db.get_incidents_page("203.0.113.7", 10)
+            cursor = (page[-1][3], page[-1][0])
+            results["read_page"] = _summary(_timed(
+                lambda: db.get_incidents_page("203.0.113.7", 11, before=cursor), args.reads))
+        results["whitelist"] = _summary(_timed(lambda: db.is_in_whitelist("198.51.100.1"), args.reads))
+
+        # Чтение во время записи с постоянной скоростью (пачками по 50)
+        stop = threading.Event()
+
+        def background_writer():
+            interval = 50 / args.write_rate
+            next_burst = time.perf_counter()
+            while not stop.is_set():
+                for _ in range(50):
+                    db.add_incident("203.0.113.200", reason)
+                next_burst += interval
+                delay = next_burst - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+
+        thread = threading.Thread(target=background_writer)
+        thread.start()
+        try:
+            results["read_under_write"] = _summary(_timed(lambda: db.get_recent_incidents(10), args.reads))
+        finally:
+            stop.set()
+            thread.join()
+
+        if hasattr(db, "close"):
+            db.close()
+
+    return results
+
+
+def print_results(name: str, results: Dict[str, Any], baseline: Dict[str, Any] = None) -> None:
+    print(f"[{name}]")
+    for test, stats in results.items():
+        line = (f"  {test:<17} {stats['ops_per_sec']:>10.0f} оп/с  p50 {stats['p50_us']:>9.1f} мкс  "
+                f"p99 {stats['p99_us']:>9.1f} мкс")
+        if baseline and test in baseline and baseline[test]["ops_per_sec"]:
+            line += f"  ({stats['ops_per_sec'] / baseline[test]['ops_per_sec']:.1f}x)"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк DatabaseManager")
+    parser.add_argument("--rows", type=int, default=2000, help="Количество записываемых инцидентов")
+    parser.add_argument("--reads", type=int, default=2000, help="Количество запросов чтения каждого вида")
+    parser.add_argument("--threads", type=int, default=4, help="Количество потоков записи")
+    parser.add_argument("--write-rate", type=float, default=2000,
+                        help="Скорость фоновой записи для read_under_write, инцидентов/с")
+    parser.add_argument("--baseline", help="Коммит для сравнения (например, HEAD~1)")
+    parser.add_argument("--output", help="Файл для результатов в JSON")
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+
+    report: Dict[str, Any] = {"params": vars(args)}
+    baseline = None
+    if args.baseline:
+        baseline = run_suite(load_revision(args.baseline), args)
+        report["baseline"] = baseline
+        print_results(f"baseline {args.baseline}", baseline)
+
+    current = run_suite(current_db_manager, args)
+    report["current"] = current
+    print_results("current", current, baseline)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\nРезультаты сохранены: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Бенчмарк блокировки списка IP-адресов (utils/firewall.py).
+
+Механизмы блокировки запускаются против поддельных iptables,
+iptables-save, iptables-restore и ipset (скрипт Python во временном
+каталоге, состояние - в файлах), поэтому бенчмарк не требует root и не
+меняет межсетевой экран. Стоимость каждого вызова - запуск процесса, как у
+настоящих утилит.
+
+Измеряется:
+    per_ip     - block/unblock каждого адреса отдельно (на выборке из
+                 --per-ip-sample адресов, время пересчитывается на --ips)
+    batch      - block_many/unblock_many всего списка
+
+После пакетной блокировки проверяется, что в поддельном межсетевом экране
+ровно --ips записей, после разблокировки - что их не осталось.
+
+Примеры:
+    python benchmarks/bench_firewall.py --ips 10000
+    python benchmarks/bench_firewall.py --backends iptables --per-ip-sample 50
+"""
+
+import os
+import sys
+import json
+import stat
+import time
+import logging
+import argparse
+import tempfile
+import subprocess
+from typing import Any, Dict, List, Optional, Tuple
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+
+sys.path.insert(0, os.path.join(ROOT_DIR, "hids_bot"))
+
+from utils.firewall import create_backend, FirewallBackend  # noqa: E402
+
+# Поддельные утилиты: одна программа, действие выбирается по имени файла.
+# Правила iptables хранятся строками "-A INPUT -s X/32 ...", как их выводит
+# iptables-save; записи ipset - строками "набор адрес".
+FAKE_TOOL = r'''#!{python} -S
+import os
+import sys
+
+STATE_DIR = {state_dir!r}
+RULES = os.path.join(STATE_DIR, "rules")
+SETS = os.path.join(STATE_DIR, "sets")
+
+
+def load(path):
+    try:
+        with open(path) as f:
+            return f.read().splitlines()
+    except FileNotFoundError:
+        return []
+
+
+def save(path, lines):
+    with open(path, "w") as f:
+        f.write("".join(line + "\n" for line in lines))
+
+
+def canonical(chain, args):
+    # Как в выводе iptables-save: адрес с маской, модули совпадения перед целью
+    args = list(args)
+    if "-s" in args:
+        index = args.index("-s") + 1
+        if "/" not in args[index]:
+            args[index] += "/128" if ":" in args[index] else "/32"
+    if "-j" in args:
+        index = args.index("-j")
+        args = args[:index] + args[index + 2:] + args[index:index + 2]
+    return "-A " + chain + " " + " ".join('"%s"' % arg if " " in arg else arg for arg in args)
+
+
+def iptables(argv):
+    rules = load(RULES)
+    command, line = argv[0], canonical(argv[1], argv[2:])
+    if command == "-C":
+        return 0 if line in rules else 1
+    if command in ("-A", "-I"):
+        # -I INPUT 1 ...: номер позиции не входит в правило
+        if command == "-I" and argv[2].isdigit():
+            line = canonical(argv[1], argv[3:])
+        rules.append(line)
+        save(RULES, rules)
+        return 0
+    if command == "-D":
+        if line not in rules:
+            return 1
+        rules.remove(line)
+        save(RULES, rules)
+        return 0
+    return 2
+
+
+def iptables_save(argv):
+    sys.stdout.write("*filter\n:INPUT ACCEPT [0:0]\n")
+    for rule in load(RULES):
+        sys.stdout.write(rule + "\n")
+    sys.stdout.write("COMMIT\n")
+    return 0
+
+
+def iptables_restore(argv):
+    import shlex
+    rules = load(RULES)
+    for raw in sys.stdin.read().splitlines():
+        if not raw or raw[0] in "*#:" or raw == "COMMIT":
+            continue
+        args = shlex.split(raw)
+        line = canonical(args[1], args[2:])
+        if args[0] == "-A":
+            rules.append(line)
+        elif args[0] == "-D":
+            if line not in rules:
+                sys.stderr.write("iptables-restore: rule not found: %s\n" % raw)
+                return 1
+            rules.remove(line)
+    save(RULES, rules)
+    return 0
+
+
+def ipset(argv):
+    entries = set(load(SETS))
+    command = argv[0]
+    if command == "create":
+        return 0
+    if command == "save":
+        for entry in sorted(entries):
+            sys.stdout.write("add " + entry + "\n")
+        return 0
+    if command == "restore":
+        commands = [line.split() for line in sys.stdin.read().splitlines() if line.strip()]
+    else:
+        commands = [argv]
+    for args in commands:
+        entry = args[1] + " " + args[2]
+        if args[0] == "add":
+            entries.add(entry)
+        elif args[0] == "del":
+            entries.discard(entry)
+        elif args[0] == "test":
+            return 0 if entry in entries else 1
+    save(SETS, sorted(entries))
+    return 0
+
+
+TOOLS = {{
+    "iptables": iptables, "ip6tables": iptables,
+    "iptables-save": iptables_save, "ip6tables-save": iptables_save,
+    "iptables-restore": iptables_restore, "ip6tables-restore": iptables_restore,
+    "ipset": ipset,
+}}
+
+sys.exit(TOOLS[os.path.basename(sys.argv[0])](sys.argv[1:]))
+'''
+
+TOOL_NAMES = (
+    "iptables", "ip6tables", "iptables-save", "ip6tables-save",
+    "iptables-restore", "ip6tables-restore", "ipset",
+)
+
+
+def install_fake_tools(workdir: str) -> str:
+    """
+    Создает поддельные утилиты межсетевого экрана.
+
+    Args:
+        workdir: Временный каталог
+
+    Returns:
+        Каталог с утилитами
+    """
+    bin_dir = os.path.join(workdir, "bin")
+    state_dir = os.path.join(workdir, "state")
+    os.makedirs(bin_dir)
+    os.makedirs(state_dir)
+
+    tool = os.path.join(bin_dir, "fake_firewall")
+    with open(tool, "w") as f:
+        f.write(FAKE_TOOL.format(python=sys.executable, state_dir=state_dir))
+    os.chmod(tool, os.stat(tool).st_mode | stat.S_IXUSR)
+    for name in TOOL_NAMES:
+        os.symlink(tool, os.path.join(bin_dir, name))
+    return bin_dir
+
+
+def reset_state(bin_dir: str) -> None:
+    """Очищает правила и наборы поддельного межсетевого экрана."""
+    state_dir = os.path.join(os.path.dirname(bin_dir), "state")
+    for name in os.listdir(state_dir):
+        os.remove(os.path.join(state_dir, name))
+
+
+def count_entries(bin_dir: str) -> int:
+    """Возвращает количество правил и записей наборов поддельного межсетевого экрана."""
+    state_dir = os.path.join(os.path.dirname(bin_dir), "state")
+    total = 0
+    for name in os.listdir(state_dir):
+        with open(os.path.join(state_dir, name)) as f:
+            total += sum(1 for line in f if line.strip())
+    return total
+
+
+def run_command(command: List[str], log_errors: bool = True, input: Optional[str] = None) -> Tuple[bool, str]:
+    """Выполняет команду (как utils.system_commands.execute_command, без sudo)."""
+    result = subprocess.run(command, input=input, capture_output=True, text=True, check=False)
+    if result.returncode != 0 and log_errors:
+        logging.error(f"{' '.join(command[:2])}: {result.stderr.strip()}")
+    return result.returncode == 0, result.stdout.strip()
+
+
+def make_ips(count: int) -> List[str]:
+    """Возвращает count различных адресов IPv4 из 10.0.0.0/8."""
+    return [f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}" for i in range(1, count + 1)]
+
+
+def create(name: str, bin_dir: str) -> FirewallBackend:
+    return create_backend(
+        name, run_command,
+        iptables=os.path.join(bin_dir, "iptables"),
+        ip6tables=os.path.join(bin_dir, "ip6tables"),
+        ipset=os.path.join(bin_dir, "ipset"),
+    )
+
+
+def run_backend(name: str, bin_dir: str, args) -> Dict[str, Any]:
+    """
+    Измеряет блокировку и разблокировку для одного механизма.
+
+    Args:
+        name: ipset или iptables
+        bin_dir: Каталог с поддельными утилитами
+        args: Аргументы командной строки
+
+    Returns:
+        Результаты (секунды)
+    """
+    ips = make_ips(args.ips)
+    results: Dict[str, Any] = {"ips": args.ips}
+
+    # По одному адресу - на выборке
+    reset_state(bin_dir)
+    backend = create(name, bin_dir)
+    backend.setup()
+    sample = ips[:args.per_ip_sample]
+    if sample:
+        start = time.perf_counter()
+        for ip in sample:
+            backend.block(ip, 3600, "bench")
+        block_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for ip in sample:
+            backend.unblock(ip)
+        unblock_time = time.perf_counter() - start
+
+        scale = args.ips / len(sample)
+        results["per_ip"] = {
+            "sample": len(sample),
+            "block_s": block_time * scale,
+            "unblock_s": unblock_time * scale,
+        }
+
+    # Весь список одной транзакцией
+    reset_state(bin_dir)
+    backend = create(name, bin_dir)
+    backend.setup()
+    baseline = count_entries(bin_dir)
+
+    start = time.perf_counter()
+    blocked = backend.block_many(ips, 3600, "bench")
+    block_time = time.perf_counter() - start
+    entries = count_entries(bin_dir) - baseline
+    spot_check = backend.is_blocked(ips[-1])
+
+    start = time.perf_counter()
+    unblocked = backend.unblock_many(ips)
+    unblock_time = time.perf_counter() - start
+    remaining = count_entries(bin_dir) - baseline
+
+    results["batch"] = {
+        "block_s": block_time,
+        "unblock_s": unblock_time,
+        "ok": bool(blocked and unblocked and entries == args.ips and spot_check and remaining == 0),
+        "entries_after_block": entries,
+        "entries_after_unblock": remaining,
+    }
+    return results
+
+
+def print_results(name: str, results: Dict[str, Any]) -> None:
+    print(f"\n== {name} ({results['ips']} адресов) ==")
+    per_ip = results.get("per_ip")
+    batch = results["batch"]
+    if per_ip:
+        print(f"  по одному (выборка {per_ip['sample']}, пересчет): "
+              f"блокировка {per_ip['block_s']:9.2f} с, разблокировка {per_ip['unblock_s']:9.2f} с")
+    print(f"  block_many/unblock_many:                "
+          f"блокировка {batch['block_s']:9.3f} с, разблокировка {batch['unblock_s']:9.3f} с")
+    if per_ip:
+        print(f"  ускорение блокировки: x{per_ip['block_s'] / batch['block_s']:.0f}")
+    print(f"  проверка состояния: {'OK' if batch['ok'] else 'ОШИБКА'} "
+          f"(записей после блокировки {batch['entries_after_block']}, "
+          f"после разблокировки {batch['entries_after_unblock']})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк блокировки списка IP-адресов")
+    parser.add_argument("--ips", type=int, default=10000, help="Количество блокируемых адресов")
+    parser.add_argument("--per-ip-sample", type=int, default=100,
+                        help="Количество адресов для измерения блокировки по одному (0 - не измерять)")
+    parser.add_argument("--backends", nargs="+", choices=("ipset", "iptables"), default=["ipset", "iptables"],
+                        help="Механизмы блокировки")
+    parser.add_argument("--output", help="Файл для результатов в JSON")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format="%(levelname)s - %(message)s")
+
+    all_results = {}
+    with tempfile.TemporaryDirectory(prefix="hids-bench-fw-") as workdir:
+        bin_dir = install_fake_tools(workdir)
+        for name in args.backends:
+            all_results[name] = run_backend(name, bin_dir, args)
+            print_results(name, all_results[name])
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(all_results, f, indent=2)
+
+    if not all(result["batch"]["ok"] for result in all_results.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
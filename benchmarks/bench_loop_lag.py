@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Бенчмарк задержки событийного цикла при одновременных запросах к базе.
+
+Имитирует поток команд /alerts и /alert_detail от нескольких чатов: каждый
+"чат" в цикле выполняет get_recent_incidents и get_incidents_by_ip.
+Одновременно LoopLagMonitor измеряет, насколько цикл не успевает
+обслуживать остальные задачи (слушатель HIDS, поллинг Telegram).
+
+Сравниваются два режима:
+    sync  - синхронные вызовы DatabaseManager прямо в событийном цикле
+    async - вызовы через AsyncDatabaseManager (пул потоков)
+
+Примеры:
+    python benchmarks/bench_loop_lag.py
+    python benchmarks/bench_loop_lag.py --rows 500000 --chats 50 --duration 10
+"""
+
+import os
+import sys
+import time
+import asyncio
+import logging
+import argparse
+import tempfile
+from typing import Any, Dict
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+
+sys.path.insert(0, os.path.join(ROOT_DIR, "hids_bot"))
+
+from database.db_manager import DatabaseManager  # noqa: E402
+from database.async_db import AsyncDatabaseManager  # noqa: E402
+from utils.metrics import LoopLagMonitor  # noqa: E402
+
+
+def populate(db: DatabaseManager, rows: int, ips: int) -> None:
+    """Заполняет базу тестовыми инцидентами."""
+    for idx in range(rows):
+        db.add_incident(f"203.0.{idx % ips // 250}.{idx % 250}", "Неудачная попытка входа: пользователь root")
+    db.flush()
+
+
+async def run_mode(mode: str, db: DatabaseManager, args) -> Dict[str, Any]:
+    """
+    Выполняет запросы от нескольких чатов в заданном режиме.
+
+    Args:
+        mode: "sync" или "async"
+        db: Объект для работы с базой данных
+        args: Аргументы командной строки
+
+    Returns:
+        Задержка цикла и количество выполненных запросов
+    """
+    async_db = AsyncDatabaseManager(db, threads=args.threads) if mode == "async" else None
+    monitor = LoopLagMonitor(interval=0.01)
+    await monitor.start()
+
+    queries = 0
+    deadline = time.monotonic() + args.duration
+
+    async def chat(idx: int) -> None:
+        nonlocal queries
+        ip = f"203.0.0.{idx % 250}"
+        while time.monotonic() < deadline:
+            if async_db:
+                await async_db.get_recent_incidents(10)
+                await async_db.get_incidents_by_ip(ip)
+            else:
+                db.get_recent_incidents(10)
+                db.get_incidents_by_ip(ip)
+                # Обработчик aiogram возвращает управление циклу после каждой команды
+                await asyncio.sleep(0)
+            queries += 2
+
+    await asyncio.gather(*(chat(idx) for idx in range(args.chats)))
+    await monitor.stop()
+
+    return {"lag": monitor.snapshot(), "queries_per_sec": queries / args.duration}
+
+
+def _ms(seconds: float) -> str:
+    return f"{seconds * 1000:.2f} мс"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Задержка событийного цикла при запросах к базе")
+    parser.add_argument("--rows", type=int, default=200000, help="Количество инцидентов в базе")
+    parser.add_argument("--ips", type=int, default=2000, help="Количество различных IP")
+    parser.add_argument("--chats", type=int, default=20, help="Количество одновременных чатов")
+    parser.add_argument("--threads", type=int, default=4, help="Потоков AsyncDatabaseManager")
+    parser.add_argument("--duration", type=float, default=5.0, help="Длительность каждого режима, с")
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+
+    with tempfile.TemporaryDirectory(prefix="hids-bench-lag-") as workdir:
+        db = DatabaseManager(os.path.join(workdir, "hids.db"))
+        populate(db, args.rows, args.ips)
+        try:
+            for mode in ("sync", "async"):
+                result = asyncio.run(run_mode(mode, db, args))
+                lag = result["lag"]
+                print(f"[{mode}] {result['queries_per_sec']:.0f} запросов/с; задержка цикла: "
+                      f"p50 {_ms(lag['p50'])}, p99 {_ms(lag['p99'])}, макс. {_ms(lag['max'])}")
+        finally:
+            db.close()
+
+
+if __name__ == "__main__":
+    main()
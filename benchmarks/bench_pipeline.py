@@ -0,0 +1,501 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Сквозной бенчмарк конвейера уведомлений бота HIDS.
+
+Компоненты из bot.main() (слушатель сокета, очередь, база данных, спул,
+объединение уведомлений, исходящая очередь Telegram) запускаются против
+локальной заглушки Bot API (benchmarks/telegram_stub.py), уведомления
+передаются через UNIX-сокет.
+
+Каждый этап конвейера измеряется в отдельном дочернем процессе, поэтому
+процессорное время и пиковая память (RSS) относятся только к нему:
+
+    ingest - сокет и очередь (без базы данных)
+    db     - сокет, очередь и запись инцидентов в базу данных
+    full   - весь конвейер с доставкой в заглушку Telegram
+
+Генератор нагрузки и заглушка работают в родительском процессе.
+Результаты можно сохранить в JSON (--output) для сравнения между коммитами.
+
+Примеры:
+    python benchmarks/bench_pipeline.py --alerts 20000
+    python benchmarks/bench_pipeline.py --stages full --latency 0.05 --error-rate 0.05
+    python benchmarks/bench_pipeline.py --output /tmp/pipeline-abc1234.json
+    python benchmarks/bench_pipeline.py --compare /tmp/pipeline-abc1234.json
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+from typing import Any, Dict, List, Optional
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+BOT_DIR = os.path.join(ROOT_DIR, "hids_bot")
+
+sys.path.insert(0, BOT_DIR)
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from test_hids_alert import random_alert, run_producer, send_command  # noqa: E402
+
+# Этапы конвейера
+STAGES = ("ingest", "db", "full")
+
+# ID чата, в который бот отправляет уведомления в бенчмарке
+BENCH_CHAT_ID = 1000
+
+
+# ---------------------------------------------------------------------------
+# Дочерний процесс: один этап конвейера
+# ---------------------------------------------------------------------------
+
+class _NullDatabase:
+    """База данных, не выполняющая запись (этап ingest)."""
+
+    db_path = ":memory:"
+
+    def add_incident(self, ip: str, reason: str, alert_type: Optional[str] = None, block: bool = True) -> None:
+        pass
+
+    def is_in_whitelist(self, ip: str) -> bool:
+        return False
+
+
+def _usage() -> Dict[str, float]:
+    """Процессорное время и пиковая память текущего процесса."""
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    # ru_maxrss: килобайты в Linux, байты в macOS
+    peak_rss = usage.ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+    return {"user": usage.ru_utime, "system": usage.ru_stime, "peak_rss": peak_rss}
+
+
+async def _child_main(args) -> None:
+    """Запускает компоненты этапа, ожидает команды stop и выводит метрики."""
+    import logging
+    logging.basicConfig(level=logging.WARNING, stream=sys.stderr)
+
+    # Параметры объединения читаются при импорте alert_handler
+    os.environ["ALERT_COALESCE_WINDOW"] = str(args.window)
+
+    from database.db_manager import DatabaseManager
+    from utils.alert_queue import AlertQueue
+    from hids_listener import HIDSListener
+    from utils.metrics import LoopLagMonitor
+
+    stage = args.child
+    db_manager = DatabaseManager(args.db) if stage != "ingest" else _NullDatabase()
+
+    callback = None
+    outbox = bot = alert_spool = None
+    sent_at: Dict[int, float] = {}
+    e2e: List[float] = []
+
+    if stage == "full":
+        from aiogram import Bot
+        from aiogram.client.default import DefaultBotProperties
+        from aiogram.client.session.aiohttp import AiohttpSession
+        from aiogram.client.telegram import TelegramAPIServer
+        from database.alert_spool import AlertSpool
+        from handlers.alert_handler import process_hids_alert, flush_pending_alerts, set_alert_spool
+        from utils.telegram_outbox import TelegramOutbox, OutboxMiddleware
+
+        session = AiohttpSession(api=TelegramAPIServer.from_base(args.stub_url))
+        outbox = TelegramOutbox(chat_rate=args.chat_rate, group_rate=args.chat_rate, global_rate=args.global_rate)
+        session.middleware(OutboxMiddleware(outbox))
+        await outbox.start()
+        bot = Bot(token="123456:BENCHMARK", session=session, default=DefaultBotProperties(parse_mode="HTML"))
+
+        alert_spool = AlertSpool(db_manager)
+        set_alert_spool(alert_spool)
+
+        # Сквозная задержка: от отправки генератором до доставки сообщения
+        append = alert_spool.append
+        mark_delivered = alert_spool.mark_delivered
+
+        async def timed_append(alert_info):
+            spool_id = await append(alert_info)
+            sent_at[spool_id] = alert_info.get("bench_ts", time.time())
+            return spool_id
+
+        def timed_mark_delivered(spool_ids):
+            now = time.time()
+            for spool_id in spool_ids:
+                ts = sent_at.pop(spool_id, None)
+                if ts is not None:
+                    e2e.append(now - ts)
+            mark_delivered(spool_ids)
+
+        alert_spool.append = timed_append
+        alert_spool.mark_delivered = timed_mark_delivered
+
+        async def callback(alert_info):
+            alert_info["spool_id"] = await alert_spool.append(alert_info)
+            await process_hids_alert(alert_info, bot, BENCH_CHAT_ID)
+
+    alert_queue = AlertQueue(db_manager=db_manager, callback=callback,
+                             maxsize=args.queue_size, workers=args.workers)
+    await alert_queue.start()
+    loop_monitor = LoopLagMonitor(interval=0.01)
+    await loop_monitor.start()
+    listener = HIDSListener(socket_path=args.socket, alert_queue=alert_queue, loop_monitor=loop_monitor)
+    await listener.start()
+
+    usage_start = _usage()
+    print(json.dumps({"ready": True}), flush=True)
+
+    # Ожидаем команду stop от родительского процесса
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, sys.stdin.readline)
+    started = time.monotonic()
+
+    delivery_time = None
+    if stage == "full":
+        # Дожидаемся доставки всех уведомлений
+        await flush_pending_alerts()
+        deadline = time.monotonic() + args.delivery_timeout
+        while sent_at and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        delivery_time = time.monotonic() - started
+
+    # Дожидаемся фиксации инцидентов, чтобы учесть задержку до записи в БД
+    if hasattr(db_manager, "flush"):
+        await loop.run_in_executor(None, db_manager.flush)
+
+    stats = listener.stats()
+    await loop_monitor.stop()
+    await listener.stop()
+    await alert_queue.stop()
+
+    if stage == "full":
+        await flush_pending_alerts()
+        await alert_spool.stop()
+        await outbox.stop()
+        await bot.session.close()
+
+    usage_end = _usage()
+    result: Dict[str, Any] = {
+        "listener": stats,
+        "cpu_user": usage_end["user"] - usage_start["user"],
+        "cpu_system": usage_end["system"] - usage_start["system"],
+        "peak_rss": usage_end["peak_rss"],
+    }
+    if stage == "full":
+        e2e.sort()
+        result["delivery_time"] = delivery_time
+        result["undelivered"] = len(sent_at)
+        result["outbox"] = outbox.stats()
+        result["spool"] = alert_spool.stats()
+        result["e2e_latency"] = _summary(e2e)
+
+    print(json.dumps({"result": result}), flush=True)
+
+
+# ---------------------------------------------------------------------------
+# Родительский процесс: генератор нагрузки и отчет
+# ---------------------------------------------------------------------------
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def _summary(values: List[float]) -> Dict[str, float]:
+    """Перцентили отсортированного списка задержек."""
+    return {
+        "count": len(values),
+        "mean": sum(values) / len(values) if values else 0.0,
+        "p50": _percentile(values, 50),
+        "p95": _percentile(values, 95),
+        "p99": _percentile(values, 99),
+        "max": values[-1] if values else 0.0,
+    }
+
+
+async def _read_json_line(stream) -> Dict[str, Any]:
+    """Читает из вывода дочернего процесса первую строку с JSON."""
+    while True:
+        line = await stream.readline()
+        if not line:
+            raise RuntimeError("Дочерний процесс завершился без результата")
+        try:
+            return json.loads(line)
+        except ValueError:
+            continue
+
+
+async def run_stage(stage: str, args, stub_url: Optional[str], workdir: str) -> Dict[str, Any]:
+    """
+    Измеряет один этап конвейера.
+
+    Args:
+        stage: Этап (ingest, db, full)
+        args: Аргументы командной строки
+        stub_url: Адрес заглушки Bot API (для этапа full)
+        workdir: Каталог для сокета и базы данных
+
+    Returns:
+        Результаты этапа
+    """
+    socket_path = os.path.join(workdir, f"{stage}.sock")
+    db_path = os.path.join(workdir, f"{stage}.db")
+
+    cmd = [
+        sys.executable, os.path.abspath(__file__), "--child", stage,
+        "--socket", socket_path, "--db", db_path,
+        "--queue-size", str(args.queue_size), "--workers", str(args.workers),
+        "--window", str(args.window), "--chat-rate", str(args.chat_rate),
+        "--global-rate", str(args.global_rate), "--delivery-timeout", str(args.delivery_timeout),
+    ]
+    if stub_url:
+        cmd += ["--stub-url", stub_url]
+
+    # Дочерний процесс запускается из каталога бота (как bot.py)
+    child = await asyncio.create_subprocess_exec(
+        *cmd, cwd=BOT_DIR, stdin=subprocess.PIPE, stdout=subprocess.PIPE
+    )
+    try:
+        await _read_json_line(child.stdout)
+
+        connections = max(1, args.connections)
+        rate = args.rate / connections if args.rate else 0
+        counts = [args.alerts // connections + (1 if idx < args.alerts % connections else 0)
+                  for idx in range(connections)]
+
+        def make_source(idx):
+            rng = random.Random(args.seed + idx)
+            ip_pool = [f"10.0.{i // 256}.{i % 256}" for i in range(1, args.ips + 1)]
+
+            def next_frame():
+                alert = random_alert(rng, ip_pool)
+                alert["bench_ts"] = time.time()
+                return json.dumps(alert).encode("utf-8") + b"\n"
+            return next_frame
+
+        produced = {"sent": 0, "errors": 0, "lag": []}
+        start = time.monotonic()
+        await asyncio.gather(*[
+            run_producer(socket_path, make_source(idx), counts[idx], rate, None, produced)
+            for idx in range(connections) if counts[idx]
+        ])
+        send_time = time.monotonic() - start
+
+        # Ожидаем записи всех уведомлений
+        while True:
+            stats = (await send_command(socket_path, "stats"))["stats"]
+            queue = stats["queue"]
+            if (queue["processed"] + queue["failed"] >= stats["received"]
+                    and stats["received"] + stats["invalid"] >= produced["sent"]):
+                break
+            if time.monotonic() - start > args.delivery_timeout + send_time:
+                break
+            await asyncio.sleep(0.02)
+        ingest_time = time.monotonic() - start
+
+        child.stdin.write(b"stop\n")
+        await child.stdin.drain()
+        result = (await _read_json_line(child.stdout))["result"]
+    finally:
+        if child.returncode is None:
+            try:
+                await asyncio.wait_for(child.wait(), timeout=args.delivery_timeout + 10)
+            except asyncio.TimeoutError:
+                child.kill()
+
+    queue = result["listener"]["queue"]
+    processed = queue["processed"]
+    cpu = result["cpu_user"] + result["cpu_system"]
+
+    report = {
+        "alerts": produced["sent"],
+        "send_errors": produced["errors"],
+        "send_time": send_time,
+        "ingest_time": ingest_time,
+        "throughput": processed / ingest_time if ingest_time else 0.0,
+        "processed": processed,
+        "failed": queue["failed"],
+        "max_queue_depth": queue["max_depth"],
+        "full_waits": queue["full_waits"],
+        "queue_wait": queue["wait_time"],
+        "commit_latency": queue["commit_latency"],
+        "db_time": queue["db_time"],
+        "db_writer": queue.get("db", {}),
+        "loop_lag": result["listener"].get("loop_lag", {}),
+        "cpu_user": result["cpu_user"],
+        "cpu_system": result["cpu_system"],
+        "cpu_per_alert_us": cpu / processed * 1e6 if processed else 0.0,
+        "peak_rss_mb": result["peak_rss"] / (1024 * 1024),
+    }
+    if stage == "full":
+        report.update({
+            "delivery_time": result["delivery_time"],
+            "undelivered": result["undelivered"],
+            "e2e_latency": result["e2e_latency"],
+            "outbox": result["outbox"],
+            "spool": result["spool"],
+        })
+    return report
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _ms(seconds: float) -> str:
+    return f"{seconds * 1000:.2f} мс"
+
+
+def print_report(stage: str, report: Dict[str, Any]) -> None:
+    """Выводит результаты этапа."""
+    print(f"[{stage}]")
+    print(f"  Уведомлений: {report['alerts']}, ошибок отправки: {report['send_errors']}, "
+          f"ошибок обработки: {report['failed']}")
+    print(f"  Пропускная способность: {report['throughput']:.0f} уведомлений/с")
+    commit = report["commit_latency"]
+    print(f"  Получение -> запись в БД: p50 {_ms(commit['p50'])}, p95 {_ms(commit['p95'])}, "
+          f"p99 {_ms(commit['p99'])}")
+    db_time = report["db_time"]
+    print(f"  Запись в БД (вызов): p50 {_ms(db_time['p50'])}, p99 {_ms(db_time['p99'])}")
+    writer = report["db_writer"]
+    if writer:
+        commit_time = writer["commit_time"]
+        print(f"  Фиксация пакета: {writer['batches']} пакетов, в среднем {writer['avg_batch']:.1f} инцидентов, "
+              f"p50 {_ms(commit_time['p50'])}, p99 {_ms(commit_time['p99'])}")
+    lag = report.get("loop_lag")
+    if lag:
+        print(f"  Задержка событийного цикла: p50 {_ms(lag['p50'])}, p99 {_ms(lag['p99'])}, "
+              f"макс. {_ms(lag['max'])}")
+    print(f"  CPU: {report['cpu_user'] + report['cpu_system']:.2f} с "
+          f"({report['cpu_per_alert_us']:.1f} мкс на уведомление), пиковый RSS: {report['peak_rss_mb']:.1f} МБ")
+    if stage == "full":
+        e2e = report["e2e_latency"]
+        outbox = report["outbox"]
+        print(f"  Доставлено за {report['delivery_time']:.2f} с, не доставлено: {report['undelivered']}")
+        print(f"  Сквозная задержка: p50 {_ms(e2e['p50'])}, p95 {_ms(e2e['p95'])}, "
+              f"p99 {_ms(e2e['p99'])}, макс. {_ms(e2e['max'])}")
+        print(f"  Сообщений: {outbox['sent']}, повторов (429): {outbox['retried']}, ошибок: {outbox['failed']}")
+
+
+def compare(current: Dict[str, Any], baseline_path: str) -> None:
+    """Выводит изменение основных метрик относительно сохраненного результата."""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+
+    print(f"\nСравнение с {baseline_path} (коммит {baseline.get('commit')}):")
+    metrics = (
+        ("throughput", lambda r: r["throughput"], "уведомлений/с"),
+        ("commit p99", lambda r: r["commit_latency"]["p99"] * 1000, "мс"),
+        ("cpu/alert", lambda r: r["cpu_per_alert_us"], "мкс"),
+        ("peak RSS", lambda r: r["peak_rss_mb"], "МБ"),
+    )
+    for stage, report in current["stages"].items():
+        old = baseline.get("stages", {}).get(stage)
+        if not old:
+            continue
+        parts = []
+        for name, get, unit in metrics:
+            new_value, old_value = get(report), get(old)
+            change = (new_value - old_value) / old_value * 100 if old_value else 0.0
+            parts.append(f"{name} {old_value:.2f} -> {new_value:.2f} {unit} ({change:+.1f}%)")
+        print(f"  [{stage}] " + "; ".join(parts))
+
+
+async def _main(args) -> Dict[str, Any]:
+    stages = [stage.strip() for stage in args.stages.split(",") if stage.strip()]
+    for stage in stages:
+        if stage not in STAGES:
+            raise SystemExit(f"Неизвестный этап: {stage} (доступны: {', '.join(STAGES)})")
+
+    stub = None
+    stub_url = None
+    if "full" in stages:
+        from telegram_stub import TelegramStub
+        stub = TelegramStub(latency=args.latency, error_rate=args.error_rate,
+                            enforce_limits=args.stub_limits)
+        stub_url = await stub.start(port=args.stub_port)
+
+    results: Dict[str, Any] = {
+        "commit": _git_commit(),
+        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": {key: value for key, value in vars(args).items()
+                   if key not in ("child", "output", "compare")},
+        "stages": {},
+    }
+
+    try:
+        with tempfile.TemporaryDirectory(prefix="hids-bench-") as workdir:
+            for stage in stages:
+                report = await run_stage(stage, args, stub_url, workdir)
+                results["stages"][stage] = report
+                print_report(stage, report)
+    finally:
+        if stub:
+            results["stub"] = stub.stats()
+            await stub.stop()
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сквозной бенчмарк конвейера уведомлений HIDS")
+    parser.add_argument("--stages", default=",".join(STAGES), help="Этапы через запятую (ingest,db,full)")
+    parser.add_argument("--alerts", type=int, default=10000, help="Количество уведомлений на этап")
+    parser.add_argument("--connections", type=int, default=4, help="Количество соединений генератора")
+    parser.add_argument("--rate", type=float, default=0, help="Скорость генератора, уведомлений/с (0 - максимальная)")
+    parser.add_argument("--ips", type=int, default=50, help="Количество различных IP")
+    parser.add_argument("--seed", type=int, default=0, help="Начальное значение генератора")
+    parser.add_argument("--queue-size", type=int, default=1000, help="Размер очереди уведомлений")
+    parser.add_argument("--workers", type=int, default=4, help="Количество обработчиков очереди")
+    parser.add_argument("--window", type=float, default=1.0, help="Окно объединения уведомлений в секундах")
+    parser.add_argument("--chat-rate", type=float, default=30.0, help="Скорость отправки в чат, сообщений/с")
+    parser.add_argument("--global-rate", type=float, default=30.0, help="Общая скорость отправки, сообщений/с")
+    parser.add_argument("--latency", type=float, default=0.0, help="Задержка ответа заглушки в секундах")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Доля ответов 429 заглушки (0-1)")
+    parser.add_argument("--stub-limits", action="store_true", help="Заглушка проверяет ограничения Telegram")
+    parser.add_argument("--stub-port", type=int, default=8081, help="Порт заглушки")
+    parser.add_argument("--delivery-timeout", type=float, default=120.0,
+                        help="Максимальное время ожидания доставки в секундах")
+    parser.add_argument("--output", help="Файл для результатов в JSON")
+    parser.add_argument("--compare", help="Сравнить с сохраненным результатом")
+
+    # Параметры дочернего процесса
+    parser.add_argument("--child", choices=STAGES, help=argparse.SUPPRESS)
+    parser.add_argument("--socket", help=argparse.SUPPRESS)
+    parser.add_argument("--db", help=argparse.SUPPRESS)
+    parser.add_argument("--stub-url", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        asyncio.run(_child_main(args))
+        return
+
+    results = asyncio.run(_main(args))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\nРезультаты сохранены: {args.output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
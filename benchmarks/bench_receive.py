@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Бенчмарк пути приема уведомлений: чтение из сокета с копированием
+(recv + конкатенация) против чтения в заранее выделенный буфер
+(recv_into + FrameDecoder).
+
+Пример:
+    python benchmarks/bench_receive.py --alerts 200000
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import threading
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "hids_bot"))
+
+from utils.frame_decoder import FrameDecoder  # noqa: E402
+
+
+def build_payload(count):
+    """Формирует поток из count уведомлений."""
+    frames = []
+    for idx in range(count):
+        alert = {
+            "ip": f"203.0.113.{idx % 256}",
+            "reason": f"Неудачная попытка входа: пользователь=user{idx % 97}, IP=203.0.113.{idx % 256}",
+            "timestamp": "2024-01-01 12:00:00",
+        }
+        frames.append(json.dumps(alert).encode("utf-8") + b"\n")
+    return b"".join(frames)
+
+
+def receive_copying(sock):
+    """Прежний путь: новый bytes на каждый recv, конкатенация и копия кадра."""
+    buffer = b""
+    count = 0
+    while True:
+        chunk = sock.recv(4096)
+        if not chunk:
+            break
+        buffer += chunk
+        start = 0
+        while True:
+            end = buffer.find(b"\n", start)
+            if end == -1:
+                break
+            frame = bytes(buffer[start:end])
+            json.loads(frame.decode("utf-8"))
+            count += 1
+            start = end + 1
+        buffer = buffer[start:]
+    return count
+
+
+def receive_into_buffer(sock):
+    """Новый путь: recv_into в буфер FrameDecoder и разбор из memoryview."""
+    decoder = FrameDecoder()
+    count = 0
+    while True:
+        nbytes = sock.recv_into(decoder.get_buffer())
+        if not nbytes:
+            break
+        for frame in decoder.buffer_updated(nbytes):
+            json.loads(str(frame, "utf-8"))
+            count += 1
+    return count
+
+
+def run(receiver, payload, trace):
+    """Запускает один прогон и возвращает (уведомлений, сек. CPU, сек., пик памяти)."""
+    reader, writer = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+
+    def produce():
+        writer.sendall(payload)
+        writer.close()
+
+    producer = threading.Thread(target=produce)
+
+    if trace:
+        tracemalloc.start()
+    started = time.perf_counter()
+    cpu_started = time.thread_time()
+
+    producer.start()
+    count = receiver(reader)
+
+    cpu = time.thread_time() - cpu_started
+    elapsed = time.perf_counter() - started
+    peak = 0
+    if trace:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    producer.join()
+    reader.close()
+    return count, cpu, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк пути приема уведомлений HIDS")
+    parser.add_argument("--alerts", type=int, default=100000, help="Количество уведомлений")
+    parser.add_argument("--repeat", type=int, default=3, help="Количество повторов (берется лучший)")
+    args = parser.parse_args()
+
+    payload = build_payload(args.alerts)
+
+    for name, receiver in (("recv + конкатенация", receive_copying),
+                           ("recv_into + FrameDecoder", receive_into_buffer)):
+        best = min((run(receiver, payload, trace=False) for _ in range(args.repeat)), key=lambda r: r[1])
+        _, _, _, peak = run(receiver, payload, trace=True)
+        count, cpu, elapsed, _ = best
+        print(f"{name}:")
+        print(f"  уведомлений: {count}, {count / elapsed:,.0f} в секунду")
+        print(f"  CPU: {cpu * 1e6 / count:.2f} мкс на уведомление")
+        print(f"  пик выделенной памяти (включая буфер соединения): {peak / 1024:.0f} КБ")
+
+
+if __name__ == "__main__":
+    main()
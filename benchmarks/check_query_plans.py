@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Проверка планов частых запросов DatabaseManager.
+
+Скрипт вызывает методы DatabaseManager, которые выполняются при каждом
+уведомлении или команде бота, перехватывает выполненные SQL-запросы
+(set_trace_callback) и проверяет их планы через EXPLAIN QUERY PLAN.
+Запрос считается ошибочным, если он полностью просматривает таблицу
+(SCAN без индекса) или сортирует результат во временном B-дереве.
+
+Код возврата 1, если хотя бы один запрос не использует индекс, - проверку
+можно запускать в CI после изменения схемы или запросов.
+
+Примеры:
+    python benchmarks/check_query_plans.py
+    python benchmarks/check_query_plans.py --db hids_bot/hids.db
+"""
+
+import os
+import re
+import sys
+import time
+import shutil
+import itertools
+import logging
+import argparse
+import tempfile
+from typing import Callable, Dict, List, Tuple
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+
+sys.path.insert(0, os.path.join(ROOT_DIR, "hids_bot"))
+
+from database.db_manager import DatabaseManager  # noqa: E402
+
+# Запросы, план которых проверяется
+_CHECKED_PREFIXES = ("SELECT", "INSERT", "UPDATE", "DELETE")
+
+# Признаки полного просмотра таблицы или сортировки без индекса
+_FULL_SCAN = re.compile(r"^SCAN (TABLE )?(\w+)(?!.*\bUSING\b)")
+_TEMP_SORT = re.compile(r"USE TEMP B-TREE FOR ORDER BY")
+
+
+def hot_queries(db: DatabaseManager) -> Dict[str, Callable[[], object]]:
+    """
+    Возвращает частые операции DatabaseManager.
+
+    Args:
+        db: Объект для работы с базой данных
+
+    Returns:
+        Словарь {название: функция}
+    """
+    return {
+        "get_recent_incidents": lambda: db.get_recent_incidents(10),
+        "get_incidents_by_ip": lambda: db.get_incidents_by_ip("203.0.113.7"),
+        "get_incidents_page": lambda: db.get_incidents_page(None, 11),
+        "get_incidents_page (older)": lambda: db.get_incidents_page(None, 11, before=(1893456000, 1)),
+        "get_incidents_page (ip, older)": lambda: db.get_incidents_page(
+            "203.0.113.7", 11, before=(1893456000, 1)),
+        "get_incidents_page (ip, newer)": lambda: db.get_incidents_page(
+            "203.0.113.7", 11, after=(946684800, 1)),
+        "get_incidents_in_network": lambda: db.get_incidents_in_network(
+            "203.0.113.0/24", since=time.time() - 3600),
+        "add_to_blocked": lambda: db.add_to_blocked("203.0.113.8", "проверка плана"),
+        "remove_from_blocked": lambda: db.remove_from_blocked("203.0.113.8"),
+        "get_ban_expiry": lambda: db.get_ban_expiry("203.0.113.8"),
+        "get_next_ban_expiry": lambda: db.get_next_ban_expiry(),
+        "pop_expired_bans": lambda: db.pop_expired_bans(0, 100),
+        "is_in_whitelist": lambda: db.is_in_whitelist("198.51.100.1"),
+        "remove_from_whitelist": lambda: db.remove_from_whitelist("198.51.100.2"),
+        "get_incident_rollups": lambda: db.get_incident_rollups(10, 1893456000),
+        "get_ip_rollup_summary": lambda: db.get_ip_rollup_summary("203.0.113.7"),
+        "get_stats": lambda: db.get_stats(time.time() - 7 * 86400),
+        "get_ip_stats": lambda: db.get_ip_stats("203.0.113.7"),
+        "iter_table": lambda: list(itertools.islice(db.iter_table("incidents", 100), 150)),
+        "get_spool_max_id": db.get_spool_max_id,
+        "get_spool_pending": lambda: db.get_spool_pending(0, 100),
+        # Переносят несколько строк в агрегаты - выполняются последними
+        "rollup_incidents": lambda: db.rollup_incidents(4102444800, 10),
+        "rollup_hourly": lambda: db.rollup_hourly(4102444800, 10),
+        "prune_stats": lambda: db.prune_stats(946684800, 10),
+        "prune_stats_ip": lambda: db.prune_stats_ip(946684800, None, 10),
+    }
+
+
+def trace_queries(db: DatabaseManager, func: Callable[[], object]) -> List[str]:
+    """
+    Выполняет операцию и возвращает выполненные ею SQL-запросы.
+
+    Args:
+        db: Объект для работы с базой данных
+        func: Операция
+
+    Returns:
+        Список SQL-запросов, план которых нужно проверить
+    """
+    statements: List[str] = []
+    connections = {db._writer, db._get_connection()}
+    for conn in connections:
+        conn.set_trace_callback(statements.append)
+    try:
+        func()
+    finally:
+        for conn in connections:
+            conn.set_trace_callback(None)
+    return [sql.strip() for sql in statements if sql.lstrip().upper().startswith(_CHECKED_PREFIXES)]
+
+
+def explain(db: DatabaseManager, sql: str) -> List[str]:
+    """
+    Возвращает план запроса.
+
+    Args:
+        db: Объект для работы с базой данных
+        sql: SQL-запрос (с подставленными значениями или параметрами "?")
+
+    Returns:
+        Строки плана запроса
+    """
+    params = (None,) * sql.count("?")
+    # Через соединение записи: в нем созданы временные таблицы
+    with db._write() as cursor:
+        cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+        return [row[3] for row in cursor.fetchall()]
+
+
+def check(db: DatabaseManager) -> List[Tuple[str, str, List[str]]]:
+    """
+    Проверяет планы всех частых запросов.
+
+    Args:
+        db: Объект для работы с базой данных
+
+    Returns:
+        Список нарушений (операция, запрос, план)
+    """
+    failures = []
+    for name, func in hot_queries(db).items():
+        for sql in trace_queries(db, func):
+            plan = explain(db, sql)
+            bad = any(_FULL_SCAN.search(line) or _TEMP_SORT.search(line) for line in plan)
+            print(f"{'FAIL' if bad else 'ok  '} {name}: {' '.join(sql.split())}")
+            for line in plan:
+                print(f"       {line}")
+            if bad:
+                failures.append((name, sql, plan))
+    return failures
+
+
+def populate(db: DatabaseManager, rows: int) -> None:
+    """Заполняет базу тестовыми данными."""
+    for idx in range(rows):
+        db.add_incident(f"203.0.113.{idx % 250}", "Неудачная попытка входа")
+    db.flush()
+    db.add_to_whitelist("198.51.100.1")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Проверка планов частых запросов DatabaseManager")
+    parser.add_argument("--db", help="Проверить копию существующей базы данных (после миграции)")
+    parser.add_argument("--rows", type=int, default=1000, help="Количество тестовых инцидентов")
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+
+    with tempfile.TemporaryDirectory(prefix="hids-query-plans-") as workdir:
+        db_path = os.path.join(workdir, "hids.db")
+        if args.db:
+            shutil.copyfile(args.db, db_path)
+
+        db = DatabaseManager(db_path)
+        try:
+            if not args.db:
+                populate(db, args.rows)
+            failures = check(db)
+        finally:
+            db.close()
+
+    if failures:
+        print(f"\nЗапросов без индекса: {len(failures)}")
+        sys.exit(1)
+    print("\nВсе частые запросы используют индексы")
+
+
+if __name__ == "__main__":
+    main()
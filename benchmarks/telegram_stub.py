@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Локальная заглушка Telegram Bot API для проверки и нагрузочного
+тестирования бота HIDS.
+
+Заглушка отвечает на методы, которые использует бот (getMe, sendMessage,
+editMessageText, sendDocument, getUpdates и т.д.), может добавлять задержку
+ответа и возвращать 429 (Too Many Requests) - случайно или при превышении
+ограничений Telegram (1 сообщение/с на чат, 30 сообщений/с всего).
+
+Запуск:
+    python benchmarks/telegram_stub.py --port 8081 --latency 0.05 --error-rate 0.05
+
+Бот подключается к заглушке через переменную окружения:
+    TELEGRAM_API_URL=http://127.0.0.1:8081
+"""
+
+import time
+import json
+import random
+import asyncio
+import argparse
+from collections import defaultdict, deque
+from typing import Any, Dict
+
+from aiohttp import web
+
+# Методы, для которых заглушка проверяет ограничения скорости
+SEND_METHODS = {"sendmessage", "editmessagetext", "senddocument", "editmessagereplymarkup"}
+
+
+class TelegramStub:
+    """
+    Заглушка Bot API на aiohttp.
+
+    Атрибуты:
+        latency: Задержка ответа в секундах
+        error_rate: Доля запросов отправки, на которые возвращается 429
+        retry_after: Значение retry_after в ответах 429
+        enforce_limits: Возвращать 429 при превышении ограничений Telegram
+    """
+
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0, retry_after: int = 1,
+                 enforce_limits: bool = True):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.enforce_limits = enforce_limits
+
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.rate_limited = 0
+        self.messages = []
+        self._message_id = 0
+        self._chat_sends = defaultdict(deque)
+        self._global_sends = deque()
+        self._runner = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8081) -> str:
+        """
+        Запускает заглушку.
+
+        Returns:
+            Базовый URL для TELEGRAM_API_URL
+        """
+        app = web.Application()
+        app.router.add_route("*", "/bot{token}/{method}", self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        return f"http://{host}:{port}"
+
+    async def stop(self) -> None:
+        """Останавливает заглушку."""
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Возвращает количество вызовов по методам и число ответов 429."""
+        return {"calls": dict(self.calls), "rate_limited": self.rate_limited,
+                "messages": len(self.messages)}
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"].lower()
+        params = await self._read_params(request)
+        self.calls[method] += 1
+
+        if method == "getupdates":
+            # Long polling: ждем и возвращаем пустой список
+            await asyncio.sleep(min(float(params.get("timeout", 1) or 1), 1.0))
+            return self._ok([])
+
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if method in SEND_METHODS and self._is_rate_limited(params.get("chat_id")):
+            self.rate_limited += 1
+            return web.json_response({
+                "ok": False,
+                "error_code": 429,
+                "description": f"Too Many Requests: retry after {self.retry_after}",
+                "parameters": {"retry_after": self.retry_after},
+            }, status=429)
+
+        if method == "getme":
+            return self._ok({"id": 1, "is_bot": True, "first_name": "HIDS stub", "username": "hids_stub_bot"})
+        if method in ("sendmessage", "editmessagetext", "senddocument"):
+            return self._ok(self._message(method, params))
+        if method in ("deletewebhook", "editmessagereplymarkup", "answercallbackquery", "setmycommands"):
+            return self._ok(True)
+
+        return self._ok(True)
+
+    @staticmethod
+    async def _read_params(request: web.Request) -> Dict[str, Any]:
+        if request.content_type == "application/json":
+            return await request.json()
+        data = await request.post()
+        return {key: value for key, value in data.items() if isinstance(value, str)}
+
+    def _is_rate_limited(self, chat_id) -> bool:
+        if self.error_rate and random.random() < self.error_rate:
+            return True
+        if not self.enforce_limits:
+            return False
+
+        now = time.monotonic()
+        chat_window = self._chat_sends[chat_id]
+        while chat_window and now - chat_window[0] > 1.0:
+            chat_window.popleft()
+        while self._global_sends and now - self._global_sends[0] > 1.0:
+            self._global_sends.popleft()
+
+        # Небольшой запас на неточность таймеров клиента
+        if len(chat_window) >= 2 or len(self._global_sends) >= 30:
+            return True
+
+        chat_window.append(now)
+        self._global_sends.append(now)
+        return False
+
+    def _message(self, method: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        chat_id = int(params.get("chat_id", 0) or 0)
+        if method == "editmessagetext":
+            message_id = int(params.get("message_id", 0) or 0)
+        else:
+            self._message_id += 1
+            message_id = self._message_id
+        self.messages.append((time.time(), method, chat_id, message_id))
+        return {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "group" if chat_id < 0 else "private"},
+            "text": params.get("text", ""),
+        }
+
+    @staticmethod
+    def _ok(result: Any) -> web.Response:
+        return web.Response(text=json.dumps({"ok": True, "result": result}), content_type="application/json")
+
+
+async def _serve(args) -> None:
+    stub = TelegramStub(latency=args.latency, error_rate=args.error_rate,
+                        retry_after=args.retry_after, enforce_limits=not args.no_limits)
+    url = await stub.start(args.host, args.port)
+    print(f"Заглушка Bot API запущена: {url}")
+    try:
+        while True:
+            await asyncio.sleep(10)
+            print(json.dumps(stub.stats(), ensure_ascii=False))
+    finally:
+        await stub.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Локальная заглушка Telegram Bot API")
+    parser.add_argument("--host", default="127.0.0.1", help="Адрес для прослушивания")
+    parser.add_argument("--port", type=int, default=8081, help="Порт для прослушивания")
+    parser.add_argument("--latency", type=float, default=0.0, help="Задержка ответа в секундах")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Доля ответов 429 (0-1)")
+    parser.add_argument("--retry-after", type=int, default=1, help="retry_after в ответах 429")
+    parser.add_argument("--no-limits", action="store_true", help="Не проверять ограничения скорости Telegram")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(_serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -13,15 +13,34 @@ from aiogram.filters import Command
 from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.client.session.aiohttp import AiohttpSession
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.telegram import TelegramAPIServer
 from dotenv import load_dotenv
 
-from utils.system_commands import block_ip, unblock_ip, check_hids_status, is_ip_blocked
+from utils.system_commands import (
+    block_ip, unblock_ip, unblock_ips, check_hids_status, is_ip_blocked, get_firewall, reconcile_firewall
+)
+from utils.ban_scheduler import BanScheduler
+from utils.auto_ban import AutoBanEngine, load_policy, DEFAULT_CONFIG_PATH
 from utils.ip_validator import is_valid_ip
 from database.db_manager import DatabaseManager
+from database.async_db import AsyncDatabaseManager, DEFAULT_DB_THREADS
+from database.retention import (
+    IncidentRetention, DEFAULT_RAW_DAYS, DEFAULT_HOURLY_DAYS, DEFAULT_RETENTION_INTERVAL
+)
+from database.alert_spool import AlertSpool, DEFAULT_REPLAY_INTERVAL
 from handlers.auth_handler import authorized_only, AUTHORIZED_USERS, router as auth_router
-from handlers.alert_handler import router as alert_router, process_hids_alert
+from handlers.alert_handler import (
+    router as alert_router, process_hids_alert, flush_pending_alerts, set_alert_spool,
+    set_ban_scheduler, apply_auto_bans
+)
 from handlers.system_handler import router as system_router
 from hids_listener import HIDSListener
+from utils.alert_queue import AlertQueue, DEFAULT_QUEUE_SIZE, DEFAULT_WORKERS
+from utils.metrics import LoopLagMonitor, format_latency
+from utils.telegram_outbox import (
+    TelegramOutbox, OutboxMiddleware,
+    DEFAULT_CHAT_RATE, DEFAULT_GROUP_RATE, DEFAULT_GLOBAL_RATE
+)
 
 # Загрузка переменных окружения
 load_dotenv()
@@ -51,22 +70,71 @@ if not ADMIN_CHAT_ID:
 # Путь к UNIX-сокету HIDS
 HIDS_SOCKET = os.getenv("HIDS_SOCKET", "/var/run/hids/alert.sock")
 
+# Размер очереди уведомлений и количество обработчиков
+ALERT_QUEUE_SIZE = int(os.getenv("ALERT_QUEUE_SIZE", DEFAULT_QUEUE_SIZE))
+ALERT_WORKERS = int(os.getenv("ALERT_WORKERS", DEFAULT_WORKERS))
+
+# Ограничения скорости отправки сообщений (сообщений в секунду)
+OUTBOX_CHAT_RATE = float(os.getenv("OUTBOX_CHAT_RATE", DEFAULT_CHAT_RATE))
+OUTBOX_GROUP_RATE = float(os.getenv("OUTBOX_GROUP_RATE", DEFAULT_GROUP_RATE))
+OUTBOX_GLOBAL_RATE = float(os.getenv("OUTBOX_GLOBAL_RATE", DEFAULT_GLOBAL_RATE))
+
+# Спул уведомлений, ожидающих доставки в Telegram (1 - включен, 0 - отключен),
+# и интервал повторной отправки недоставленных уведомлений (в секундах)
+ALERT_SPOOL = os.getenv("ALERT_SPOOL", "1") != "0"
+ALERT_SPOOL_REPLAY_INTERVAL = float(os.getenv("ALERT_SPOOL_REPLAY_INTERVAL", DEFAULT_REPLAY_INTERVAL))
+
+# Количество потоков для запросов к базе данных из обработчиков команд
+DB_THREADS = int(os.getenv("DB_THREADS", DEFAULT_DB_THREADS))
+
+# Хранение истории инцидентов: подробные записи старше INCIDENT_RETENTION_DAYS
+# дней переносятся в почасовые агрегаты, почасовые старше INCIDENT_HOURLY_DAYS -
+# в дневные (0 - хранить подробные записи без ограничения срока)
+INCIDENT_RETENTION_DAYS = float(os.getenv("INCIDENT_RETENTION_DAYS", DEFAULT_RAW_DAYS))
+INCIDENT_HOURLY_DAYS = float(os.getenv("INCIDENT_HOURLY_DAYS", DEFAULT_HOURLY_DAYS))
+RETENTION_INTERVAL = float(os.getenv("RETENTION_INTERVAL", DEFAULT_RETENTION_INTERVAL))
+
+# Файл конфигурации HIDS (политика автоматической блокировки: auto_block_ip,
+# block_duration, пороги auto_block_threshold_<ТИП>)
+HIDS_CONFIG = os.getenv("HIDS_CONFIG", DEFAULT_CONFIG_PATH)
+
+# Адрес Bot API (для локального сервера или заглушки из benchmarks/telegram_stub.py)
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")
+
 # Инициализация бота
 async def main():
     # Настройка сессии
-    session = AiohttpSession()
+    if TELEGRAM_API_URL:
+        session = AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL))
+    else:
+        session = AiohttpSession()
+    
+    # Все отправляемые сообщения проходят через исходящую очередь с ограничением скорости
+    outbox = TelegramOutbox(
+        chat_rate=OUTBOX_CHAT_RATE,
+        group_rate=OUTBOX_GROUP_RATE,
+        global_rate=OUTBOX_GLOBAL_RATE
+    )
+    session.middleware(OutboxMiddleware(outbox))
+    await outbox.start()
     bot_properties = DefaultBotProperties(parse_mode="HTML")
     
     # Инициализация бота и диспетчера
     bot = Bot(token=BOT_TOKEN, session=session, default=bot_properties)
     dp = Dispatcher(storage=MemoryStorage())
     
-    # Инициализация БД
+    # Измерение задержки событийного цикла (для /pipeline)
+    loop_monitor = LoopLagMonitor()
+    await loop_monitor.start()
+    
+    # Инициализация БД: обработчики обращаются к ней через асинхронную обертку,
+    # запросы выполняются в отдельных потоках и не блокируют событийный цикл
     db_manager = DatabaseManager("hids.db")
+    db = AsyncDatabaseManager(db_manager, threads=DB_THREADS)
     
     # Регистрация мидлварей
     async def db_middleware(handler, event, data):
-        data["db_manager"] = db_manager
+        data["db"] = db
         return await handler(event, data)
 
     dp.message.middleware(db_middleware)
@@ -85,6 +153,7 @@ async def main():
             f"Доступные команды:\n"
             f"/alerts - Показать последние уведомления\n"
             f"/alert_detail [IP] - Показать детальную информацию об IP\n"
+            f"/stats [day|week|month] - Статистика инцидентов\n"
             f"/system - Показать состояние системы\n"
             f"/help - Показать справку по всем командам"
         )
@@ -103,15 +172,21 @@ async def main():
             
             "<b>Управление уведомлениями:</b>\n"
             "/alerts - Показать последние уведомления\n"
-            "/alert_detail [IP] - Подробная информация об уведомлениях для IP\n\n"
+            "/alert_detail [IP] - Подробная информация об уведомлениях для IP\n"
+            "/stats [day|week|month] [тип] - Статистика: топ IP, типы, динамика по часам/дням\n"
+            "/export [incidents|blocked_ips|whitelist] [jsonl|csv] - Выгрузка в файл (gzip)\n\n"
             
             "<b>Системная информация:</b>\n"
             "/system - Проверить состояние системы\n"
             "/services - Статус важных сервисов\n"
             "/logs - Последние записи в журнале\n"
-            "/network - Сетевые соединения\n\n"
+            "/network - Сетевые соединения\n"
+            "/pipeline - Состояние очереди уведомлений\n\n"
             
             "<b>Действия с IP:</b>\n"
+            "/block [часы] IP [IP ...] - Заблокировать список адресов или подсетей\n"
+            "/unblock IP [IP ...] - Разблокировать список адресов\n"
+            "/reconcile - Сверить межсетевой экран со списком заблокированных IP\n"
             "Через интерфейс команды /alert_detail можно:\n"
             "- Заблокировать IP\n"
             "- Разблокировать IP\n"
@@ -129,20 +204,152 @@ async def main():
     dp.include_router(alert_router)
     dp.include_router(system_router)
     
+    # Спул: уведомление записывается до отправки и помечается доставленным после нее
+    alert_spool = None
+    if ALERT_SPOOL and ADMIN_CHAT_ID:
+        alert_spool = AlertSpool(db_manager, replay_interval=ALERT_SPOOL_REPLAY_INTERVAL)
+    set_alert_spool(alert_spool)
+    
     # Коллбэк для обработки уведомлений от HIDS
     async def handle_hids_notification(alert_info):
         try:
+            if alert_spool:
+                alert_info['spool_id'] = await alert_spool.append(alert_info)
             await process_hids_alert(alert_info, bot, ADMIN_CHAT_ID)
         except Exception as e:
             logger.error(f"Ошибка при обработке уведомления: {e}")
     
-    # Инициализация и запуск слушателя HIDS
+    # Повторная отправка недоставленных уведомлений (при запуске и после
+    # восстановления связи с Telegram); в базу инцидентов они уже записаны
+    async def replay_hids_notification(alert_info):
+        await process_hids_alert(alert_info, bot, ADMIN_CHAT_ID)
+    
+    if alert_spool:
+        await alert_spool.start(replay_hids_notification, can_replay=lambda: outbox.healthy)
+    
+    # Автоматическая блокировка по порогам из конфигурации HIDS: решения
+    # принимаются по счетчикам в памяти, блокировки применяются пакетами
+    auto_ban = None
+    auto_ban_policy = load_policy(HIDS_CONFIG)
+    if auto_ban_policy.enabled:
+        auto_ban = AutoBanEngine(
+            auto_ban_policy,
+            apply=lambda bans: apply_auto_bans(bans, db, bot, ADMIN_CHAT_ID),
+            is_whitelisted=db_manager.is_in_whitelist,
+            is_blocked=db_manager.is_blocked,
+            whitelist=db_manager.get_whitelist_ip_set
+        )
+        logger.info(
+            f"Автоматическая блокировка включена: на {auto_ban_policy.duration} с, пороги "
+            + ", ".join(f"{name}={count}/{window:g}" for name, (count, window) in auto_ban_policy.thresholds.items())
+        )
+    
+    # Очередь уведомлений между слушателем и обработчиками
+    alert_queue = AlertQueue(
+        db_manager=db_manager,
+        callback=handle_hids_notification,
+        maxsize=ALERT_QUEUE_SIZE,
+        workers=ALERT_WORKERS,
+        auto_ban=auto_ban
+    )
+    await alert_queue.start()
+    
+    # Подготовка межсетевого экрана (наборы ipset и правила DROP) до первой блокировки
+    firewall = get_firewall()
+    await asyncio.get_running_loop().run_in_executor(None, firewall.setup)
+    
+    # Сверка межсетевого экрана с blocked_ips: после нее состояние блокировок
+    # хранится в памяти и проверки не запускают процессов
+    reconciled = await asyncio.get_running_loop().run_in_executor(
+        None, reconcile_firewall, db_manager.get_blocked_ip_set()
+    )
+    if reconciled is None:
+        logger.warning("Не удалось сверить межсетевой экран со списком заблокированных IP")
+    
+    # Снятие временных блокировок по сроку из базы данных (в том числе
+    # истекших, пока бот не работал)
+    ban_scheduler = BanScheduler(db_manager, unblock_ips)
+    await ban_scheduler.start()
+    set_ban_scheduler(ban_scheduler)
+    if auto_ban:
+        await auto_ban.start()
+    
+    # Инициализация и запуск слушателя HIDS в событийном цикле бота
     hids_listener = HIDSListener(
         socket_path=HIDS_SOCKET,
-        db_manager=db_manager,
-        callback=handle_hids_notification
+        alert_queue=alert_queue,
+        loop_monitor=loop_monitor
     )
-    hids_listener.start()
+    await hids_listener.start()
+    
+    # Перенос старых инцидентов в агрегаты и очистка базы
+    retention = None
+    if INCIDENT_RETENTION_DAYS > 0:
+        retention = IncidentRetention(
+            db_manager,
+            raw_days=INCIDENT_RETENTION_DAYS,
+            hourly_days=INCIDENT_HOURLY_DAYS,
+            interval=RETENTION_INTERVAL
+        )
+        await retention.start()
+    
+    # Обработчик команды /pipeline
+    @dp.message(Command("pipeline"))
+    async def cmd_pipeline(message: types.Message):
+        stats = alert_queue.stats()
+        wait = stats["wait_time"]
+        db_stats = stats["db"]
+        query_stats = db.stats()
+        lag = loop_monitor.snapshot()
+        outbox_stats = outbox.stats()
+        
+        spool_text = ""
+        if alert_spool:
+            spool_stats = alert_spool.stats()
+            spool_text = (
+                "\n\n<b>Спул уведомлений:</b>\n"
+                f"Записано: {spool_stats['appended']}, доставлено: {spool_stats['delivered']}, "
+                f"в обработке: {spool_stats['in_flight']}, повторено: {spool_stats['replayed']}"
+            )
+        
+        ban_text = ""
+        if auto_ban:
+            ban_stats = stats["auto_ban"]
+            ban_text = (
+                "\n\n<b>Автоматическая блокировка:</b>\n"
+                f"Учтено уведомлений: {ban_stats['observed']}, заблокировано: {ban_stats['banned']} "
+                f"(подсетей: {ban_stats['banned_subnets']}), ошибок: {ban_stats['failed']}\n"
+                f"Окон: {ban_stats['windows']} + {ban_stats['subnet_windows']} подсетей, "
+                f"нарушителей в истории: {ban_stats['offenders']}"
+            )
+        
+        await message.answer(
+            "📈 <b>Очередь уведомлений</b>\n\n"
+            f"<b>Глубина:</b> {stats['depth']} из {stats['maxsize']} (максимум {stats['max_depth']})\n"
+            f"<b>Обработчиков:</b> {stats['workers']}\n"
+            f"<b>Принято:</b> {stats['enqueued']}\n"
+            f"<b>Обработано:</b> {stats['processed']}\n"
+            f"<b>Ошибок:</b> {stats['failed']}\n"
+            f"<b>Из белого списка (без уведомления):</b> {stats['whitelisted']}\n"
+            f"<b>Ожиданий при заполненной очереди:</b> {stats['full_waits']}\n\n"
+            "<b>Время ожидания в очереди:</b>\n"
+            f"p50: {format_latency(wait['p50'])}, p95: {format_latency(wait['p95'])}, "
+            f"p99: {format_latency(wait['p99'])}, макс.: {format_latency(wait['max'])}\n\n"
+            "<b>Запись в БД:</b>\n"
+            f"Пакетов: {db_stats.get('batches', 0)}, в среднем {db_stats.get('avg_batch', 0):.1f} инцидентов, "
+            f"ожидают записи: {db_stats.get('pending', 0)}, ожиданий при заполненной очереди записи: "
+            f"{stats['db_full_waits']}\n"
+            f"Запросов из команд: {query_stats['calls']}, p99: {format_latency(query_stats['query_time']['p99'])}, "
+            f"ожидают потока: {query_stats['waiting']}\n\n"
+            "<b>Задержка событийного цикла:</b>\n"
+            f"p50: {format_latency(lag['p50'])}, p99: {format_latency(lag['p99'])}, "
+            f"макс.: {format_latency(lag['max'])}\n\n"
+            "<b>Исходящие сообщения:</b>\n"
+            f"Ожидают отправки: {outbox_stats['waiting']}, отправлено: {outbox_stats['sent']}, "
+            f"повторов (429): {outbox_stats['retried']}, ошибок: {outbox_stats['failed']}"
+            + spool_text
+            + ban_text
+        )
     
     try:
         # Отправка сообщения администратору о запуске бота
@@ -162,11 +369,30 @@ async def main():
         await dp.start_polling(bot)
     
     finally:
-        # Остановка слушателя HIDS
-        hids_listener.stop()
+        # Остановка слушателя HIDS и очереди уведомлений
+        await hids_listener.stop()
+        await alert_queue.stop()
+        if auto_ban:
+            await auto_ban.stop()
+        await ban_scheduler.stop()
+        
+        if retention:
+            await retention.stop()
+        
+        # Отправка уведомлений, ожидающих окончания окна объединения
+        await flush_pending_alerts()
         
-        # Корректное завершение сессии
+        # Недоставленные уведомления остаются в спуле до следующего запуска
+        if alert_spool:
+            await alert_spool.stop()
+        
+        # Остановка исходящей очереди и корректное завершение сессии
+        await outbox.stop()
         await bot.session.close()
+        
+        # Закрытие соединений с базой данных
+        await db.close()
+        await loop_monitor.stop()
 
 if __name__ == "__main__":
     try:
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Модуль хранилища (спула) уведомлений HIDS, еще не доставленных в Telegram.
+
+Каждое уведомление записывается в таблицу alert_spool до отправки и
+помечается доставленным после успешной отправки. Недоставленные записи
+(Telegram был недоступен или бот перезапустился) повторно обрабатываются
+пакетами при запуске и после восстановления связи. Доставленные и слишком
+старые записи периодически удаляются.
+
+Запись выполняется через BatchWriter, поэтому добавление уведомления не
+ожидает диска, а при заполненной очереди записи ожидание выполняется вне
+событийного цикла. Соединение спула открывается с synchronous=FULL:
+зафиксированная запись переживает не только аварийное завершение бота, но
+и сбой питания (fsync один на пакет).
+"""
+
+import json
+import time
+import queue
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Set
+
+from database.batch_writer import BatchWriter
+
+logger = logging.getLogger(__name__)
+
+# Интервал проверки недоставленных уведомлений (в секундах)
+DEFAULT_REPLAY_INTERVAL = 30.0
+
+# Количество уведомлений, читаемых из спула за один раз
+DEFAULT_REPLAY_BATCH = 100
+
+# Интервал удаления доставленных записей (в секундах)
+DEFAULT_COMPACT_INTERVAL = 600.0
+
+# Максимальный срок хранения недоставленного уведомления (в секундах)
+DEFAULT_MAX_AGE = 7 * 24 * 3600.0
+
+# Максимальное количество ID в одном запросе отметки доставки
+# (ограничение SQLite на количество параметров - 999 в старых версиях)
+MARK_BATCH = 500
+
+
+class AlertSpool:
+    """
+    Хранилище недоставленных уведомлений.
+
+    Атрибуты:
+        db_manager: Объект для работы с базой данных
+        replay_interval: Интервал проверки недоставленных уведомлений в секундах
+        replay_batch: Количество уведомлений, читаемых из спула за один раз
+        compact_interval: Интервал удаления доставленных записей в секундах
+        max_age: Максимальный срок хранения недоставленного уведомления в секундах
+    """
+
+    def __init__(self, db_manager, replay_interval: float = DEFAULT_REPLAY_INTERVAL,
+                 replay_batch: int = DEFAULT_REPLAY_BATCH,
+                 compact_interval: float = DEFAULT_COMPACT_INTERVAL,
+                 max_age: float = DEFAULT_MAX_AGE):
+        """
+        Инициализирует хранилище.
+
+        Args:
+            db_manager: Объект для работы с базой данных
+            replay_interval: Интервал проверки недоставленных уведомлений в секундах
+            replay_batch: Количество уведомлений, читаемых из спула за один раз
+            compact_interval: Интервал удаления доставленных записей в секундах
+            max_age: Максимальный срок хранения недоставленного уведомления в секундах
+        """
+        self.db_manager = db_manager
+        self.replay_interval = replay_interval
+        self.replay_batch = max(1, replay_batch)
+        self.compact_interval = compact_interval
+        self.max_age = max_age
+
+        self._writer = BatchWriter(db_manager.db_path, name="alert-spool-writer", durable=True)
+        self._next_id = self.db_manager.get_spool_max_id() + 1
+
+        # Уведомления, которые обрабатываются в текущем процессе
+        self._in_flight: Set[int] = set()
+        self._task: Optional[asyncio.Task] = None
+
+        # Метрики
+        self.appended = 0
+        self.delivered = 0
+        self.replayed = 0
+
+    async def append(self, alert_info: Dict[str, Any]) -> int:
+        """
+        Записывает уведомление в спул (запись выполняется в фоне).
+
+        Если очередь записи заполнена, корутина ожидает места, не блокируя
+        событийный цикл.
+
+        Args:
+            alert_info: Информация об уведомлении
+
+        Returns:
+            ID записи в спуле
+        """
+        spool_id = self._next_id
+        self._next_id += 1
+
+        payload = {key: value for key, value in alert_info.items() if key != "spool_id"}
+        self._in_flight.add(spool_id)
+        await self._writer.submit_async(
+            "INSERT INTO alert_spool (id, payload, created) VALUES (?, ?, ?)",
+            (spool_id, json.dumps(payload, ensure_ascii=False), time.time())
+        )
+        self.appended += 1
+        return spool_id
+
+    def mark_delivered(self, spool_ids: Iterable[int]) -> None:
+        """
+        Помечает уведомления доставленными.
+
+        Отметка ставится одним запросом на MARK_BATCH записей. Вызывается из
+        событийного цикла и не ожидает: если очередь записи заполнена, запрос
+        ставится в очередь из потока пула (после записей о самих уведомлениях).
+
+        Args:
+            spool_ids: ID записей в спуле
+        """
+        spool_ids = list(spool_ids)
+        self._in_flight.difference_update(spool_ids)
+        self.delivered += len(spool_ids)
+        for start in range(0, len(spool_ids), MARK_BATCH):
+            chunk = spool_ids[start:start + MARK_BATCH]
+            sql = f"UPDATE alert_spool SET delivered = 1 WHERE id IN ({', '.join('?' * len(chunk))})"
+            try:
+                self._writer.submit(sql, chunk, block=False)
+            except queue.Full:
+                asyncio.get_running_loop().run_in_executor(None, self._writer.submit, sql, chunk)
+
+    def release(self, spool_ids: Iterable[int]) -> None:
+        """
+        Возвращает недоставленные уведомления в спул для повторной отправки.
+
+        Args:
+            spool_ids: ID записей в спуле
+        """
+        self._in_flight.difference_update(spool_ids)
+
+    async def replay(self, callback: Callable[[Dict[str, Any]], Awaitable[None]]) -> int:
+        """
+        Повторно обрабатывает недоставленные уведомления пакетами.
+
+        Args:
+            callback: Асинхронная функция обработки уведомления (alert_info со spool_id)
+
+        Returns:
+            Количество повторно обработанных уведомлений
+        """
+        # Дожидаемся записи уже добавленных уведомлений
+        await asyncio.wrap_future(self._writer.submit("SELECT 1"))
+
+        loop = asyncio.get_running_loop()
+        count = 0
+        last_id = 0
+        while True:
+            rows = await loop.run_in_executor(None, self.db_manager.get_spool_pending, last_id, self.replay_batch)
+            if not rows:
+                break
+
+            for spool_id, payload in rows:
+                last_id = spool_id
+                if spool_id in self._in_flight:
+                    continue
+
+                try:
+                    alert_info = json.loads(payload)
+                except ValueError:
+                    logger.error(f"Поврежденная запись в спуле уведомлений: id={spool_id}")
+                    self.mark_delivered([spool_id])
+                    continue
+
+                alert_info["spool_id"] = spool_id
+                self._in_flight.add(spool_id)
+                await callback(alert_info)
+                count += 1
+
+        if count:
+            self.replayed += count
+            logger.info(f"Повторно обработано недоставленных уведомлений: {count}")
+        return count
+
+    async def compact(self) -> None:
+        """Удаляет доставленные и слишком старые записи."""
+        await asyncio.wrap_future(self._writer.submit(
+            "DELETE FROM alert_spool WHERE delivered = 1 OR created < ?",
+            (time.time() - self.max_age,)
+        ))
+
+    async def start(self, callback: Callable[[Dict[str, Any]], Awaitable[None]],
+                    can_replay: Callable[[], bool] = lambda: True) -> None:
+        """
+        Повторно обрабатывает недоставленные уведомления и запускает
+        периодическую проверку спула.
+
+        Args:
+            callback: Асинхронная функция обработки уведомления
+            can_replay: Функция, возвращающая True, если отправка доступна
+        """
+        if self._task:
+            return
+        await self.replay(callback)
+        self._task = asyncio.create_task(self._run(callback, can_replay), name="alert-spool")
+
+    async def stop(self) -> None:
+        """Останавливает периодическую проверку и записывает оставшиеся изменения."""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await asyncio.get_running_loop().run_in_executor(None, self._writer.close)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Возвращает метрики спула.
+
+        Returns:
+            Словарь со счетчиками записей и пакетов
+        """
+        return {
+            "appended": self.appended,
+            "delivered": self.delivered,
+            "replayed": self.replayed,
+            "in_flight": len(self._in_flight),
+            "batches": self._writer.batches,
+            "statements": self._writer.statements,
+        }
+
+    async def _run(self, callback: Callable[[Dict[str, Any]], Awaitable[None]],
+                   can_replay: Callable[[], bool]) -> None:
+        """Периодически повторяет недоставленные уведомления и очищает спул."""
+        last_compact = time.monotonic()
+        while True:
+            await asyncio.sleep(self.replay_interval)
+            try:
+                if can_replay():
+                    await self.replay(callback)
+
+                if time.monotonic() - last_compact >= self.compact_interval:
+                    last_compact = time.monotonic()
+                    await self.compact()
+
+            except Exception as e:
+                logger.error(f"Ошибка при обслуживании спула уведомлений: {e}")
@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Асинхронный доступ к базе данных для обработчиков aiogram.
+
+Методы DatabaseManager синхронные: вызов из обработчика блокирует
+событийный цикл на время запроса, и при медленном диске или большом
+запросе замирают все чаты и слушатель HIDS. AsyncDatabaseManager
+выполняет те же методы в отдельном пуле потоков (у каждого потока свое
+соединение для чтения) и возвращает awaitable-результат.
+
+Количество одновременно выполняемых запросов ограничено размером пула;
+остальные ожидают своей очереди в событийном цикле, не занимая потоков.
+"""
+
+import time
+import asyncio
+import functools
+import logging
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, TypeVar
+
+from database.db_manager import DatabaseManager
+from utils.metrics import LatencyHistogram
+
+logger = logging.getLogger(__name__)
+
+# Количество потоков для запросов к базе данных
+DEFAULT_DB_THREADS = 4
+
+T = TypeVar("T")
+
+
+class AsyncDatabaseManager:
+    """
+    Асинхронная обертка над DatabaseManager.
+
+    Атрибуты:
+        sync: Синхронный DatabaseManager (для кода вне событийного цикла)
+        threads: Количество потоков для запросов
+    """
+
+    def __init__(self, db_manager: DatabaseManager, threads: int = DEFAULT_DB_THREADS):
+        """
+        Инициализирует обертку.
+
+        Args:
+            db_manager: Синхронный объект для работы с базой данных
+            threads: Количество потоков для запросов (и одновременных запросов)
+        """
+        self.sync = db_manager
+        self.threads = max(1, threads)
+        self._executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="db")
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+        # Метрики
+        self.calls = 0
+        self.waiting = 0
+        self.wait_time = LatencyHistogram()
+        self.query_time = LatencyHistogram()
+
+    async def run(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """
+        Выполняет синхронную функцию в пуле потоков базы данных.
+
+        Args:
+            func: Функция (обычно метод DatabaseManager)
+            *args: Позиционные аргументы функции
+            **kwargs: Именованные аргументы функции
+
+        Returns:
+            Результат функции
+        """
+        # Семафор создается в работающем цикле (в Python 3.8/3.9 он привязывается к циклу)
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.threads)
+
+        queued = time.monotonic()
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+
+        started = time.monotonic()
+        self.wait_time.record(started - queued)
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+        finally:
+            self._semaphore.release()
+            self.query_time.record(time.monotonic() - started)
+            self.calls += 1
+
+    async def add_incident(self, ip: str, reason: str, wait: bool = False,
+                           alert_type: Optional[str] = None) -> Optional[Future]:
+        """
+        Добавляет новый инцидент в базу данных.
+
+        Args:
+            ip: IP-адрес источника инцидента
+            reason: Причина/описание инцидента
+            wait: Дождаться фиксации транзакции (переживает аварийное завершение
+                бота, но не сбой питания - см. database.connection)
+            alert_type: Тип инцидента (по умолчанию определяется по причине)
+
+        Returns:
+            Future, который завершается после фиксации (None при записи без очереди)
+        """
+        return await self.run(self.sync.add_incident, ip, reason, wait, alert_type)
+
+    async def add_to_blocked(self, ip: str, reason: str, expires_at: Optional[int] = None) -> None:
+        """
+        Добавляет IP в список заблокированных.
+
+        Args:
+            ip: IP-адрес для блокировки
+            reason: Причина блокировки
+            expires_at: Время окончания блокировки (секунды эпохи, None - постоянно)
+        """
+        await self.run(self.sync.add_to_blocked, ip, reason, expires_at)
+
+    async def remove_from_blocked(self, ip: str) -> None:
+        """
+        Удаляет IP из списка заблокированных.
+
+        Args:
+            ip: IP-адрес для разблокировки
+        """
+        await self.run(self.sync.remove_from_blocked, ip)
+
+    async def add_many_to_blocked(self, ips: Iterable[str], reason: str, expires_at: Optional[int] = None) -> None:
+        """
+        Добавляет список IP в список заблокированных одной транзакцией.
+
+        Args:
+            ips: IP-адреса для блокировки
+            reason: Причина блокировки
+            expires_at: Время окончания блокировки (секунды эпохи, None - постоянно)
+        """
+        await self.run(self.sync.add_many_to_blocked, list(ips), reason, expires_at)
+
+    async def remove_many_from_blocked(self, ips: Iterable[str]) -> None:
+        """
+        Удаляет список IP из списка заблокированных одной транзакцией.
+
+        Args:
+            ips: IP-адреса для разблокировки
+        """
+        await self.run(self.sync.remove_many_from_blocked, list(ips))
+
+    async def get_ban_expiry(self, ip: str) -> Optional[int]:
+        """
+        Возвращает время окончания блокировки IP.
+
+        Args:
+            ip: IP-адрес
+
+        Returns:
+            Секунды эпохи или None (постоянная блокировка или IP не заблокирован)
+        """
+        return await self.run(self.sync.get_ban_expiry, ip)
+
+    async def add_to_whitelist(self, ip: str) -> None:
+        """
+        Добавляет IP в белый список.
+
+        Args:
+            ip: IP-адрес для добавления в белый список
+        """
+        await self.run(self.sync.add_to_whitelist, ip)
+
+    async def remove_from_whitelist(self, ip: str) -> None:
+        """
+        Удаляет IP из белого списка.
+
+        Args:
+            ip: IP-адрес для удаления из белого списка
+        """
+        await self.run(self.sync.remove_from_whitelist, ip)
+
+    async def is_in_whitelist(self, ip: str) -> bool:
+        """
+        Проверяет, находится ли IP в белом списке.
+
+        Args:
+            ip: IP-адрес для проверки
+
+        Returns:
+            True если IP в белом списке, иначе False
+        """
+        # Проверка по множеству в памяти - без пула потоков
+        return self.sync.is_in_whitelist(ip)
+
+    async def is_blocked(self, ip: str) -> bool:
+        """
+        Проверяет, находится ли IP в списке заблокированных.
+
+        Args:
+            ip: IP-адрес для проверки
+
+        Returns:
+            True если IP заблокирован, иначе False
+        """
+        return self.sync.is_blocked(ip)
+
+    async def get_blocked_ips(self) -> List[Tuple[str, str, str]]:
+        """
+        Возвращает список всех заблокированных IP.
+
+        Returns:
+            Список кортежей (ip, reason, timestamp)
+        """
+        return await self.run(self.sync.get_blocked_ips)
+
+    async def get_whitelist(self) -> List[Tuple[str, str]]:
+        """
+        Возвращает список всех IP в белом списке.
+
+        Returns:
+            Список кортежей (ip, timestamp)
+        """
+        return await self.run(self.sync.get_whitelist)
+
+    async def get_recent_incidents(self, limit: int = 10) -> List[Tuple[str, str, str, int]]:
+        """
+        Возвращает список последних инцидентов.
+
+        Args:
+            limit: Максимальное количество инцидентов
+
+        Returns:
+            Список кортежей (ip, reason, timestamp, is_blocked)
+        """
+        return await self.run(self.sync.get_recent_incidents, limit)
+
+    async def get_incidents_by_ip(self, ip: str) -> List[dict]:
+        """
+        Возвращает список инцидентов для указанного IP-адреса.
+
+        Args:
+            ip: IP-адрес для поиска
+
+        Returns:
+            Список словарей с информацией об инцидентах для данного IP
+        """
+        return await self.run(self.sync.get_incidents_by_ip, ip)
+
+    async def get_incidents_page(self, ip: Optional[str] = None, limit: int = 10,
+                                 before: Optional[Tuple[int, int]] = None,
+                                 after: Optional[Tuple[int, int]] = None) -> List[Tuple[int, str, str, int, int]]:
+        """
+        Возвращает одну страницу инцидентов (новые сначала).
+
+        Args:
+            ip: IP-адрес (None - инциденты всех IP)
+            limit: Размер страницы
+            before: Ключ (timestamp, id): инциденты старше него
+            after: Ключ (timestamp, id): инциденты новее него
+
+        Returns:
+            Список кортежей (id, ip, reason, timestamp, is_blocked)
+        """
+        return await self.run(self.sync.get_incidents_page, ip, limit, before, after)
+
+    async def get_incidents_in_network(self, cidr: str, since: Optional[Any] = None, until: Optional[Any] = None,
+                                       limit: int = 1000) -> List[Tuple[int, str, str, int, int]]:
+        """
+        Возвращает инциденты из подсети за период (новые сначала).
+
+        Args:
+            cidr: Подсеть ("203.0.113.0/24") или отдельный адрес
+            since: Начало периода включительно
+            until: Конец периода не включительно
+            limit: Максимальное количество инцидентов
+
+        Returns:
+            Список кортежей (id, ip, reason, timestamp, is_blocked)
+        """
+        return await self.run(self.sync.get_incidents_in_network, cidr, since, until, limit)
+
+    async def get_incident_rollups(self, limit: int = 10,
+                                   before: Optional[int] = None) -> List[Tuple[int, str, str, int]]:
+        """
+        Возвращает последние почасовые агрегаты инцидентов.
+
+        Args:
+            limit: Максимальное количество строк
+            before: Возвращать только периоды раньше указанного времени
+
+        Returns:
+            Список кортежей (начало часа, ip, reason, count)
+        """
+        return await self.run(self.sync.get_incident_rollups, limit, before)
+
+    async def get_ip_rollup_summary(self, ip: str) -> List[Tuple[str, int, int, int]]:
+        """
+        Возвращает сводку по агрегированным (старым) инцидентам для IP-адреса.
+
+        Args:
+            ip: IP-адрес для поиска
+
+        Returns:
+            Список кортежей (reason, count, first_seen, last_seen)
+        """
+        return await self.run(self.sync.get_ip_rollup_summary, ip)
+
+    async def get_stats(self, since: Any, until: Optional[Any] = None, alert_type: Optional[str] = None,
+                        limit: int = 10) -> Dict[str, Any]:
+        """
+        Возвращает статистику инцидентов за период по счетчикам.
+
+        Args:
+            since: Начало периода
+            until: Конец периода не включительно (по умолчанию - текущее время)
+            alert_type: Учитывать в total и hourly только инциденты этого типа
+            limit: Количество IP в top_ips
+
+        Returns:
+            Словарь с ключами total, by_type, hourly и top_ips
+        """
+        return await self.run(self.sync.get_stats, since, until, alert_type, limit)
+
+    async def get_ip_stats(self, ip: str) -> Optional[Tuple[int, int, int]]:
+        """
+        Возвращает общее количество инцидентов для IP-адреса.
+
+        Args:
+            ip: IP-адрес
+
+        Returns:
+            Кортеж (количество, первый инцидент, последний инцидент) или None
+        """
+        return await self.run(self.sync.get_ip_stats, ip)
+
+    async def flush(self, timeout: Optional[float] = None) -> None:
+        """
+        Дожидается фиксации всех ранее добавленных инцидентов.
+
+        Args:
+            timeout: Максимальное время ожидания в секундах
+        """
+        await self.run(self.sync.flush, timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Возвращает метрики запросов.
+
+        Returns:
+            Словарь с количеством запросов, временем ожидания потока и
+            временем выполнения запроса
+        """
+        return {
+            "threads": self.threads,
+            "calls": self.calls,
+            "waiting": self.waiting,
+            "wait_time": self.wait_time.snapshot(),
+            "query_time": self.query_time.snapshot(),
+        }
+
+    def reset_stats(self) -> None:
+        """Сбрасывает метрики запросов."""
+        self.calls = 0
+        self.wait_time.reset()
+        self.query_time.reset()
+
+    async def close(self) -> None:
+        """Дожидается выполнения запросов и закрывает базу данных."""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, functools.partial(self._executor.shutdown, wait=True))
+        await loop.run_in_executor(None, self.sync.close)
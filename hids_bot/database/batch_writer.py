@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Модуль пакетной записи в базу данных SQLite.
+
+Запросы на запись не выполняются сразу: они помещаются в очередь, а
+отдельный поток забирает все накопившиеся запросы и выполняет их в одной
+транзакции (group commit). Подряд идущие запросы с одинаковым SQL
+выполняются через executemany. Так одна фиксация на диск приходится на
+сотни записей, и запись не становится узким местом.
+
+Если задана максимальная задержка (max_delay), поток после первого запроса
+ожидает остальные не дольше этого времени или до заполнения пакета.
+
+Очередь ограничена: из событийного цикла запросы ставятся через
+submit_async, который при заполненной очереди ожидает места в потоке пула,
+а не в потоке событийного цикла.
+"""
+
+import time
+import queue
+import asyncio
+import sqlite3
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from database.connection import open_connection
+from utils.metrics import LatencyHistogram
+
+logger = logging.getLogger(__name__)
+
+# Максимальное количество запросов в одной транзакции
+DEFAULT_BATCH_SIZE = 500
+
+# Максимальное количество запросов в очереди (в пакетах): если запись не
+# успевает, submit и submit_async ожидают освобождения места
+QUEUE_BATCHES = 20
+
+# Запросы, которые можно выполнять через executemany
+_DML_PREFIXES = ("INSERT", "UPDATE", "DELETE", "REPLACE")
+
+# Признак завершения работы потока записи
+_STOP = object()
+
+
+class BatchWriter:
+    """
+    Поток пакетной записи в SQLite.
+
+    Атрибуты:
+        db_path: Путь к файлу базы данных SQLite
+        batch_size: Максимальное количество запросов в одной транзакции
+        max_delay: Максимальное время накопления пакета в секундах
+    """
+
+    def __init__(self, db_path: str, batch_size: int = DEFAULT_BATCH_SIZE, max_delay: float = 0.0,
+                 name: str = "db-writer", durable: bool = False):
+        """
+        Инициализирует и запускает поток записи.
+
+        Args:
+            db_path: Путь к файлу базы данных SQLite
+            batch_size: Максимальное количество запросов в одной транзакции
+            max_delay: Максимальное время накопления пакета в секундах
+                (0 - записывать все, что накопилось, сразу)
+            name: Имя потока
+            durable: Сбрасывать журнал на диск при каждой фиксации пакета
+                (см. database.connection)
+        """
+        self.db_path = db_path
+        self.batch_size = max(1, batch_size)
+        self.max_delay = max(0.0, max_delay)
+        self.durable = durable
+
+        self._queue: "queue.Queue" = queue.Queue(maxsize=self.batch_size * QUEUE_BATCHES)
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._closed = False
+
+        # Метрики
+        self.batches = 0
+        self.statements = 0
+        self.full_waits = 0
+        self.commit_time = LatencyHistogram()
+
+        self._thread.start()
+
+    def submit(self, sql: str, params: Sequence[Any] = (), block: bool = True) -> Future:
+        """
+        Ставит запрос в очередь на запись.
+
+        Не вызывайте с block=True из событийного цикла: используйте submit_async.
+
+        Args:
+            sql: SQL-запрос
+            params: Параметры запроса
+            block: Ожидать, если очередь заполнена
+
+        Returns:
+            Future, который завершается после фиксации транзакции
+
+        Raises:
+            queue.Full: Если очередь заполнена и block=False
+        """
+        if self._closed:
+            raise RuntimeError("BatchWriter закрыт")
+
+        future: Future = Future()
+        self._queue.put((sql, params, future), block=block)
+        return future
+
+    async def submit_async(self, sql: str, params: Sequence[Any] = ()) -> Future:
+        """
+        Ставит запрос в очередь на запись, не блокируя событийный цикл.
+
+        Если очередь заполнена, место ожидается в потоке пула, а вызывающая
+        корутина приостанавливается (так замедление записи передается
+        отправителям уведомлений).
+
+        Args:
+            sql: SQL-запрос
+            params: Параметры запроса
+
+        Returns:
+            Future, который завершается после фиксации транзакции
+        """
+        try:
+            return self.submit(sql, params, block=False)
+        except queue.Full:
+            self.full_waits += 1
+            return await asyncio.get_running_loop().run_in_executor(None, self.submit, sql, params)
+
+    def flush(self, timeout: Optional[float] = None) -> None:
+        """
+        Дожидается записи всех запросов, поставленных в очередь до вызова.
+
+        Args:
+            timeout: Максимальное время ожидания в секундах
+        """
+        self.submit("SELECT 1").result(timeout)
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """
+        Записывает оставшиеся запросы и останавливает поток.
+
+        Args:
+            timeout: Максимальное время ожидания в секундах
+        """
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    def pending(self) -> int:
+        """
+        Возвращает количество запросов, ожидающих записи.
+
+        Returns:
+            Примерное количество запросов в очереди
+        """
+        return self._queue.qsize()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Возвращает метрики записи.
+
+        Returns:
+            Словарь с количеством пакетов и запросов, средним размером пакета
+            и временем выполнения транзакции
+        """
+        return {
+            "pending": self.pending(),
+            "batches": self.batches,
+            "statements": self.statements,
+            "avg_batch": self.statements / self.batches if self.batches else 0.0,
+            "full_waits": self.full_waits,
+            "commit_time": self.commit_time.snapshot(),
+        }
+
+    def _run(self) -> None:
+        """Основной цикл потока записи."""
+        conn = open_connection(self.db_path, durable=self.durable)
+        try:
+            while True:
+                item = self._queue.get()
+                if item is _STOP:
+                    return
+
+                batch = [item]
+                stop = False
+                deadline = time.monotonic() + self.max_delay
+                while len(batch) < self.batch_size:
+                    try:
+                        remaining = deadline - time.monotonic()
+                        if remaining > 0:
+                            item = self._queue.get(timeout=remaining)
+                        else:
+                            item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is _STOP:
+                        stop = True
+                        break
+                    batch.append(item)
+
+                self._write(conn, batch)
+                if stop:
+                    return
+        finally:
+            conn.close()
+
+    def _write(self, conn: sqlite3.Connection, batch: List[Tuple[str, Sequence[Any], Future]]) -> None:
+        """Выполняет пакет запросов в одной транзакции."""
+        started = time.monotonic()
+        try:
+            with conn:
+                start = 0
+                while start < len(batch):
+                    # Подряд идущие одинаковые запросы - одним executemany
+                    sql = batch[start][0]
+                    end = start + 1
+                    while end < len(batch) and batch[end][0] == sql:
+                        end += 1
+
+                    if end - start == 1 or not sql.lstrip().upper().startswith(_DML_PREFIXES):
+                        for _, params, _ in batch[start:end]:
+                            conn.execute(sql, params)
+                    else:
+                        conn.executemany(sql, [params for _, params, _ in batch[start:end]])
+                    start = end
+
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка при пакетной записи в базу данных ({len(batch)} запросов): {e}")
+            for _, _, future in batch:
+                future.set_exception(e)
+            return
+
+        self.commit_time.record(time.monotonic() - started)
+        self.batches += 1
+        self.statements += len(batch)
+        for _, _, future in batch:
+            future.set_result(None)
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Модуль преобразования значений между DatabaseManager и схемой базы данных.
+
+В таблицах инцидентов время хранится целым числом секунд эпохи (UTC), а
+IP-адрес - 16-байтовым BLOB: IPv6 как есть, IPv4 в виде IPv4-mapped
+(::ffff:a.b.c.d). Все адреса одной длины, поэтому сравнение BLOB совпадает
+с числовым порядком адресов и подсеть (CIDR) - непрерывный диапазон,
+который выбирается по индексу. Значения, не являющиеся IP-адресом,
+сохраняются как текст (в SQLite текст всегда меньше BLOB и в диапазоны
+адресов не попадает).
+"""
+
+import time
+import socket
+import datetime
+import ipaddress
+from typing import Optional, Tuple, Union
+
+# Формат времени для отображения (как у прежнего CURRENT_TIMESTAMP, UTC)
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Префикс IPv4-mapped адреса
+_IPV4_MAPPED_PREFIX = b"\x00" * 10 + b"\xff\xff"
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+
+StoredIP = Union[bytes, str]
+
+
+def pack_ip(ip: str) -> StoredIP:
+    """
+    Упаковывает IP-адрес для хранения в базе данных.
+
+    Args:
+        ip: IPv4- или IPv6-адрес в текстовом виде
+
+    Returns:
+        16 байт для IP-адреса или исходная строка, если это не IP-адрес
+    """
+    try:
+        return _IPV4_MAPPED_PREFIX + socket.inet_pton(socket.AF_INET, ip)
+    except (OSError, TypeError):
+        pass
+    try:
+        return socket.inet_pton(socket.AF_INET6, ip)
+    except (OSError, TypeError):
+        return ip
+
+
+def unpack_ip(value: StoredIP) -> str:
+    """
+    Распаковывает IP-адрес, сохраненный pack_ip.
+
+    Args:
+        value: Значение столбца ip
+
+    Returns:
+        IP-адрес в текстовом виде
+    """
+    if isinstance(value, bytes) and len(value) == 16:
+        if value.startswith(_IPV4_MAPPED_PREFIX):
+            return socket.inet_ntop(socket.AF_INET, value[12:])
+        return socket.inet_ntop(socket.AF_INET6, value)
+    if isinstance(value, bytes):
+        return value.decode("utf-8", "replace")
+    return value
+
+
+def network_range(cidr: str) -> Tuple[bytes, bytes]:
+    """
+    Возвращает диапазон упакованных адресов подсети.
+
+    Args:
+        cidr: Подсеть ("203.0.113.0/24", "2001:db8::/32") или отдельный адрес
+
+    Returns:
+        Кортеж (первый адрес, последний адрес) для условия BETWEEN
+
+    Raises:
+        ValueError: Если строка не является подсетью
+    """
+    network = ipaddress.ip_network(cidr, strict=False)
+    first, last = network.network_address, network.broadcast_address
+    if network.version == 4:
+        return (_IPV4_MAPPED_PREFIX + first.packed, _IPV4_MAPPED_PREFIX + last.packed)
+    return first.packed, last.packed
+
+
+def now() -> int:
+    """
+    Возвращает текущее время для записи в базу данных.
+
+    Returns:
+        Секунды эпохи (UTC)
+    """
+    return int(time.time())
+
+
+def to_epoch(value: Union[int, float, str, datetime.datetime]) -> int:
+    """
+    Преобразует время в секунды эпохи.
+
+    Args:
+        value: Секунды эпохи (в том числе строкой), строка
+            "YYYY-MM-DD HH:MM:SS" (UTC, допускается ISO 8601) или datetime
+            (без часового пояса - UTC)
+
+    Returns:
+        Секунды эпохи
+    """
+    if isinstance(value, (int, float)):
+        return int(value)
+    if isinstance(value, str):
+        if value.isdigit():
+            return int(value)
+        # fromisoformat разбирает TIMESTAMP_FORMAT на порядок быстрее strptime
+        value = datetime.datetime.fromisoformat(value)
+    if value.tzinfo is not None:
+        return int(value.timestamp())
+    return int((value - _EPOCH).total_seconds())
+
+
+def to_datetime(epoch: int) -> datetime.datetime:
+    """
+    Преобразует секунды эпохи в datetime.
+
+    Args:
+        epoch: Секунды эпохи
+
+    Returns:
+        datetime в UTC без часового пояса
+    """
+    return _EPOCH + datetime.timedelta(seconds=epoch)
+
+
+def format_timestamp(epoch: Optional[int]) -> str:
+    """
+    Форматирует время для отображения.
+
+    Args:
+        epoch: Секунды эпохи
+
+    Returns:
+        Строка "YYYY-MM-DD HH:MM:SS" (UTC)
+    """
+    if epoch is None:
+        return ""
+    return time.strftime(TIMESTAMP_FORMAT, time.gmtime(epoch))
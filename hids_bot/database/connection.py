@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Модуль открытия соединений с базой данных SQLite.
+
+Все соединения бота открываются с одинаковыми настройками:
+
+- журнал WAL: читатели не блокируют писателя и наоборот;
+- synchronous=NORMAL: в режиме WAL база остается согласованной при сбое,
+  а fsync выполняется только при контрольной точке. Зафиксированная
+  транзакция переживает аварийное завершение процесса, но последние
+  транзакции могут быть потеряны при сбое питания или ядра. Соединения
+  для записи, которая должна пережить и их (спул уведомлений), открываются
+  с durable=True - synchronous=FULL, fsync при каждой фиксации;
+- увеличенный кэш страниц, отображение файла в память (mmap) и временные
+  таблицы в памяти;
+- busy_timeout: при одновременной записи из нескольких соединений запрос
+  ожидает освобождения блокировки, а не завершается ошибкой.
+
+Соединения живут долго, поэтому разобранные запросы берутся из кэша
+подготовленных выражений модуля sqlite3 (cached_statements).
+"""
+
+import sqlite3
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Размер кэша страниц (отрицательное значение - в килобайтах)
+CACHE_SIZE_KB = 16 * 1024
+
+# Размер области отображения файла в память (в байтах)
+MMAP_SIZE = 64 * 1024 * 1024
+
+# Время ожидания блокировки (в миллисекундах)
+BUSY_TIMEOUT_MS = 5000
+
+# Количество подготовленных выражений в кэше соединения
+CACHED_STATEMENTS = 256
+
+
+def open_connection(db_path: str, readonly: bool = False, durable: bool = False) -> sqlite3.Connection:
+    """
+    Открывает соединение с базой данных и применяет настройки.
+
+    Args:
+        db_path: Путь к файлу базы данных SQLite
+        readonly: Соединение только для чтения (query_only)
+        durable: Сбрасывать журнал на диск при каждой фиксации (synchronous=FULL)
+
+    Returns:
+        Соединение с базой данных (может использоваться из разных потоков
+        при внешней синхронизации)
+    """
+    conn = sqlite3.connect(
+        db_path,
+        timeout=BUSY_TIMEOUT_MS / 1000,
+        check_same_thread=False,
+        cached_statements=CACHED_STATEMENTS,
+    )
+
+    if not readonly:
+        # Режим журнала сохраняется в файле базы данных
+        mode = conn.execute("PRAGMA journal_mode=WAL").fetchone()[0]
+        if mode.lower() != "wal" and db_path != ":memory:":
+            logger.warning(f"Не удалось включить режим WAL для {db_path}: {mode}")
+
+    conn.execute(f"PRAGMA synchronous={'FULL' if durable else 'NORMAL'}")
+    conn.execute(f"PRAGMA cache_size=-{CACHE_SIZE_KB}")
+    conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    if readonly:
+        conn.execute("PRAGMA query_only=ON")
+
+    return conn
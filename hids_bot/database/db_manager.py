@@ -3,126 +3,567 @@
 
 """
 Модуль для работы с базой данных HIDS Telegram Bot.
+
+Запись выполняется через одно долгоживущее соединение (под блокировкой),
+чтение - через отдельные соединения для каждого потока. Настройки
+соединений (WAL и т.д.) - в database.connection.
+
+Инциденты записываются с отложенной фиксацией: add_incident ставит запись
+в очередь BatchWriter, который фиксирует накопленные за несколько
+миллисекунд инциденты одной транзакцией.
+
+Схема базы данных версионируется: изменения описываются миграциями
+(MIGRATIONS), которые применяются при запуске по PRAGMA user_version.
 """
 
 import sqlite3
+import itertools
 import logging
-import datetime
-from typing import List, Tuple, Optional
+import threading
+import contextlib
+from concurrent.futures import Future
+from typing import Any, Dict, Iterable, Iterator, List, Set, Tuple, Optional
+
+from database.batch_writer import BatchWriter, DEFAULT_BATCH_SIZE
+from database.connection import open_connection
+from database.codec import (
+    pack_ip, unpack_ip, network_range, now, to_epoch, to_datetime, format_timestamp
+)
+from utils.alert_types import get_alert_type, UNKNOWN_ALERT_TYPE
+from utils.firewall import parse_target, whitelist_networks, block_rejection
 
 logger = logging.getLogger(__name__)
 
+# Максимальная задержка фиксации инцидентов (в секундах)
+DEFAULT_INCIDENT_DELAY = 0.005
+
+# Миграции схемы: (версия, описание, SQL-запросы). Новые миграции добавляются
+# только в конец списка; уже выпущенные миграции не изменяются.
+MIGRATIONS: List[Tuple[int, str, List[str]]] = [
+    (1, "таблицы инцидентов, блокировок, белого списка и спула уведомлений", [
+        '''
+        CREATE TABLE IF NOT EXISTS incidents (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ip TEXT NOT NULL,
+            reason TEXT NOT NULL,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            is_blocked INTEGER DEFAULT 0
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS blocked_ips (
+            ip TEXT PRIMARY KEY,
+            reason TEXT NOT NULL,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS whitelist (
+            ip TEXT PRIMARY KEY,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        # Уведомления, ожидающие доставки в Telegram (см. database.alert_spool)
+        '''
+        CREATE TABLE IF NOT EXISTS alert_spool (
+            id INTEGER PRIMARY KEY,
+            payload TEXT NOT NULL,
+            created REAL NOT NULL,
+            delivered INTEGER DEFAULT 0
+        )
+        ''',
+    ]),
+    (2, "индексы инцидентов по IP и времени", [
+        # get_incidents_by_ip и UPDATE в add_to_blocked
+        "CREATE INDEX IF NOT EXISTS idx_incidents_ip_timestamp ON incidents (ip, timestamp)",
+        # get_recent_incidents
+        "CREATE INDEX IF NOT EXISTS idx_incidents_timestamp ON incidents (timestamp)",
+    ]),
+    (3, "агрегаты инцидентов по часам и дням (см. database.retention)", [
+        '''
+        CREATE TABLE IF NOT EXISTS incidents_hourly (
+            ip TEXT NOT NULL,
+            bucket DATETIME NOT NULL,
+            reason TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            first_seen DATETIME NOT NULL,
+            last_seen DATETIME NOT NULL,
+            PRIMARY KEY (ip, bucket, reason)
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_incidents_hourly_bucket ON incidents_hourly (bucket)",
+        '''
+        CREATE TABLE IF NOT EXISTS incidents_daily (
+            ip TEXT NOT NULL,
+            bucket DATE NOT NULL,
+            reason TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            first_seen DATETIME NOT NULL,
+            last_seen DATETIME NOT NULL,
+            PRIMARY KEY (ip, bucket, reason)
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_incidents_daily_bucket ON incidents_daily (bucket)",
+    ]),
+    # Время - секунды эпохи (INTEGER), IP - 16 байт (см. database.codec);
+    # pack_ip регистрируется в соединении записи перед миграциями
+    (4, "время в секундах эпохи и упакованные IP в таблицах инцидентов", [
+        '''
+        CREATE TABLE incidents_v4 (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ip BLOB NOT NULL,
+            reason TEXT NOT NULL,
+            timestamp INTEGER NOT NULL DEFAULT (CAST(strftime('%s', 'now') AS INTEGER)),
+            is_blocked INTEGER DEFAULT 0
+        )
+        ''',
+        "INSERT INTO incidents_v4 (id, ip, reason, timestamp, is_blocked) "
+        "SELECT id, pack_ip(ip), reason, COALESCE(CAST(strftime('%s', timestamp) AS INTEGER), 0), is_blocked "
+        "FROM incidents",
+        "DROP TABLE incidents",
+        "ALTER TABLE incidents_v4 RENAME TO incidents",
+        "CREATE INDEX idx_incidents_ip_timestamp ON incidents (ip, timestamp)",
+        "CREATE INDEX idx_incidents_timestamp ON incidents (timestamp)",
+        '''
+        CREATE TABLE incidents_hourly_v4 (
+            ip BLOB NOT NULL,
+            bucket INTEGER NOT NULL,
+            reason TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            first_seen INTEGER NOT NULL,
+            last_seen INTEGER NOT NULL,
+            PRIMARY KEY (ip, bucket, reason)
+        )
+        ''',
+        "INSERT INTO incidents_hourly_v4 "
+        "SELECT pack_ip(ip), CAST(strftime('%s', bucket) AS INTEGER), reason, count, "
+        "CAST(strftime('%s', first_seen) AS INTEGER), CAST(strftime('%s', last_seen) AS INTEGER) "
+        "FROM incidents_hourly",
+        "DROP TABLE incidents_hourly",
+        "ALTER TABLE incidents_hourly_v4 RENAME TO incidents_hourly",
+        "CREATE INDEX idx_incidents_hourly_bucket ON incidents_hourly (bucket)",
+        '''
+        CREATE TABLE incidents_daily_v4 (
+            ip BLOB NOT NULL,
+            bucket INTEGER NOT NULL,
+            reason TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            first_seen INTEGER NOT NULL,
+            last_seen INTEGER NOT NULL,
+            PRIMARY KEY (ip, bucket, reason)
+        )
+        ''',
+        "INSERT INTO incidents_daily_v4 "
+        "SELECT pack_ip(ip), CAST(strftime('%s', bucket) AS INTEGER), reason, count, "
+        "CAST(strftime('%s', first_seen) AS INTEGER), CAST(strftime('%s', last_seen) AS INTEGER) "
+        "FROM incidents_daily",
+        "DROP TABLE incidents_daily",
+        "ALTER TABLE incidents_daily_v4 RENAME TO incidents_daily",
+        "CREATE INDEX idx_incidents_daily_bucket ON incidents_daily (bucket)",
+    ]),
+    # Счетчики обновляются триггером в той же транзакции, что и запись инцидента
+    # (в том числе пакетом BatchWriter), и не меняются при переносе инцидентов
+    # в агрегаты; alert_type регистрируется в соединении записи перед миграциями
+    (5, "тип инцидента и счетчики статистики", [
+        "ALTER TABLE incidents ADD COLUMN type TEXT",
+        "UPDATE incidents SET type = alert_type(reason)",
+        '''
+        CREATE TABLE stats_ip (
+            ip BLOB PRIMARY KEY,
+            count INTEGER NOT NULL,
+            first_seen INTEGER NOT NULL,
+            last_seen INTEGER NOT NULL
+        ) WITHOUT ROWID
+        ''',
+        '''
+        CREATE TABLE stats_ip_daily (
+            bucket INTEGER NOT NULL,
+            ip BLOB NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (bucket, ip)
+        ) WITHOUT ROWID
+        ''',
+        '''
+        CREATE TABLE stats_hourly (
+            bucket INTEGER NOT NULL,
+            type TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (bucket, type)
+        ) WITHOUT ROWID
+        ''',
+        # Начальные значения - по подробным записям и агрегатам (дневные
+        # агрегаты не содержат часа и в почасовые счетчики не входят)
+        "INSERT INTO stats_ip (ip, count, first_seen, last_seen) "
+        "SELECT ip, SUM(count), MIN(first_seen), MAX(last_seen) FROM ("
+        "SELECT ip, COUNT(*) AS count, MIN(timestamp) AS first_seen, MAX(timestamp) AS last_seen "
+        "FROM incidents GROUP BY ip "
+        "UNION ALL SELECT ip, count, first_seen, last_seen FROM incidents_hourly "
+        "UNION ALL SELECT ip, count, first_seen, last_seen FROM incidents_daily"
+        ") GROUP BY ip",
+        "INSERT INTO stats_ip_daily (bucket, ip, count) "
+        "SELECT bucket, ip, SUM(count) FROM ("
+        "SELECT timestamp - timestamp % 86400 AS bucket, ip, 1 AS count FROM incidents "
+        "UNION ALL SELECT bucket - bucket % 86400, ip, count FROM incidents_hourly "
+        "UNION ALL SELECT bucket, ip, count FROM incidents_daily"
+        ") GROUP BY bucket, ip",
+        "INSERT INTO stats_hourly (bucket, type, count) "
+        "SELECT bucket, type, SUM(count) FROM ("
+        "SELECT timestamp - timestamp % 3600 AS bucket, type, 1 AS count FROM incidents "
+        "UNION ALL SELECT bucket, alert_type(reason), count FROM incidents_hourly"
+        ") GROUP BY bucket, type",
+        f'''
+        CREATE TRIGGER incidents_stats AFTER INSERT ON incidents
+        BEGIN
+            INSERT INTO stats_ip (ip, count, first_seen, last_seen)
+            VALUES (NEW.ip, 1, NEW.timestamp, NEW.timestamp)
+            ON CONFLICT (ip) DO UPDATE SET
+                count = count + 1,
+                first_seen = MIN(first_seen, excluded.first_seen),
+                last_seen = MAX(last_seen, excluded.last_seen);
+            INSERT INTO stats_ip_daily (bucket, ip, count)
+            VALUES (NEW.timestamp - NEW.timestamp % 86400, NEW.ip, 1)
+            ON CONFLICT (bucket, ip) DO UPDATE SET count = count + 1;
+            INSERT INTO stats_hourly (bucket, type, count)
+            VALUES (NEW.timestamp - NEW.timestamp % 3600, COALESCE(NEW.type, '{UNKNOWN_ALERT_TYPE}'), 1)
+            ON CONFLICT (bucket, type) DO UPDATE SET count = count + 1;
+        END
+        ''',
+    ]),
+    # Срок временной блокировки (секунды эпохи, NULL - постоянная); частичный
+    # индекс упорядочивает только временные блокировки и служит очередью
+    # истекающих блокировок для utils.ban_scheduler
+    (6, "срок блокировки IP", [
+        "ALTER TABLE blocked_ips ADD COLUMN expires_at INTEGER",
+        "CREATE INDEX idx_blocked_ips_expires_at ON blocked_ips (expires_at) WHERE expires_at IS NOT NULL",
+    ]),
+    # Самые активные IP за день читаются по индексу, без суммирования всех IP
+    # дня (см. get_stats)
+    (7, "индекс счетчиков IP по количеству", [
+        "CREATE INDEX idx_stats_ip_daily_count ON stats_ip_daily (bucket, count)",
+    ]),
+]
+
+# Текущая версия схемы
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+# Значение PRAGMA auto_vacuum для постепенного освобождения места
+AUTO_VACUUM_INCREMENTAL = 2
+
+# Таблицы, доступные для выгрузки и загрузки: (ключ для постраничного чтения, столбцы)
+EXPORT_TABLES: Dict[str, Tuple[str, List[str]]] = {
+    "incidents": ("id", ["id", "ip", "reason", "timestamp", "type", "is_blocked"]),
+    "blocked_ips": ("ip", ["ip", "reason", "timestamp", "expires_at"]),
+    "whitelist": ("ip", ["ip", "timestamp"]),
+}
+
+# Количество строк, читаемых за один запрос при выгрузке
+DEFAULT_EXPORT_BATCH = 5000
+
+# Количество строк в одном executemany и в одной транзакции при загрузке
+DEFAULT_IMPORT_BATCH = 5000
+DEFAULT_IMPORT_TRANSACTION = 50000
+
+# Количество IP-кандидатов в одном запросе get_stats (ограничение SQLite на
+# количество параметров - 999 в старых версиях)
+STATS_IP_CHUNK = 500
+
+# Перенос строк в агрегаты: (исходная таблица, таблица агрегатов, начало периода)
+_ROLLUP_TARGETS = {
+    "incidents": ("incidents_hourly", "timestamp - timestamp % 3600"),
+    "incidents_hourly": ("incidents_daily", "bucket - bucket % 86400"),
+}
+
+def _reason_type(reason: str) -> str:
+    """Определяет тип инцидента по тексту причины."""
+    return get_alert_type({"reason": reason})
+
+def _incident_params(row: Dict[str, Any]) -> Tuple[Any, ...]:
+    """Преобразует выгруженный инцидент в параметры INSERT."""
+    reason = row["reason"]
+    timestamp = row.get("timestamp")
+    return (
+        pack_ip(row["ip"]),
+        reason,
+        to_epoch(timestamp) if timestamp not in (None, "") else now(),
+        row.get("type") or _reason_type(reason),
+        int(row.get("is_blocked") or 0),
+    )
+
 class DatabaseManager:
     """Класс для работы с базой данных SQLite."""
 
-    def __init__(self, db_path: str):
+    def __init__(self, db_path: str, incident_batch_size: int = DEFAULT_BATCH_SIZE,
+                 incident_delay: float = DEFAULT_INCIDENT_DELAY):
         """
         Инициализирует соединение с базой данных и создает таблицы при необходимости.
         
         Args:
             db_path: Путь к файлу базы данных SQLite
+            incident_batch_size: Максимальное количество инцидентов в одной транзакции
+            incident_delay: Максимальная задержка фиксации инцидентов в секундах
         """
         self.db_path = db_path
+        
+        # Соединение для записи (одно на процесс) и соединения для чтения (по одному на поток)
+        self._writer = open_connection(db_path)
+        self._write_lock = threading.RLock()
+        self._local = threading.local()
+        self._readers: List[sqlite3.Connection] = []
+        self._readers_lock = threading.Lock()
+        
         self._create_tables()
+        
+        # Белый список и заблокированные IP в памяти: загружаются один раз и
+        # обновляются при каждом изменении, проверки выполняются без запросов к базе
+        self._whitelist: Set[str] = self._load_ip_set("whitelist")
+        self._blocked: Set[str] = self._load_ip_set("blocked_ips")
+        
+        # Отложенная пакетная запись инцидентов (для базы в памяти - через соединение записи)
+        self._incident_writer: Optional[BatchWriter] = None
+        if db_path != ":memory:":
+            self._incident_writer = BatchWriter(
+                db_path, batch_size=incident_batch_size, max_delay=incident_delay,
+                name="incident-writer"
+            )
     
     def _get_connection(self) -> sqlite3.Connection:
         """
-        Получает соединение с базой данных.
+        Получает соединение с базой данных для чтения в текущем потоке.
         
         Returns:
             Соединение с базой данных
         """
-        return sqlite3.connect(self.db_path)
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # В памяти у каждого соединения своя база - читаем через соединение записи
+            if self.db_path == ":memory:":
+                return self._writer
+            conn = open_connection(self.db_path, readonly=True)
+            self._local.conn = conn
+            with self._readers_lock:
+                self._readers.append(conn)
+        return conn
     
-    def _create_tables(self) -> None:
-        """Создает необходимые таблицы в базе данных, если они не существуют."""
+    @contextlib.contextmanager
+    def _write(self) -> Iterator[sqlite3.Cursor]:
+        """
+        Выполняет запись в одной транзакции через соединение записи.
+        
+        Yields:
+            Курсор соединения записи; транзакция фиксируется при выходе из блока
+            и откатывается при исключении
+        """
+        with self._write_lock:
+            cursor = self._writer.cursor()
+            try:
+                yield cursor
+                self._writer.commit()
+            except BaseException:
+                self._writer.rollback()
+                raise
+            finally:
+                cursor.close()
+    
+    @contextlib.contextmanager
+    def _read(self) -> Iterator[sqlite3.Cursor]:
+        """
+        Возвращает курсор соединения для чтения текущего потока.
+        
+        Yields:
+            Курсор соединения для чтения
+        """
         conn = self._get_connection()
+        if conn is self._writer:
+            with self._write_lock:
+                cursor = conn.cursor()
+                try:
+                    yield cursor
+                finally:
+                    cursor.close()
+            return
+        
         cursor = conn.cursor()
+        try:
+            yield cursor
+        finally:
+            cursor.close()
+            # Завершаем неявную транзакцию чтения, чтобы не удерживать снимок WAL
+            if conn.in_transaction:
+                conn.rollback()
+    
+    def flush(self, timeout: Optional[float] = None) -> None:
+        """
+        Дожидается фиксации всех ранее добавленных инцидентов.
         
-        # Таблица инцидентов
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS incidents (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            ip TEXT NOT NULL,
-            reason TEXT NOT NULL,
-            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-            is_blocked INTEGER DEFAULT 0
-        )
-        ''')
+        Args:
+            timeout: Максимальное время ожидания в секундах
+        """
+        if self._incident_writer:
+            self._incident_writer.flush(timeout)
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Возвращает метрики записи инцидентов.
         
-        # Таблица заблокированных IP
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS blocked_ips (
-            ip TEXT PRIMARY KEY,
-            reason TEXT NOT NULL,
-            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-        )
-        ''')
+        Returns:
+            Словарь с количеством пакетов, средним размером пакета и временем фиксации
+        """
+        return self._incident_writer.stats() if self._incident_writer else {}
+    
+    def close(self) -> None:
+        """Записывает отложенные инциденты и закрывает все соединения с базой данных."""
+        if self._incident_writer:
+            self._incident_writer.close()
         
-        # Таблица белого списка IP
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS whitelist (
-            ip TEXT PRIMARY KEY,
-            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-        )
-        ''')
+        with self._readers_lock:
+            for conn in self._readers:
+                conn.close()
+            self._readers.clear()
+        self._local = threading.local()
         
-        conn.commit()
-        conn.close()
+        with self._write_lock:
+            self._writer.close()
     
-    def add_incident(self, ip: str, reason: str) -> None:
+    def _create_tables(self) -> None:
+        """
+        Создает таблицы и применяет миграции схемы.
+        
+        Версия схемы хранится в PRAGMA user_version; каждая миграция из
+        MIGRATIONS с номером больше текущего выполняется в отдельной
+        транзакции вместе с обновлением версии. Существующие файлы базы
+        (в том числе созданные до появления миграций, с версией 0)
+        обновляются на месте.
+        """
+        # Используются миграциями 4 и 5 для упаковки IP-адресов и определения типа
+        self._writer.create_function("pack_ip", 1, pack_ip, deterministic=True)
+        self._writer.create_function("alert_type", 1, _reason_type, deterministic=True)
+        
+        with self._write() as cursor:
+            cursor.execute("PRAGMA user_version")
+            version = cursor.fetchone()[0]
+        
+        if version > SCHEMA_VERSION:
+            logger.warning(
+                f"Версия схемы базы данных ({version}) новее поддерживаемой ({SCHEMA_VERSION})"
+            )
+            return
+        
+        for number, description, statements in MIGRATIONS:
+            if number <= version:
+                continue
+            
+            with self._write() as cursor:
+                # DDL не открывает транзакцию неявно - начинаем ее явно
+                cursor.execute("BEGIN IMMEDIATE")
+                for sql in statements:
+                    cursor.execute(sql)
+                cursor.execute(f"PRAGMA user_version = {number}")
+            logger.info(f"Применена миграция базы данных {number}: {description}")
+        
+        # Постепенная очистка освобождает место после удаления старых инцидентов
+        # (см. incremental_vacuum). Режим меняется только перестроением базы,
+        # которое выполняется один раз до запуска потоков записи.
+        with self._write_lock:
+            mode = self._writer.execute("PRAGMA auto_vacuum").fetchone()[0]
+            if mode != AUTO_VACUUM_INCREMENTAL:
+                logger.info("Перестроение базы данных для постепенной очистки (однократно)")
+                self._writer.execute(f"PRAGMA auto_vacuum = {AUTO_VACUUM_INCREMENTAL}")
+                self._writer.execute("VACUUM")
+    
+    def _load_ip_set(self, table: str) -> Set[str]:
+        """
+        Загружает множество IP-адресов из таблицы.
+        
+        Args:
+            table: Таблица со столбцом ip (whitelist или blocked_ips)
+        
+        Returns:
+            Множество IP-адресов
+        """
+        with self._write() as cursor:
+            cursor.execute(f"SELECT ip FROM {table}")
+            return {row[0] for row in cursor.fetchall()}
+    
+    def add_incident(self, ip: str, reason: str, wait: bool = False,
+                     alert_type: Optional[str] = None, block: bool = True) -> Optional[Future]:
         """
         Добавляет новый инцидент в базу данных.
         
+        Инцидент фиксируется в фоне вместе с другими (см. BatchWriter), счетчики
+        статистики обновляются в той же транзакции. Из событийного цикла
+        вызывайте с block=False, а при queue.Full повторяйте вызов в потоке пула.
+        
         Args:
             ip: IP-адрес источника инцидента
             reason: Причина/описание инцидента
+            wait: Дождаться фиксации транзакции (переживает аварийное завершение
+                бота, но не сбой питания - см. database.connection)
+            alert_type: Тип инцидента (по умолчанию определяется по причине)
+            block: Ожидать, если очередь записи заполнена
+            
+        Returns:
+            Future, который завершается после фиксации (None при записи без очереди)
+        
+        Raises:
+            queue.Full: Если очередь записи заполнена и block=False
         """
-        conn = self._get_connection()
-        cursor = conn.cursor()
+        params = (pack_ip(ip), reason, now(), alert_type or _reason_type(reason))
         
-        try:
-            cursor.execute(
-                "INSERT INTO incidents (ip, reason) VALUES (?, ?)",
-                (ip, reason)
-            )
-            conn.commit()
-            logger.info(f"Добавлен инцидент: IP={ip}, причина={reason}")
-        except sqlite3.Error as e:
-            logger.error(f"Ошибка при добавлении инцидента: {e}")
-        finally:
-            conn.close()
+        if self._incident_writer is None:
+            try:
+                with self._write() as cursor:
+                    cursor.execute(
+                        "INSERT INTO incidents (ip, reason, timestamp, type) VALUES (?, ?, ?, ?)",
+                        params
+                    )
+                logger.debug(f"Добавлен инцидент: IP={ip}, причина={reason}")
+            except sqlite3.Error as e:
+                logger.error(f"Ошибка при добавлении инцидента: {e}")
+            return None
+        
+        # Время фиксируется при вызове, а не при отложенной записи
+        future = self._incident_writer.submit(
+            "INSERT INTO incidents (ip, reason, timestamp, type) VALUES (?, ?, ?, ?)",
+            params, block=block
+        )
+        logger.debug(f"Добавлен инцидент: IP={ip}, причина={reason}")
+        
+        if wait:
+            try:
+                future.result()
+            except sqlite3.Error as e:
+                logger.error(f"Ошибка при добавлении инцидента: {e}")
+        return future
     
-    def add_to_blocked(self, ip: str, reason: str) -> None:
+    def add_to_blocked(self, ip: str, reason: str, expires_at: Optional[int] = None) -> None:
         """
         Добавляет IP в список заблокированных.
         
         Args:
             ip: IP-адрес для блокировки
             reason: Причина блокировки
+            expires_at: Время окончания блокировки (секунды эпохи, None - постоянно)
         """
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        
         try:
-            # Добавляем IP в таблицу заблокированных
-            cursor.execute(
-                "INSERT OR REPLACE INTO blocked_ips (ip, reason) VALUES (?, ?)",
-                (ip, reason)
-            )
-            
-            # Обновляем статус инцидентов для этого IP
-            cursor.execute(
-                "UPDATE incidents SET is_blocked = 1 WHERE ip = ?",
-                (ip,)
-            )
-            
-            conn.commit()
+            # Множество в памяти меняется под той же блокировкой после фиксации,
+            # поэтому порядок изменений совпадает с порядком записи в базу
+            with self._write_lock:
+                with self._write() as cursor:
+                    # Добавляем IP в таблицу заблокированных
+                    cursor.execute(
+                        "INSERT OR REPLACE INTO blocked_ips (ip, reason, expires_at) VALUES (?, ?, ?)",
+                        (ip, reason, expires_at)
+                    )
+                    
+                    # Обновляем статус инцидентов для этого IP
+                    cursor.execute(
+                        "UPDATE incidents SET is_blocked = 1 WHERE ip = ?",
+                        (pack_ip(ip),)
+                    )
+                self._blocked.add(ip)
             logger.info(f"IP {ip} заблокирован: {reason}")
         except sqlite3.Error as e:
             logger.error(f"Ошибка при блокировке IP: {e}")
-        finally:
-            conn.close()
     
     def remove_from_blocked(self, ip: str) -> None:
         """
@@ -131,20 +572,130 @@ class DatabaseManager:
         Args:
             ip: IP-адрес для разблокировки
         """
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        
         try:
-            cursor.execute(
-                "DELETE FROM blocked_ips WHERE ip = ?",
-                (ip,)
-            )
-            conn.commit()
+            with self._write_lock:
+                with self._write() as cursor:
+                    cursor.execute(
+                        "DELETE FROM blocked_ips WHERE ip = ?",
+                        (ip,)
+                    )
+                self._blocked.discard(ip)
             logger.info(f"IP {ip} разблокирован")
         except sqlite3.Error as e:
             logger.error(f"Ошибка при разблокировке IP: {e}")
-        finally:
-            conn.close()
+    
+    def add_many_to_blocked(self, ips: Iterable[str], reason: str, expires_at: Optional[int] = None) -> None:
+        """
+        Добавляет список IP в список заблокированных одной транзакцией.
+        
+        Args:
+            ips: IP-адреса для блокировки
+            reason: Причина блокировки
+            expires_at: Время окончания блокировки (секунды эпохи, None - постоянно)
+        """
+        ips = list(ips)
+        try:
+            with self._write_lock:
+                with self._write() as cursor:
+                    cursor.executemany(
+                        "INSERT OR REPLACE INTO blocked_ips (ip, reason, expires_at) VALUES (?, ?, ?)",
+                        [(ip, reason, expires_at) for ip in ips]
+                    )
+                    cursor.executemany(
+                        "UPDATE incidents SET is_blocked = 1 WHERE ip = ?",
+                        [(pack_ip(ip),) for ip in ips]
+                    )
+                self._blocked.update(ips)
+            logger.info(f"Заблокировано IP: {len(ips)} ({reason})")
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка при блокировке IP: {e}")
+    
+    def remove_many_from_blocked(self, ips: Iterable[str]) -> None:
+        """
+        Удаляет список IP из списка заблокированных одной транзакцией.
+        
+        Args:
+            ips: IP-адреса для разблокировки
+        """
+        ips = list(ips)
+        try:
+            with self._write_lock:
+                with self._write() as cursor:
+                    cursor.executemany(
+                        "DELETE FROM blocked_ips WHERE ip = ?",
+                        [(ip,) for ip in ips]
+                    )
+                self._blocked.difference_update(ips)
+            logger.info(f"Разблокировано IP: {len(ips)}")
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка при разблокировке IP: {e}")
+    
+    def get_ban_expiry(self, ip: str) -> Optional[int]:
+        """
+        Возвращает время окончания блокировки IP.
+        
+        Args:
+            ip: IP-адрес
+        
+        Returns:
+            Секунды эпохи или None (постоянная блокировка или IP не заблокирован)
+        """
+        try:
+            with self._read() as cursor:
+                cursor.execute("SELECT expires_at FROM blocked_ips WHERE ip = ?", (ip,))
+                row = cursor.fetchone()
+                return row[0] if row else None
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка при получении срока блокировки IP: {e}")
+            return None
+    
+    def get_next_ban_expiry(self) -> Optional[int]:
+        """
+        Возвращает время окончания ближайшей временной блокировки.
+        
+        Returns:
+            Секунды эпохи или None, если временных блокировок нет
+        """
+        try:
+            with self._read() as cursor:
+                cursor.execute(
+                    "SELECT expires_at FROM blocked_ips WHERE expires_at IS NOT NULL "
+                    "ORDER BY expires_at LIMIT 1"
+                )
+                row = cursor.fetchone()
+                return row[0] if row else None
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка при получении срока блокировки: {e}")
+            return None
+    
+    def pop_expired_bans(self, until: int, limit: int) -> List[str]:
+        """
+        Удаляет из списка заблокированных IP с истекшим сроком блокировки.
+        
+        Выборка и удаление выполняются в одной транзакции, поэтому блокировка,
+        продленная в это время, не будет снята.
+        
+        Args:
+            until: Время (секунды эпохи): удаляются блокировки, истекшие к этому моменту
+            limit: Максимальное количество удаляемых IP
+        
+        Returns:
+            Список удаленных IP (в порядке окончания блокировки)
+        """
+        try:
+            with self._write_lock:
+                with self._write() as cursor:
+                    cursor.execute(
+                        "SELECT ip FROM blocked_ips WHERE expires_at <= ? ORDER BY expires_at LIMIT ?",
+                        (until, limit)
+                    )
+                    ips = [row[0] for row in cursor.fetchall()]
+                    cursor.executemany("DELETE FROM blocked_ips WHERE ip = ?", [(ip,) for ip in ips])
+                self._blocked.difference_update(ips)
+            return ips
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка при снятии истекших блокировок: {e}")
+            return []
     
     def add_to_whitelist(self, ip: str) -> None:
         """
@@ -153,20 +704,17 @@ class DatabaseManager:
         Args:
             ip: IP-адрес для добавления в белый список
         """
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        
         try:
-            cursor.execute(
-                "INSERT OR REPLACE INTO whitelist (ip) VALUES (?)",
-                (ip,)
-            )
-            conn.commit()
+            with self._write_lock:
+                with self._write() as cursor:
+                    cursor.execute(
+                        "INSERT OR REPLACE INTO whitelist (ip) VALUES (?)",
+                        (ip,)
+                    )
+                self._whitelist.add(ip)
             logger.info(f"IP {ip} добавлен в белый список")
         except sqlite3.Error as e:
             logger.error(f"Ошибка при добавлении IP в белый список: {e}")
-        finally:
-            conn.close()
     
     def remove_from_whitelist(self, ip: str) -> None:
         """
@@ -175,20 +723,17 @@ class DatabaseManager:
         Args:
             ip: IP-адрес для удаления из белого списка
         """
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        
         try:
-            cursor.execute(
-                "DELETE FROM whitelist WHERE ip = ?",
-                (ip,)
-            )
-            conn.commit()
+            with self._write_lock:
+                with self._write() as cursor:
+                    cursor.execute(
+                        "DELETE FROM whitelist WHERE ip = ?",
+                        (ip,)
+                    )
+                self._whitelist.discard(ip)
             logger.info(f"IP {ip} удален из белого списка")
         except sqlite3.Error as e:
             logger.error(f"Ошибка при удалении IP из белого списка: {e}")
-        finally:
-            conn.close()
     
     def is_in_whitelist(self, ip: str) -> bool:
         """
@@ -196,25 +741,43 @@ class DatabaseManager:
         
         Args:
             ip: IP-адрес для проверки
-            
+        
         Returns:
             True если IP в белом списке, иначе False
         """
-        conn = self._get_connection()
-        cursor = conn.cursor()
+        return ip in self._whitelist
+    
+    def is_blocked(self, ip: str) -> bool:
+        """
+        Проверяет, находится ли IP в списке заблокированных.
         
-        try:
-            cursor.execute(
-                "SELECT 1 FROM whitelist WHERE ip = ? LIMIT 1",
-                (ip,)
-            )
-            result = cursor.fetchone() is not None
-            return result
-        except sqlite3.Error as e:
-            logger.error(f"Ошибка при проверке белого списка: {e}")
-            return False
-        finally:
-            conn.close()
+        Args:
+            ip: IP-адрес для проверки
+        
+        Returns:
+            True если IP заблокирован, иначе False
+        """
+        return ip in self._blocked
+    
+    def get_blocked_ip_set(self) -> Set[str]:
+        """
+        Возвращает множество заблокированных IP (копию, без запроса к базе).
+        
+        Returns:
+            Множество IP-адресов и подсетей
+        """
+        with self._write_lock:
+            return set(self._blocked)
+    
+    def get_whitelist_ip_set(self) -> Set[str]:
+        """
+        Возвращает множество IP из белого списка (копию, без запроса к базе).
+        
+        Returns:
+            Множество IP-адресов
+        """
+        with self._write_lock:
+            return set(self._whitelist)
     
     def get_blocked_ips(self) -> List[Tuple[str, str, str]]:
         """
@@ -223,19 +786,15 @@ class DatabaseManager:
         Returns:
             Список кортежей (ip, reason, timestamp)
         """
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        
         try:
-            cursor.execute(
-                "SELECT ip, reason, timestamp FROM blocked_ips ORDER BY timestamp DESC"
-            )
-            return cursor.fetchall()
+            with self._read() as cursor:
+                cursor.execute(
+                    "SELECT ip, reason, timestamp FROM blocked_ips ORDER BY timestamp DESC"
+                )
+                return cursor.fetchall()
         except sqlite3.Error as e:
             logger.error(f"Ошибка при получении списка заблокированных IP: {e}")
             return []
-        finally:
-            conn.close()
     
     def get_whitelist(self) -> List[Tuple[str, str]]:
         """
@@ -244,19 +803,15 @@ class DatabaseManager:
         Returns:
             Список кортежей (ip, timestamp)
         """
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        
         try:
-            cursor.execute(
-                "SELECT ip, timestamp FROM whitelist ORDER BY timestamp DESC"
-            )
-            return cursor.fetchall()
+            with self._read() as cursor:
+                cursor.execute(
+                    "SELECT ip, timestamp FROM whitelist ORDER BY timestamp DESC"
+                )
+                return cursor.fetchall()
         except sqlite3.Error as e:
             logger.error(f"Ошибка при получении белого списка: {e}")
             return []
-        finally:
-            conn.close()
     
     def get_recent_incidents(self, limit: int = 10) -> List[Tuple[str, str, str, int]]:
         """
@@ -264,25 +819,25 @@ class DatabaseManager:
         
         Args:
             limit: Максимальное количество инцидентов
-            
+        
         Returns:
-            Список кортежей (ip, reason, timestamp, is_blocked)
+            Список кортежей (ip, reason, timestamp, is_blocked); timestamp -
+            строка "YYYY-MM-DD HH:MM:SS" (UTC)
         """
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        
         try:
-            cursor.execute(
-                "SELECT ip, reason, timestamp, is_blocked FROM incidents "
-                "ORDER BY timestamp DESC LIMIT ?",
-                (limit,)
-            )
-            return cursor.fetchall()
+            with self._read() as cursor:
+                cursor.execute(
+                    "SELECT ip, reason, timestamp, is_blocked FROM incidents "
+                    "ORDER BY timestamp DESC LIMIT ?",
+                    (limit,)
+                )
+                return [
+                    (unpack_ip(ip), reason, format_timestamp(timestamp), is_blocked)
+                    for ip, reason, timestamp, is_blocked in cursor.fetchall()
+                ]
         except sqlite3.Error as e:
             logger.error(f"Ошибка при получении списка инцидентов: {e}")
             return []
-        finally:
-            conn.close()
     
     def get_incidents_by_ip(self, ip: str) -> List[dict]:
         """
@@ -290,33 +845,615 @@ class DatabaseManager:
         
         Args:
             ip: IP-адрес для поиска
-            
+        
         Returns:
             Список словарей с информацией об инцидентах для данного IP
         """
-        conn = self._get_connection()
-        cursor = conn.cursor()
+        try:
+            with self._read() as cursor:
+                cursor.execute(
+                    "SELECT id, reason, timestamp, is_blocked FROM incidents "
+                    "WHERE ip = ? ORDER BY timestamp DESC",
+                    (pack_ip(ip),)
+                )
+                
+                incidents = []
+                for row in cursor.fetchall():
+                    incidents.append({
+                        "id": row[0],
+                        "ip": ip,
+                        "reason": row[1],
+                        "timestamp": to_datetime(row[2]),
+                        "is_blocked": bool(row[3])
+                    })
+                
+                return incidents
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка при получении инцидентов для IP {ip}: {e}")
+            return []
+    
+    def get_incidents_page(self, ip: Optional[str] = None, limit: int = 10,
+                           before: Optional[Tuple[int, int]] = None,
+                           after: Optional[Tuple[int, int]] = None) -> List[Tuple[int, str, str, int, int]]:
+        """
+        Возвращает одну страницу инцидентов (новые сначала).
+        
+        Страницы выбираются по ключу (timestamp, id) через индекс, поэтому
+        время запроса не зависит от номера страницы и количества инцидентов.
+        
+        Args:
+            ip: IP-адрес (None - инциденты всех IP)
+            limit: Размер страницы
+            before: Ключ (timestamp, id): инциденты старше него (следующая страница)
+            after: Ключ (timestamp, id): инциденты новее него (предыдущая страница)
+        
+        Returns:
+            Список кортежей (id, ip, reason, timestamp, is_blocked) - не более
+            limit строк, от новых к старым; timestamp - секунды эпохи
+        """
+        conditions = []
+        params: List[Any] = []
+        if ip is not None:
+            conditions.append("ip = ?")
+            params.append(pack_ip(ip))
+        if before is not None:
+            conditions.append("(timestamp, id) < (?, ?)")
+            params.extend(before)
+        elif after is not None:
+            conditions.append("(timestamp, id) > (?, ?)")
+            params.extend(after)
+        
+        # Предыдущая страница выбирается в прямом порядке от ключа и разворачивается
+        order = "ASC" if before is None and after is not None else "DESC"
+        where = f"WHERE {' AND '.join(conditions)} " if conditions else ""
+        params.append(limit)
         
         try:
-            cursor.execute(
-                "SELECT id, ip, reason, timestamp, is_blocked FROM incidents "
-                "WHERE ip = ? ORDER BY timestamp DESC",
-                (ip,)
-            )
+            with self._read() as cursor:
+                cursor.execute(
+                    "SELECT id, ip, reason, timestamp, is_blocked FROM incidents "
+                    f"{where}ORDER BY timestamp {order}, id {order} LIMIT ?",
+                    params
+                )
+                rows = self._unpack_incidents(cursor.fetchall())
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка при получении страницы инцидентов: {e}")
+            return []
+        
+        if order == "ASC":
+            rows.reverse()
+        return rows
+    
+    def get_incidents_in_network(self, cidr: str, since: Optional[Any] = None, until: Optional[Any] = None,
+                                 limit: int = 1000) -> List[Tuple[int, str, str, int, int]]:
+        """
+        Возвращает инциденты из подсети за период (новые сначала).
+        
+        Подсеть - непрерывный диапазон упакованных адресов, поэтому запрос
+        выполняется диапазонным поиском по индексу (ip, timestamp).
+        
+        Args:
+            cidr: Подсеть ("203.0.113.0/24", "2001:db8::/32") или отдельный адрес
+            since: Начало периода включительно (секунды эпохи, строка или datetime)
+            until: Конец периода не включительно (секунды эпохи, строка или datetime)
+            limit: Максимальное количество инцидентов
+        
+        Returns:
+            Список кортежей (id, ip, reason, timestamp, is_blocked)
+        """
+        try:
+            first, last = network_range(cidr)
+        except ValueError as e:
+            logger.error(f"Некорректная подсеть {cidr}: {e}")
+            return []
+        conditions = ["ip BETWEEN ? AND ?"]
+        params: List[Any] = [first, last]
+        if since is not None:
+            conditions.append("timestamp >= ?")
+            params.append(to_epoch(since))
+        if until is not None:
+            conditions.append("timestamp < ?")
+            params.append(to_epoch(until))
+        params.append(limit)
+        
+        try:
+            with self._read() as cursor:
+                cursor.execute(
+                    "SELECT id, ip, reason, timestamp, is_blocked FROM incidents "
+                    f"WHERE {' AND '.join(conditions)} LIMIT ?",
+                    params
+                )
+                rows = self._unpack_incidents(cursor.fetchall())
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка при получении инцидентов для подсети {cidr}: {e}")
+            return []
+        
+        # Строки упорядочены по (ip, timestamp); сортировка результата дешевле
+        # сортировки всей подсети в запросе
+        rows.sort(key=lambda row: (row[3], row[0]), reverse=True)
+        return rows
+    
+    @staticmethod
+    def _unpack_incidents(rows: List[Tuple]) -> List[Tuple[int, str, str, int, int]]:
+        """Распаковывает IP-адреса в строках (id, ip, reason, timestamp, is_blocked)."""
+        return [
+            (incident_id, unpack_ip(ip), reason, timestamp, is_blocked)
+            for incident_id, ip, reason, timestamp, is_blocked in rows
+        ]
+    
+    def rollup_incidents(self, before: int, batch_size: int = 1000) -> int:
+        """
+        Переносит пакет инцидентов старше указанного времени в почасовые агрегаты.
+        
+        Инциденты суммируются по (IP, час, причина) и удаляются из incidents
+        в той же транзакции. Пакет ограничен, чтобы не блокировать запись
+        новых инцидентов надолго.
+        
+        Args:
+            before: Граница времени (секунды эпохи)
+            batch_size: Максимальное количество строк за вызов
+        
+        Returns:
+            Количество перенесенных инцидентов (0 - переносить больше нечего)
+        """
+        return self._rollup("incidents", "timestamp", before, batch_size)
+    
+    def rollup_hourly(self, before: int, batch_size: int = 1000) -> int:
+        """
+        Переносит пакет почасовых агрегатов старше указанного времени в дневные.
+        
+        Args:
+            before: Граница времени (секунды эпохи)
+            batch_size: Максимальное количество строк за вызов
+        
+        Returns:
+            Количество перенесенных строк (0 - переносить больше нечего)
+        """
+        return self._rollup("incidents_hourly", "bucket", before, batch_size)
+    
+    def _rollup(self, source: str, time_column: str, before: int, batch_size: int) -> int:
+        """Переносит пакет строк таблицы source в агрегаты следующего уровня."""
+        target, bucket = _ROLLUP_TARGETS[source]
+        count = "1" if source == "incidents" else "count"
+        first_seen = "timestamp" if source == "incidents" else "first_seen"
+        last_seen = "timestamp" if source == "incidents" else "last_seen"
+        
+        try:
+            with self._write() as cursor:
+                # Пакет выбирается по индексу времени и запоминается по rowid
+                cursor.execute("CREATE TEMP TABLE IF NOT EXISTS rollup_batch (id INTEGER PRIMARY KEY)")
+                cursor.execute("DELETE FROM temp.rollup_batch")
+                cursor.execute(
+                    f"INSERT INTO temp.rollup_batch SELECT rowid FROM {source} "
+                    f"WHERE {time_column} < ? ORDER BY {time_column} LIMIT ?",
+                    (before, batch_size)
+                )
+                moved = cursor.rowcount
+                if moved <= 0:
+                    return 0
+                
+                cursor.execute(
+                    f"INSERT INTO {target} (ip, bucket, reason, count, first_seen, last_seen) "
+                    f"SELECT ip, {bucket}, reason, SUM({count}), MIN({first_seen}), MAX({last_seen}) "
+                    f"FROM {source} WHERE rowid IN (SELECT id FROM temp.rollup_batch) "
+                    f"GROUP BY 1, 2, 3 "
+                    f"ON CONFLICT (ip, bucket, reason) DO UPDATE SET "
+                    f"count = count + excluded.count, "
+                    f"first_seen = MIN(first_seen, excluded.first_seen), "
+                    f"last_seen = MAX(last_seen, excluded.last_seen)"
+                )
+                cursor.execute(f"DELETE FROM {source} WHERE rowid IN (SELECT id FROM temp.rollup_batch)")
+            return moved
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка при переносе {source} в {target}: {e}")
+            return 0
+    
+    def prune_stats(self, before: int, batch_size: int = 1000) -> int:
+        """
+        Удаляет пакет счетчиков статистики по дням и часам старше указанного времени.
+        
+        Args:
+            before: Граница времени (секунды эпохи)
+            batch_size: Максимальное количество строк stats_ip_daily за вызов
+        
+        Returns:
+            Количество удаленных строк (меньше batch_size - удалять больше нечего)
+        """
+        try:
+            with self._write() as cursor:
+                cursor.execute(
+                    "DELETE FROM stats_ip_daily WHERE (bucket, ip) IN ("
+                    "SELECT bucket, ip FROM stats_ip_daily WHERE bucket < ? ORDER BY bucket LIMIT ?)",
+                    (before, batch_size)
+                )
+                deleted = cursor.rowcount
+                if deleted < batch_size:
+                    # Почасовых строк немного (часы x типы) - удаляются сразу
+                    cursor.execute("DELETE FROM stats_hourly WHERE bucket < ?", (before,))
+                    deleted += cursor.rowcount
+            return deleted
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка при очистке счетчиков статистики: {e}")
+            return 0
+    
+    def prune_stats_ip(self, before: int, after: Optional[Any] = None,
+                       batch_size: int = 1000) -> Tuple[Optional[Any], int]:
+        """
+        Удаляет счетчики IP без инцидентов после указанного времени.
+        
+        Таблица просматривается пакетами по первичному ключу (индекса по
+        last_seen нет, чтобы не замедлять запись инцидентов), поэтому полный
+        проход - одно чтение таблицы.
+        
+        Args:
+            before: Граница времени (секунды эпохи)
+            after: Ключ, после которого начинается пакет (None - с начала таблицы)
+            batch_size: Количество просматриваемых строк за вызов
+        
+        Returns:
+            Кортеж (ключ для следующего вызова или None, если таблица просмотрена;
+            количество удаленных строк)
+        """
+        # IP хранятся как BLOB или текст, а любой текст не меньше пустой строки
+        condition, start = ("ip >= ?", "") if after is None else ("ip > ?", after)
+        try:
+            with self._write() as cursor:
+                cursor.execute(
+                    f"SELECT ip FROM stats_ip WHERE {condition} ORDER BY ip LIMIT ?",
+                    (start, batch_size)
+                )
+                keys = [row[0] for row in cursor.fetchall()]
+                if not keys:
+                    return None, 0
+                cursor.execute(
+                    "DELETE FROM stats_ip WHERE ip >= ? AND ip <= ? AND last_seen < ?",
+                    (keys[0], keys[-1], before)
+                )
+                return (keys[-1] if len(keys) == batch_size else None), cursor.rowcount
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка при очистке счетчиков IP: {e}")
+            return None, 0
+    
+    def incremental_vacuum(self, pages: int = 1000) -> int:
+        """
+        Возвращает операционной системе часть свободных страниц файла базы.
+        
+        Args:
+            pages: Максимальное количество освобождаемых страниц
+        
+        Returns:
+            Количество свободных страниц, оставшихся в файле
+        """
+        try:
+            with self._write_lock:
+                # execute выполняет только первый шаг прагмы (одна страница),
+                # executescript - все шаги
+                self._writer.executescript(f"PRAGMA incremental_vacuum({int(pages)});")
+                return self._writer.execute("PRAGMA freelist_count").fetchone()[0]
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка при очистке базы данных: {e}")
+            return 0
+    
+    def get_incident_rollups(self, limit: int = 10, before: Optional[int] = None) -> List[Tuple[int, str, str, int]]:
+        """
+        Возвращает последние почасовые агрегаты инцидентов (для периодов,
+        подробные записи о которых уже удалены).
+        
+        Args:
+            limit: Максимальное количество строк
+            before: Возвращать только периоды раньше указанного времени (секунды эпохи)
+        
+        Returns:
+            Список кортежей (начало часа, ip, reason, count); время - секунды эпохи
+        """
+        try:
+            with self._read() as cursor:
+                if before is None:
+                    cursor.execute(
+                        "SELECT bucket, ip, reason, count FROM incidents_hourly "
+                        "ORDER BY bucket DESC LIMIT ?",
+                        (limit,)
+                    )
+                else:
+                    cursor.execute(
+                        "SELECT bucket, ip, reason, count FROM incidents_hourly "
+                        "WHERE bucket < ? ORDER BY bucket DESC LIMIT ?",
+                        (before, limit)
+                    )
+                return [
+                    (bucket, unpack_ip(ip), reason, count)
+                    for bucket, ip, reason, count in cursor.fetchall()
+                ]
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка при получении агрегатов инцидентов: {e}")
+            return []
+    
+    def get_ip_rollup_summary(self, ip: str) -> List[Tuple[str, int, int, int]]:
+        """
+        Возвращает сводку по агрегированным (старым) инцидентам для IP-адреса.
+        
+        Args:
+            ip: IP-адрес для поиска
+        
+        Returns:
+            Список кортежей (reason, count, first_seen, last_seen), по убыванию
+            count; время - секунды эпохи
+        """
+        try:
+            with self._read() as cursor:
+                cursor.execute(
+                    "SELECT reason, SUM(count), MIN(first_seen), MAX(last_seen) FROM ("
+                    "SELECT reason, count, first_seen, last_seen FROM incidents_hourly WHERE ip = ? "
+                    "UNION ALL "
+                    "SELECT reason, count, first_seen, last_seen FROM incidents_daily WHERE ip = ?"
+                    ") GROUP BY reason",
+                    (pack_ip(ip), pack_ip(ip))
+                )
+                return sorted(cursor.fetchall(), key=lambda row: row[1], reverse=True)
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка при получении агрегатов инцидентов для IP {ip}: {e}")
+            return []
+    
+    def get_stats(self, since: Any, until: Optional[Any] = None, alert_type: Optional[str] = None,
+                  limit: int = 10) -> Dict[str, Any]:
+        """
+        Возвращает статистику инцидентов за период по счетчикам.
+        
+        Время выполнения зависит только от длины периода, но не от количества
+        инцидентов и различных IP. Начало периода округляется вниз до часа
+        (до суток для top_ips).
+        
+        top_ips выбираются среди limit самых активных IP каждого дня периода
+        (по индексу), и для них суммируются точные количества. IP, ни в один
+        день не входивший в limit самых активных, в top_ips не попадает.
+        
+        Args:
+            since: Начало периода (секунды эпохи, строка или datetime)
+            until: Конец периода не включительно (по умолчанию - текущее время)
+            alert_type: Учитывать в total и hourly только инциденты этого типа
+            limit: Количество IP в top_ips
+        
+        Returns:
+            Словарь:
+                total - количество инцидентов,
+                by_type - список (тип, количество) по убыванию количества,
+                hourly - список (начало часа, количество) по возрастанию времени,
+                top_ips - список (ip, количество) по убыванию количества
+        """
+        since = to_epoch(since)
+        until = to_epoch(until) if until is not None else now() + 1
+        
+        by_type: Dict[str, int] = {}
+        hourly: Dict[int, int] = {}
+        ips: Dict[Any, int] = {}
+        days = range(since - since % 86400, until, 86400)
+        try:
+            with self._read() as cursor:
+                cursor.execute(
+                    "SELECT bucket, type, count FROM stats_hourly WHERE bucket >= ? AND bucket < ?",
+                    (since - since % 3600, until)
+                )
+                # Строк не больше, чем часов в периоде, умноженных на количество типов
+                for bucket, row_type, count in cursor.fetchall():
+                    by_type[row_type] = by_type.get(row_type, 0) + count
+                    if alert_type is None or row_type == alert_type:
+                        hourly[bucket] = hourly.get(bucket, 0) + count
+                
+                # IP за день может быть сколько угодно (распределенная атака), поэтому
+                # читаются только кандидаты: limit первых строк индекса по количеству
+                candidates = set()
+                for day in days:
+                    cursor.execute(
+                        "SELECT ip FROM stats_ip_daily WHERE bucket = ? ORDER BY count DESC LIMIT ?",
+                        (day, limit)
+                    )
+                    candidates.update(row[0] for row in cursor.fetchall())
+                
+                # Точные количества кандидатов - поиском по первичному ключу (день, IP)
+                candidates = list(candidates)
+                for start in range(0, len(candidates), STATS_IP_CHUNK):
+                    chunk = candidates[start:start + STATS_IP_CHUNK]
+                    marks = ", ".join("?" * len(chunk))
+                    for day in days:
+                        cursor.execute(
+                            f"SELECT ip, count FROM stats_ip_daily WHERE bucket = ? AND ip IN ({marks})",
+                            (day, *chunk)
+                        )
+                        for ip, count in cursor.fetchall():
+                            ips[ip] = ips.get(ip, 0) + count
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка при получении статистики: {e}")
+        
+        top_ips = sorted(ips.items(), key=lambda item: item[1], reverse=True)[:limit]
+        return {
+            "total": sum(hourly.values()),
+            "by_type": sorted(by_type.items(), key=lambda item: item[1], reverse=True),
+            "hourly": sorted(hourly.items()),
+            "top_ips": [(unpack_ip(ip), count) for ip, count in top_ips],
+        }
+    
+    def get_ip_stats(self, ip: str) -> Optional[Tuple[int, int, int]]:
+        """
+        Возвращает общее количество инцидентов для IP-адреса.
+        
+        Args:
+            ip: IP-адрес
+        
+        Returns:
+            Кортеж (количество, первый инцидент, последний инцидент) или None;
+            время - секунды эпохи
+        """
+        try:
+            with self._read() as cursor:
+                cursor.execute(
+                    "SELECT count, first_seen, last_seen FROM stats_ip WHERE ip = ?",
+                    (pack_ip(ip),)
+                )
+                return cursor.fetchone()
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка при получении статистики для IP {ip}: {e}")
+            return None
+    
+    def iter_table(self, table: str, batch_size: int = DEFAULT_EXPORT_BATCH) -> Iterator[Dict[str, Any]]:
+        """
+        Построчно читает таблицу для выгрузки.
+        
+        Строки выбираются пакетами по ключу (id или ip) в отдельных транзакциях
+        чтения, поэтому память не зависит от размера таблицы, а выгрузка не
+        удерживает снимок базы и не мешает записи.
+        
+        Args:
+            table: Таблица из EXPORT_TABLES
+            batch_size: Количество строк в одном запросе
+        
+        Yields:
+            Словарь {столбец: значение}; IP и время инцидентов - в текстовом виде
+        
+        Raises:
+            ValueError: Если таблица не поддерживается
+        """
+        if table not in EXPORT_TABLES:
+            raise ValueError(f"Неизвестная таблица: {table}")
+        key, columns = EXPORT_TABLES[table]
+        key_index = columns.index(key)
+        select = f"SELECT {', '.join(columns)} FROM {table}"
+        
+        # Начальный ключ меньше любого значения столбца (id > 0, ip - непустая строка)
+        last_key: Any = 0 if key == "id" else ""
+        while True:
+            with self._read() as cursor:
+                cursor.execute(f"{select} WHERE {key} > ? ORDER BY {key} LIMIT ?", (last_key, batch_size))
+                rows = cursor.fetchall()
             
-            incidents = []
-            for row in cursor.fetchall():
-                incidents.append({
-                    "id": row[0],
-                    "ip": row[1],
-                    "reason": row[2],
-                    "timestamp": datetime.datetime.strptime(row[3], "%Y-%m-%d %H:%M:%S"),
-                    "is_blocked": bool(row[4])
-                })
+            for row in rows:
+                record = dict(zip(columns, row))
+                if table == "incidents":
+                    record["ip"] = unpack_ip(record["ip"])
+                    record["timestamp"] = format_timestamp(record["timestamp"])
+                yield record
             
-            return incidents
+            if len(rows) < batch_size:
+                return
+            last_key = rows[-1][key_index]
+    
+    def import_rows(self, table: str, rows: Iterable[Dict[str, Any]], batch_size: int = DEFAULT_IMPORT_BATCH,
+                    transaction_rows: int = DEFAULT_IMPORT_TRANSACTION) -> int:
+        """
+        Загружает строки в таблицу.
+        
+        Строки вставляются через executemany пакетами по batch_size, транзакция
+        фиксируется каждые transaction_rows строк. Инциденты получают новые ID
+        (счетчики статистики обновляются), записи блокировок и белого списка
+        заменяют существующие. Адреса блокировок и белого списка приводятся к
+        каноническому виду (parse_target); блокировки подсетей шире
+        MIN_BLOCK_PREFIX и адресов из белого списка пропускаются (как в /block).
+        Межсетевой экран не изменяется: после загрузки blocked_ips его нужно
+        сверить (см. database.transfer.sync_firewall).
+        
+        Args:
+            table: Таблица из EXPORT_TABLES
+            rows: Строки в формате iter_table (значения могут быть строками)
+            batch_size: Количество строк в одном executemany
+            transaction_rows: Количество строк в одной транзакции
+        
+        Returns:
+            Количество загруженных строк
+        
+        Raises:
+            ValueError: Если таблица не поддерживается или строка некорректна
+                (строки предыдущих транзакций остаются загруженными)
+        """
+        if table == "incidents":
+            sql = ("INSERT INTO incidents (ip, reason, timestamp, type, is_blocked) "
+                   "VALUES (?, ?, ?, ?, ?)")
+            convert = _incident_params
+        elif table == "blocked_ips":
+            sql = ("INSERT OR REPLACE INTO blocked_ips (ip, reason, timestamp, expires_at) "
+                   "VALUES (?, ?, COALESCE(?, CURRENT_TIMESTAMP), ?)")
+            allowed_networks = whitelist_networks(self.get_whitelist_ip_set())
+            
+            def convert(row):
+                _, _, ip = parse_target(row["ip"])
+                # Те же ограничения, что и у /block: не слишком широкие подсети и не белый список
+                rejection = block_rejection(ip, allowed_networks)
+                if rejection is not None:
+                    logger.warning(f"Блокировка {ip} не загружена: {rejection}")
+                    return None
+                return (
+                    ip, row.get("reason") or "", row.get("timestamp") or None,
+                    to_epoch(row["expires_at"]) if row.get("expires_at") not in (None, "") else None
+                )
+        elif table == "whitelist":
+            sql = ("INSERT OR REPLACE INTO whitelist (ip, timestamp) "
+                   "VALUES (?, COALESCE(?, CURRENT_TIMESTAMP))")
+            convert = lambda row: (parse_target(row["ip"])[2], row.get("timestamp") or None)
+        else:
+            raise ValueError(f"Неизвестная таблица: {table}")
+        ip_set = {"blocked_ips": self._blocked, "whitelist": self._whitelist}.get(table)
+        
+        total = read = 0
+        rows = iter(rows)
+        while True:
+            chunk = list(itertools.islice(rows, transaction_rows))
+            if not chunk:
+                if read > total:
+                    logger.warning(f"Пропущено строк при загрузке {table}: {read - total}")
+                return total
+            # Строки проверяются до фиксации транзакции: некорректная строка
+            # прерывает загрузку, не записав свою транзакцию
+            params = []
+            for number, row in enumerate(chunk, read + 1):
+                try:
+                    param = convert(row)
+                except (KeyError, TypeError, ValueError) as e:
+                    raise ValueError(f"Некорректная запись {number}: {e}") from e
+                if param is not None:
+                    params.append(param)
+            read += len(chunk)
+            with self._write_lock:
+                with self._write() as cursor:
+                    for start in range(0, len(params), batch_size):
+                        cursor.executemany(sql, params[start:start + batch_size])
+                if ip_set is not None:
+                    ip_set.update(param[0] for param in params)
+            total += len(params)
+            logger.info(f"Загружено строк в {table}: {total}")
+    
+    def get_spool_max_id(self) -> int:
+        """
+        Возвращает максимальный ID записи в спуле уведомлений.
+        
+        Returns:
+            Максимальный ID или 0, если спул пуст
+        """
+        try:
+            with self._read() as cursor:
+                cursor.execute("SELECT COALESCE(MAX(id), 0) FROM alert_spool")
+                return cursor.fetchone()[0]
         except sqlite3.Error as e:
-            logger.error(f"Ошибка при получении инцидентов для IP {ip}: {e}")
+            logger.error(f"Ошибка при чтении спула уведомлений: {e}")
+            return 0
+    
+    def get_spool_pending(self, after_id: int = 0, limit: int = 100) -> List[Tuple[int, str]]:
+        """
+        Возвращает недоставленные уведомления из спула.
+        
+        Args:
+            after_id: Возвращать записи с ID больше указанного
+            limit: Максимальное количество записей
+        
+        Returns:
+            Список кортежей (id, payload) в порядке добавления
+        """
+        try:
+            with self._read() as cursor:
+                cursor.execute(
+                    "SELECT id, payload FROM alert_spool "
+                    "WHERE id > ? AND delivered = 0 ORDER BY id LIMIT ?",
+                    (after_id, limit)
+                )
+                return cursor.fetchall()
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка при чтении спула уведомлений: {e}")
             return []
-        finally:
-            conn.close() 
\ No newline at end of file
+
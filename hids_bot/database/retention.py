@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Модуль хранения истории инцидентов ограниченного объема.
+
+Подробные записи инцидентов хранятся raw_days дней, после чего
+суммируются в почасовые агрегаты (incidents_hourly: количество по IP и
+причине за час). Почасовые агрегаты старше hourly_days дней суммируются в
+дневные (incidents_daily), которые хранятся без ограничения срока.
+
+Счетчики статистики (/stats) по дням и часам старше hourly_days дней
+удаляются, как и общие счетчики IP, от которых не было инцидентов
+hourly_days дней.
+
+Строки переносятся небольшими пакетами в отдельных транзакциях с паузами
+между ними, чтобы запись новых инцидентов не ожидала завершения очистки.
+Освободившееся место возвращается системе постепенно (incremental vacuum).
+"""
+
+import time
+import asyncio
+import logging
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Срок хранения подробных записей инцидентов (в днях)
+DEFAULT_RAW_DAYS = 30
+
+# Срок хранения почасовых агрегатов (в днях)
+DEFAULT_HOURLY_DAYS = 180
+
+# Интервал запуска очистки (в секундах)
+DEFAULT_RETENTION_INTERVAL = 3600.0
+
+# Количество строк, переносимых в одной транзакции
+DEFAULT_RETENTION_BATCH = 1000
+
+# Пауза между пакетами (в секундах)
+DEFAULT_BATCH_PAUSE = 0.05
+
+# Количество страниц, освобождаемых за один шаг очистки файла
+DEFAULT_VACUUM_PAGES = 1024
+
+
+def _cutoff(days: float) -> int:
+    """Возвращает границу времени (секунды эпохи, с точностью до часа)."""
+    moment = int(time.time() - days * 86400)
+    return moment - moment % 3600
+
+
+class IncidentRetention:
+    """
+    Периодический перенос старых инцидентов в агрегаты и очистка базы.
+
+    Атрибуты:
+        db_manager: Объект для работы с базой данных
+        raw_days: Срок хранения подробных записей в днях
+        hourly_days: Срок хранения почасовых агрегатов в днях
+        interval: Интервал запуска очистки в секундах
+        batch_size: Количество строк, переносимых в одной транзакции
+    """
+
+    def __init__(self, db_manager, raw_days: float = DEFAULT_RAW_DAYS,
+                 hourly_days: float = DEFAULT_HOURLY_DAYS,
+                 interval: float = DEFAULT_RETENTION_INTERVAL,
+                 batch_size: int = DEFAULT_RETENTION_BATCH,
+                 batch_pause: float = DEFAULT_BATCH_PAUSE,
+                 vacuum_pages: int = DEFAULT_VACUUM_PAGES):
+        """
+        Инициализирует очистку.
+
+        Args:
+            db_manager: Объект для работы с базой данных
+            raw_days: Срок хранения подробных записей в днях
+            hourly_days: Срок хранения почасовых агрегатов в днях
+            interval: Интервал запуска очистки в секундах
+            batch_size: Количество строк, переносимых в одной транзакции
+            batch_pause: Пауза между пакетами в секундах
+            vacuum_pages: Количество страниц, освобождаемых за один шаг
+        """
+        self.db_manager = db_manager
+        self.raw_days = raw_days
+        self.hourly_days = max(hourly_days, raw_days)
+        self.interval = interval
+        self.batch_size = max(1, batch_size)
+        self.batch_pause = batch_pause
+        self.vacuum_pages = max(1, vacuum_pages)
+
+        self._task: Optional[asyncio.Task] = None
+
+        # Метрики
+        self.runs = 0
+        self.rolled_up = 0
+        self.rolled_up_hourly = 0
+        self.pruned_stats = 0
+        self.last_run: Optional[float] = None
+        self.last_duration = 0.0
+
+    async def run_once(self) -> Dict[str, int]:
+        """
+        Выполняет один проход очистки.
+
+        Returns:
+            Словарь с количеством перенесенных инцидентов и почасовых агрегатов,
+            удаленных счетчиков статистики и числом оставшихся свободных страниц
+        """
+        started = time.monotonic()
+
+        incidents = await self._drain(self.db_manager.rollup_incidents, _cutoff(self.raw_days))
+        hourly = await self._drain(self.db_manager.rollup_hourly, _cutoff(self.hourly_days))
+        stats = await self._drain(self.db_manager.prune_stats, _cutoff(self.hourly_days))
+        stats += await self._prune_stats_ip(_cutoff(self.hourly_days))
+
+        loop = asyncio.get_running_loop()
+        free_pages = await loop.run_in_executor(None, self.db_manager.incremental_vacuum, self.vacuum_pages)
+        while free_pages:
+            await asyncio.sleep(self.batch_pause)
+            remaining = await loop.run_in_executor(None, self.db_manager.incremental_vacuum, self.vacuum_pages)
+            if remaining >= free_pages:
+                break
+            free_pages = remaining
+
+        self.runs += 1
+        self.rolled_up += incidents
+        self.rolled_up_hourly += hourly
+        self.pruned_stats += stats
+        self.last_run = time.time()
+        self.last_duration = time.monotonic() - started
+
+        if incidents or hourly or stats:
+            logger.info(
+                f"Очистка истории: {incidents} инцидентов перенесено в почасовые агрегаты, "
+                f"{hourly} почасовых агрегатов - в дневные, удалено {stats} счетчиков статистики "
+                f"({self.last_duration:.1f} с)"
+            )
+        return {"incidents": incidents, "hourly": hourly, "stats": stats, "free_pages": free_pages}
+
+    async def start(self) -> None:
+        """Запускает периодическую очистку."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="incident-retention")
+
+    async def stop(self) -> None:
+        """Останавливает периодическую очистку."""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Возвращает метрики очистки.
+
+        Returns:
+            Словарь с количеством проходов и перенесенных строк
+        """
+        return {
+            "runs": self.runs,
+            "rolled_up": self.rolled_up,
+            "rolled_up_hourly": self.rolled_up_hourly,
+            "pruned_stats": self.pruned_stats,
+            "last_run": self.last_run,
+            "last_duration": self.last_duration,
+        }
+
+    async def _drain(self, rollup: Callable[[int, int], int], before: int) -> int:
+        """Переносит пакеты строк, пока они не закончатся."""
+        loop = asyncio.get_running_loop()
+        total = 0
+        while True:
+            moved = await loop.run_in_executor(None, rollup, before, self.batch_size)
+            total += moved
+            if moved < self.batch_size:
+                return total
+            # Пауза дает записать накопившиеся новые инциденты
+            await asyncio.sleep(self.batch_pause)
+
+    async def _prune_stats_ip(self, before: int) -> int:
+        """Удаляет устаревшие счетчики IP за один проход по таблице."""
+        loop = asyncio.get_running_loop()
+        total = 0
+        after = None
+        while True:
+            after, deleted = await loop.run_in_executor(
+                None, self.db_manager.prune_stats_ip, before, after, self.batch_size
+            )
+            total += deleted
+            if after is None:
+                return total
+            await asyncio.sleep(self.batch_pause)
+
+    async def _run(self) -> None:
+        """Основной цикл периодической очистки."""
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"Ошибка при очистке истории инцидентов: {e}")
+            await asyncio.sleep(self.interval)
@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Модуль выгрузки и загрузки таблиц базы данных (инциденты, блокировки,
+белый список) в формате JSONL или CSV, в том числе со сжатием gzip.
+
+Строки передаются генераторами от DatabaseManager.iter_table до файла и
+от файла до DatabaseManager.import_rows, поэтому память не зависит от
+размера таблицы. Формат и сжатие определяются по расширению файла
+(.jsonl, .csv, .jsonl.gz, .csv.gz); "-" - стандартный вывод (ввод).
+
+Примеры (из каталога hids_bot):
+    python -m database.transfer export incidents incidents.jsonl.gz
+    python -m database.transfer export incidents - --format csv | siem-forwarder
+    python -m database.transfer import incidents incidents.jsonl.gz --db /var/lib/hids/hids.db
+
+После загрузки blocked_ips записи с истекшим сроком удаляются, а
+межсетевой экран сверяется с таблицей (--no-firewall - не изменять
+межсетевой экран). Запущенный бот хранит список блокировок в памяти и
+планирует снятие по сроку из базы данных не реже раза в час, поэтому
+после загрузки его нужно перезапустить: иначе /reconcile в боте снимет
+загруженные блокировки, а их сроки могут быть применены с опозданием.
+"""
+
+import io
+import sys
+import csv
+import gzip
+import json
+import logging
+import argparse
+import contextlib
+from typing import IO, Any, Dict, Iterable, Iterator, Optional, Tuple
+
+from database.codec import now
+from database.db_manager import DatabaseManager, EXPORT_TABLES
+from utils.system_commands import reconcile_firewall
+
+logger = logging.getLogger(__name__)
+
+# Поддерживаемые форматы
+FORMATS = ("jsonl", "csv")
+DEFAULT_FORMAT = "jsonl"
+
+# Количество истекших блокировок, удаляемых за один запрос после загрузки
+EXPIRED_BATCH = 1000
+
+
+def detect_format(path: str, fmt: Optional[str] = None, compress: Optional[bool] = None) -> Tuple[str, bool]:
+    """
+    Определяет формат и сжатие файла.
+
+    Args:
+        path: Путь к файлу или "-"
+        fmt: Формат (None - по расширению файла)
+        compress: Сжатие gzip (None - по расширению файла)
+
+    Returns:
+        Кортеж (формат, сжатие)
+
+    Raises:
+        ValueError: Если формат не поддерживается
+    """
+    name = path.lower()
+    if compress is None:
+        compress = name.endswith(".gz")
+    if name.endswith(".gz"):
+        name = name[:-3]
+    if fmt is None:
+        fmt = next((known for known in FORMATS if name.endswith(f".{known}")), DEFAULT_FORMAT)
+    if fmt not in FORMATS:
+        raise ValueError(f"Неизвестный формат: {fmt}")
+    return fmt, compress
+
+
+@contextlib.contextmanager
+def open_text(path: str, mode: str, compress: bool) -> Iterator[IO[str]]:
+    """
+    Открывает файл в текстовом режиме (UTF-8, с gzip при необходимости).
+
+    Args:
+        path: Путь к файлу или "-" (стандартный вывод или ввод)
+        mode: "r" или "w"
+        compress: Сжатие gzip
+
+    Yields:
+        Текстовый файловый объект
+    """
+    if path == "-":
+        raw = sys.stdout.buffer if mode == "w" else sys.stdin.buffer
+        binary = gzip.GzipFile(fileobj=raw, mode=mode) if compress else raw
+        text = io.TextIOWrapper(binary, encoding="utf-8", newline="")
+        try:
+            yield text
+        finally:
+            # Стандартные потоки не закрываются
+            text.flush()
+            if compress:
+                binary.close()
+            text.detach()
+        return
+
+    if compress:
+        fileobj = gzip.open(path, f"{mode}t", encoding="utf-8", newline="")
+    else:
+        fileobj = open(path, mode, encoding="utf-8", newline="")
+    with fileobj:
+        yield fileobj
+
+
+def write_rows(rows: Iterable[Dict[str, Any]], fileobj: IO[str], fmt: str, columns: Iterable[str]) -> int:
+    """
+    Записывает строки в файл.
+
+    Args:
+        rows: Строки (словари)
+        fileobj: Текстовый файловый объект
+        fmt: Формат (jsonl или csv)
+        columns: Столбцы (порядок столбцов CSV)
+
+    Returns:
+        Количество записанных строк
+    """
+    count = 0
+    if fmt == "csv":
+        writer = csv.DictWriter(fileobj, fieldnames=list(columns))
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    else:
+        for row in rows:
+            fileobj.write(json.dumps(row, ensure_ascii=False))
+            fileobj.write("\n")
+            count += 1
+    return count
+
+
+def read_rows(fileobj: IO[str], fmt: str) -> Iterator[Dict[str, Any]]:
+    """
+    Читает строки из файла.
+
+    Args:
+        fileobj: Текстовый файловый объект
+        fmt: Формат (jsonl или csv)
+
+    Yields:
+        Строки (словари); пустые значения CSV - None
+
+    Raises:
+        ValueError: Если строка JSONL некорректна
+    """
+    if fmt == "csv":
+        for row in csv.DictReader(fileobj):
+            yield {column: value if value != "" else None for column, value in row.items()}
+        return
+
+    for line_number, line in enumerate(fileobj, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Некорректная строка {line_number}: {e}") from e
+
+
+def export_table(db_manager: DatabaseManager, table: str, path: str, fmt: Optional[str] = None,
+                 compress: Optional[bool] = None) -> int:
+    """
+    Выгружает таблицу в файл.
+
+    Args:
+        db_manager: Объект для работы с базой данных
+        table: Таблица (incidents, blocked_ips или whitelist)
+        path: Путь к файлу или "-"
+        fmt: Формат (None - по расширению файла)
+        compress: Сжатие gzip (None - по расширению файла)
+
+    Returns:
+        Количество выгруженных строк
+
+    Raises:
+        ValueError: Если таблица или формат не поддерживаются
+    """
+    if table not in EXPORT_TABLES:
+        raise ValueError(f"Неизвестная таблица: {table}")
+    fmt, compress = detect_format(path, fmt, compress)
+
+    with open_text(path, "w", compress) as fileobj:
+        count = write_rows(db_manager.iter_table(table), fileobj, fmt, EXPORT_TABLES[table][1])
+    logger.info(f"Выгружено строк из {table}: {count}")
+    return count
+
+
+def import_table(db_manager: DatabaseManager, table: str, path: str, fmt: Optional[str] = None,
+                 compress: Optional[bool] = None) -> int:
+    """
+    Загружает таблицу из файла.
+
+    Args:
+        db_manager: Объект для работы с базой данных
+        table: Таблица (incidents, blocked_ips или whitelist)
+        path: Путь к файлу или "-"
+        fmt: Формат (None - по расширению файла)
+        compress: Сжатие gzip (None - по расширению файла)
+
+    Returns:
+        Количество загруженных строк
+
+    Raises:
+        ValueError: Если таблица, формат или данные некорректны
+    """
+    fmt, compress = detect_format(path, fmt, compress)
+
+    with open_text(path, "r", compress) as fileobj:
+        return db_manager.import_rows(table, read_rows(fileobj, fmt))
+
+
+def sync_firewall(db_manager: DatabaseManager) -> Optional[Dict[str, int]]:
+    """
+    Приводит межсетевой экран в соответствие с blocked_ips после загрузки:
+    удаляет записи с истекшим сроком и сверяет межсетевой экран с таблицей.
+
+    Args:
+        db_manager: Объект для работы с базой данных
+
+    Returns:
+        Результат сверки (см. reconcile_firewall); None при ошибке
+    """
+    expired = 0
+    while True:
+        ips = db_manager.pop_expired_bans(now(), EXPIRED_BATCH)
+        expired += len(ips)
+        if len(ips) < EXPIRED_BATCH:
+            break
+    if expired:
+        logger.info(f"Удалено блокировок с истекшим сроком: {expired}")
+
+    result = reconcile_firewall(db_manager.get_blocked_ip_set())
+    if result is None:
+        logger.error("Ошибка при сверке межсетевого экрана")
+    else:
+        logger.info(f"Сверка межсетевого экрана: блокировок {result['firewall']}, "
+                    f"добавлено {result['added']}, снято {result['removed']}")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Выгрузка и загрузка таблиц базы данных HIDS",
+        epilog="После загрузки blocked_ips перезапустите бот: он хранит список блокировок в памяти "
+               "и без перезапуска снимет загруженные блокировки при /reconcile"
+    )
+    parser.add_argument("command", choices=("export", "import"), help="Действие")
+    parser.add_argument("table", choices=sorted(EXPORT_TABLES), help="Таблица")
+    parser.add_argument("path", help="Файл (.jsonl, .csv, с .gz - сжатый) или \"-\"")
+    parser.add_argument("--db", default="hids.db", help="Путь к базе данных")
+    parser.add_argument("--format", choices=FORMATS, help="Формат (по умолчанию - по расширению файла)")
+    parser.add_argument("--gzip", action="store_true", default=None, help="Сжатие gzip")
+    parser.add_argument("--no-firewall", action="store_true",
+                        help="Не сверять межсетевой экран после загрузки blocked_ips")
+    args = parser.parse_args()
+
+    # Журнал - в stderr, чтобы не смешиваться с выгрузкой в стандартный вывод
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr,
+                        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    db_manager = DatabaseManager(args.db)
+    try:
+        if args.command == "export":
+            export_table(db_manager, args.table, args.path, args.format, args.gzip)
+        else:
+            import_table(db_manager, args.table, args.path, args.format, args.gzip)
+            if args.table == "blocked_ips" and not args.no_firewall and sync_firewall(db_manager) is None:
+                sys.exit(1)
+    except (ValueError, KeyError, OSError) as e:
+        logger.error(f"Ошибка: {e}")
+        sys.exit(1)
+    finally:
+        db_manager.close()
+
+
+if __name__ == "__main__":
+    main()
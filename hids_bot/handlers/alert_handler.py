@@ -1,89 +1,253 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import os
+import html
 import logging
 import asyncio
-from datetime import datetime, timedelta
+import time
+import sqlite3
+import tempfile
+import functools
 from aiogram import types, Router, F
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 
-from database.db_manager import DatabaseManager
+from database.async_db import AsyncDatabaseManager
+from database.codec import format_timestamp, now
+from database.db_manager import EXPORT_TABLES
+from database.transfer import FORMATS, DEFAULT_FORMAT, export_table
+from handlers.auth_handler import authorized_only
 from utils.cmd_executor import CommandExecutor
 from utils.ip_validator import IPValidator
+from utils.firewall import parse_target, check_block_targets
+from utils.system_commands import block_ip, unblock_ip, block_ips, unblock_ips, reconcile_firewall
+from utils.alert_types import get_alert_type, get_alert_time, get_alert_severity
+from utils.alert_coalescer import AlertCoalescer, AlertGroup, DEFAULT_WINDOW, DEFAULT_EDIT_TTL
+from utils.alert_digest import AlertDigest, DigestSummary
+from utils.telegram_outbox import message_priority, PRIORITY_LOW
+from utils.pagination import (
+    PAGE_CALLBACK_PREFIX, OLDER, NEWER, encode_cursor, page_callback_data, parse_page_callback_data
+)
 
 # Создаем роутер для обработки уведомлений
 router = Router(name="alert_router")
 logger = logging.getLogger("alert_handler")
 
-# Словарь для хранения состояний IP-адресов
-ip_states = {}
-
 # Период блокировки по умолчанию (в часах)
 DEFAULT_BAN_PERIOD = 24
 
-@router.message(Command("alerts"))
-async def cmd_alerts(message: types.Message, db_manager: DatabaseManager):
-    """Получить список последних уведомлений"""
-    user_id = message.from_user.id
+# Количество инцидентов на странице /alerts и /alert_detail
+ALERTS_PAGE_SIZE = 10
+
+# Максимальная длина причины в списке (страница должна поместиться в одно сообщение)
+MAX_REASON_LENGTH = 150
+
+# Количество причин в архивной сводке /alert_detail
+ARCHIVE_REASONS = 5
+
+# Периоды /stats (в сутках, включая текущие сутки UTC) и период по умолчанию
+STATS_PERIODS = {"day": 1, "week": 7, "month": 30}
+STATS_PERIOD_TITLES = {"day": "сутки", "week": "неделю", "month": "месяц"}
+DEFAULT_STATS_PERIOD = "day"
+
+# Количество IP в рейтинге /stats
+STATS_TOP_IPS = 10
+
+# Количество некорректных адресов, перечисляемых в ответе /block и /unblock
+MAX_INVALID_SHOWN = 10
+
+# Максимальный размер документа, отправляемого ботом (ограничение Telegram, в байтах)
+EXPORT_MAX_DOCUMENT_SIZE = 50 * 1024 * 1024
+
+# Окно объединения повторяющихся уведомлений и время, в течение которого
+# отправленное сообщение обновляется вместо отправки нового (в секундах)
+ALERT_COALESCE_WINDOW = float(os.getenv("ALERT_COALESCE_WINDOW", DEFAULT_WINDOW))
+ALERT_COALESCE_EDIT_TTL = float(os.getenv("ALERT_COALESCE_EDIT_TTL", DEFAULT_EDIT_TTL))
+
+# Режим сводки: уведомления с серьезностью ниже ALERT_DIGEST_SEVERITY не отправляются
+# по отдельности, а раз в ALERT_DIGEST_INTERVAL минут собираются в одну сводку (0 - отключено)
+ALERT_DIGEST_INTERVAL = float(os.getenv("ALERT_DIGEST_INTERVAL", 0))
+ALERT_DIGEST_SEVERITY = int(os.getenv("ALERT_DIGEST_SEVERITY", 3))
+
+# Объединители уведомлений и накопители сводок по ID чата
+alert_coalescers = {}
+alert_digests = {}
+
+# Спул недоставленных уведомлений (database.alert_spool.AlertSpool), если включен
+alert_spool = None
+
+def set_alert_spool(spool):
+    """
+    Подключает спул уведомлений: доставленные уведомления помечаются в нем,
+    недоставленные возвращаются для повторной отправки
     
-    # Получаем последние 10 уведомлений
-    alerts = db_manager.get_recent_incidents(limit=10)
+    :param spool: Экземпляр AlertSpool или None
+    """
+    global alert_spool
+    alert_spool = spool
+
+# Планировщик снятия временных блокировок (utils.ban_scheduler.BanScheduler)
+ban_scheduler = None
+
+def set_ban_scheduler(scheduler):
+    """
+    Подключает планировщик снятия временных блокировок
     
-    if not alerts:
-        await message.answer("Нет недавних уведомлений о вторжениях.")
-        return
+    :param scheduler: Экземпляр BanScheduler или None
+    """
+    global ban_scheduler
+    ban_scheduler = scheduler
+
+def ban_expiry(hours):
+    """
+    Возвращает время окончания блокировки на указанное количество часов
+    
+    :param hours: Количество часов (0 - постоянная блокировка)
+    :return: Кортеж (секунды эпохи или None, текст срока для ответа)
+    """
+    if hours <= 0:
+        return None, "навсегда"
+    expires_at = now() + hours * 3600
+    return expires_at, f"на {hours} часов (до {format_timestamp(expires_at)} UTC)"
+
+def _spool_delivered(spool_ids):
+    """Помечает уведомления из спула доставленными"""
+    if alert_spool:
+        alert_spool.mark_delivered(spool_ids)
+
+def _spool_released(spool_ids):
+    """Возвращает недоставленные уведомления в спул"""
+    if alert_spool:
+        alert_spool.release(spool_ids)
+
+async def fetch_incidents_page(db: AsyncDatabaseManager, ip=None, before=None, after=None):
+    """
+    Получает одну страницу инцидентов и признаки наличия соседних страниц
+    
+    :param db: Асинхронный объект для работы с базой данных
+    :param ip: IP-адрес (None - все IP)
+    :param before: Ключ (timestamp, id), от которого выбираются более старые инциденты
+    :param after: Ключ (timestamp, id), от которого выбираются более новые инциденты
+    :return: Кортеж (строки страницы, есть более новые, есть более старые)
+    """
+    # Запрашиваем на одну строку больше, чтобы узнать, есть ли следующая страница
+    rows = await db.get_incidents_page(ip, ALERTS_PAGE_SIZE + 1, before=before, after=after)
+    
+    if after is not None:
+        has_newer = len(rows) > ALERTS_PAGE_SIZE
+        return rows[-ALERTS_PAGE_SIZE:], has_newer, True
+    
+    has_older = len(rows) > ALERTS_PAGE_SIZE
+    return rows[:ALERTS_PAGE_SIZE], before is not None, has_older
+
+def page_buttons(rows, has_newer, has_older, ip=None):
+    """
+    Формирует кнопки перехода между страницами
+    
+    :param rows: Строки текущей страницы (от новых к старым)
+    :param has_newer: Есть более новые инциденты
+    :param has_older: Есть более старые инциденты
+    :param ip: IP-адрес (None - все IP)
+    :return: Список кнопок (пустой, если переходить некуда)
+    """
+    buttons = []
+    if rows and has_newer:
+        data = page_callback_data(NEWER, encode_cursor(rows[0][3], rows[0][0]), ip)
+        if data:
+            buttons.append(types.InlineKeyboardButton(text="⬅️ Новее", callback_data=data))
+    if rows and has_older:
+        data = page_callback_data(OLDER, encode_cursor(rows[-1][3], rows[-1][0]), ip)
+        if data:
+            buttons.append(types.InlineKeyboardButton(text="Старее ➡️", callback_data=data))
+    return buttons
+
+def _short_reason(reason):
+    """Обрезает причину, чтобы страница не превысила лимит длины сообщения"""
+    if len(reason) > MAX_REASON_LENGTH:
+        reason = reason[:MAX_REASON_LENGTH - 1] + "…"
+    return html.escape(reason)
+
+async def render_alerts_page(db: AsyncDatabaseManager, before=None, after=None):
+    """
+    Формирует страницу списка последних уведомлений
+    
+    :param db: Асинхронный объект для работы с базой данных
+    :param before: Ключ, от которого выбираются более старые инциденты
+    :param after: Ключ, от которого выбираются более новые инциденты
+    :return: Кортеж (текст, клавиатура) или (None, None), если уведомлений нет
+    """
+    rows, has_newer, has_older = await fetch_incidents_page(db, before=before, after=after)
+    
+    # Подробные записи старых инцидентов перенесены в почасовые агрегаты
+    # (database.retention) - последнюю страницу дополняем ими
+    rollups = []
+    if not has_older and len(rows) < ALERTS_PAGE_SIZE:
+        rollups = await db.get_incident_rollups(
+            limit=ALERTS_PAGE_SIZE - len(rows), before=rows[-1][3] if rows else None
+        )
+    
+    if not rows and not rollups:
+        return None, None
     
-    # Формируем сообщение с уведомлениями
     response = "📋 <b>Последние уведомления:</b>\n\n"
     
-    for idx, incident in enumerate(alerts, 1):
-        ip = incident[0]
-        reason = incident[1]
-        alert_time = incident[2]
-        is_blocked = bool(incident[3])
-        
+    for incident_id, ip, reason, alert_time, is_blocked in rows:
         # Добавляем статус IP (заблокирован/не заблокирован)
         status = "🔴 заблокирован" if is_blocked else "🟢 не заблокирован"
         
-        response += f"{idx}. <b>IP:</b> {ip} ({status})\n"
-        response += f"   <b>Причина:</b> {reason}\n"
-        response += f"   <b>Время:</b> {alert_time}\n\n"
-    
-    await message.answer(response, parse_mode="HTML")
+        response += f"#{incident_id} <b>IP:</b> {html.escape(ip)} ({status})\n"
+        response += f"   <b>Причина:</b> {_short_reason(reason)}\n"
+        response += f"   <b>Время:</b> {format_timestamp(alert_time)}\n\n"
+    
+    for bucket, ip, reason, count in rollups:
+        response += f"• <b>IP:</b> {html.escape(ip)} (архив)\n"
+        response += f"   <b>Причина:</b> {_short_reason(reason)} - {count} раз\n"
+        response += f"   <b>Час:</b> {format_timestamp(bucket)}\n\n"
+    
+    buttons = page_buttons(rows, has_newer, has_older)
+    keyboard = types.InlineKeyboardMarkup(inline_keyboard=[buttons]) if buttons else None
+    return response, keyboard
 
-@router.message(Command("alert_detail"))
-async def cmd_alert_detail(message: types.Message, db_manager: DatabaseManager):
-    """Получить детальную информацию об IP-адресе"""
-    args = message.text.split()
-    if len(args) < 2:
-        await message.answer("Использование: /alert_detail [IP-адрес]")
+@router.message(Command("alerts"))
+async def cmd_alerts(message: types.Message, db: AsyncDatabaseManager):
+    """Получить список последних уведомлений (постранично)"""
+    response, keyboard = await render_alerts_page(db)
+    
+    if response is None:
+        await message.answer("Нет недавних уведомлений о вторжениях.")
         return
     
-    ip = args[1]
-    ip_validator = IPValidator()
+    await message.answer(response, parse_mode="HTML", reply_markup=keyboard)
+
+async def render_ip_page(db: AsyncDatabaseManager, ip, before=None, after=None):
+    """
+    Формирует страницу детальной информации об IP-адресе
     
-    # Проверяем валидность IP
-    if not ip_validator.is_valid_ip(ip):
-        await message.answer(f"❌ Неверный формат IP-адреса: {ip}")
-        return
+    Архив и геолокация показываются только на первой странице.
     
-    # Получаем историю уведомлений для данного IP
-    alerts = db_manager.get_incidents_by_ip(ip)
+    :param db: Асинхронный объект для работы с базой данных
+    :param ip: IP-адрес
+    :param before: Ключ, от которого выбираются более старые инциденты
+    :param after: Ключ, от которого выбираются более новые инциденты
+    :return: Кортеж (текст, клавиатура) или (None, None), если уведомлений нет
+    """
+    first_page = before is None and after is None
+    rows, has_newer, has_older = await fetch_incidents_page(db, ip, before=before, after=after)
+    archived = await db.get_ip_rollup_summary(ip) if first_page else []
+    totals = await db.get_ip_stats(ip) if first_page else None
     
-    if not alerts:
-        await message.answer(f"Нет уведомлений для IP-адреса {ip}.")
-        return
+    if not rows and not archived:
+        return None, None
     
     # Формируем сообщение с детальной информацией
-    response = f"🔍 <b>Детальная информация по IP {ip}:</b>\n\n"
+    response = f"🔍 <b>Детальная информация по IP {html.escape(ip)}:</b>\n\n"
     
     # Проверяем, заблокирован ли IP
-    if ip in ip_states and ip_states[ip].get("blocked", False):
-        unblock_time = ip_states[ip].get("unblock_time")
-        if unblock_time:
-            time_left = unblock_time - datetime.now()
-            hours_left = time_left.total_seconds() / 3600
+    if await db.is_blocked(ip):
+        expires_at = await db.get_ban_expiry(ip)
+        if expires_at:
+            hours_left = max(expires_at - now(), 0) / 3600
             response += f"🔴 <b>Статус:</b> Заблокирован\n"
             response += f"⏱ <b>Осталось до разблокировки:</b> {hours_left:.1f} часов\n\n"
         else:
@@ -91,23 +255,47 @@ async def cmd_alert_detail(message: types.Message, db_manager: DatabaseManager):
     else:
         response += f"🟢 <b>Статус:</b> Не заблокирован\n\n"
     
-    # Добавляем список уведомлений
-    response += "<b>История уведомлений:</b>\n"
-    for idx, alert in enumerate(alerts, 1):
-        alert_time = alert.get("timestamp", datetime.now()).strftime("%Y-%m-%d %H:%M:%S")
-        reason = alert.get("reason", "Неизвестная причина")
-        response += f"{idx}. <b>Время:</b> {alert_time}\n"
-        response += f"   <b>Причина:</b> {reason}\n\n"
-    
-    # Геолокация IP (упрощенно)
-    cmd_executor = CommandExecutor()
-    geo_info = cmd_executor.execute_command(f"geoiplookup {ip}").strip()
-    
-    if geo_info and "IP Address not found" not in geo_info:
-        response += f"🌐 <b>Геолокация:</b>\n{geo_info}\n\n"
+    if totals:
+        count, first_seen, last_seen = totals
+        response += (
+            f"📊 <b>Всего инцидентов:</b> {count} "
+            f"({format_timestamp(first_seen)} - {format_timestamp(last_seen)})\n\n"
+        )
     
-    # Добавляем кнопки действий
-    keyboard = types.InlineKeyboardMarkup(inline_keyboard=[
+    # Добавляем страницу истории уведомлений
+    if rows:
+        response += "<b>История уведомлений:</b>\n"
+        for incident_id, _, reason, alert_time, _ in rows:
+            response += f"#{incident_id} <b>Время:</b> {format_timestamp(alert_time)}\n"
+            response += f"   <b>Причина:</b> {_short_reason(reason)}\n\n"
+    
+    # Старые инциденты хранятся только в виде агрегатов
+    if archived:
+        response += "<b>Архив (по причинам):</b>\n"
+        for reason, count, first_seen, last_seen in archived[:ARCHIVE_REASONS]:
+            response += (
+                f"• {_short_reason(reason)}: {count} раз "
+                f"({format_timestamp(first_seen)} - {format_timestamp(last_seen)})\n"
+            )
+        response += "\n"
+    
+    if first_page:
+        # Геолокация IP (упрощенно; команда выполняется вне событийного цикла)
+        cmd_executor = CommandExecutor()
+        loop = asyncio.get_running_loop()
+        geo_info = (await loop.run_in_executor(
+            None, cmd_executor.execute_command, f"geoiplookup {ip}"
+        )).strip()
+        
+        if geo_info and "IP Address not found" not in geo_info:
+            response += f"🌐 <b>Геолокация:</b>\n{html.escape(geo_info)}\n\n"
+    
+    # Добавляем кнопки перехода между страницами и кнопки действий
+    inline_keyboard = []
+    buttons = page_buttons(rows, has_newer, has_older, ip)
+    if buttons:
+        inline_keyboard.append(buttons)
+    inline_keyboard += [
         [
             types.InlineKeyboardButton(text="🚫 Заблокировать", callback_data=f"block:{ip}"),
             types.InlineKeyboardButton(text="✅ Разблокировать", callback_data=f"unblock:{ip}")
@@ -116,10 +304,357 @@ async def cmd_alert_detail(message: types.Message, db_manager: DatabaseManager):
             types.InlineKeyboardButton(text="🔍 Whois", callback_data=f"whois:{ip}"),
             types.InlineKeyboardButton(text="📊 Трассировка", callback_data=f"trace:{ip}")
         ]
-    ])
+    ]
+    
+    return response, types.InlineKeyboardMarkup(inline_keyboard=inline_keyboard)
+
+@router.message(Command("alert_detail"))
+async def cmd_alert_detail(message: types.Message, db: AsyncDatabaseManager):
+    """Получить детальную информацию об IP-адресе (история - постранично)"""
+    args = message.text.split()
+    if len(args) < 2:
+        await message.answer("Использование: /alert_detail [IP-адрес]")
+        return
+    
+    ip = args[1]
+    ip_validator = IPValidator()
+    
+    # Проверяем валидность IP
+    if not ip_validator.is_valid_ip(ip):
+        await message.answer(f"❌ Неверный формат IP-адреса: {ip}")
+        return
+    
+    response, keyboard = await render_ip_page(db, ip)
+    
+    if response is None:
+        await message.answer(f"Нет уведомлений для IP-адреса {ip}.")
+        return
     
     await message.answer(response, parse_mode="HTML", reply_markup=keyboard)
 
+@router.callback_query(F.data.startswith(f"{PAGE_CALLBACK_PREFIX}:"))
+async def callback_alerts_page(callback: types.CallbackQuery, db: AsyncDatabaseManager):
+    """Обработчик перехода между страницами /alerts и /alert_detail"""
+    try:
+        direction, key, ip = parse_page_callback_data(callback.data)
+    except ValueError:
+        await callback.answer("Некорректные данные кнопки")
+        return
+    
+    before, after = (key, None) if direction == OLDER else (None, key)
+    if ip is None:
+        response, keyboard = await render_alerts_page(db, before=before, after=after)
+    else:
+        response, keyboard = await render_ip_page(db, ip, before=before, after=after)
+    
+    if response is None:
+        await callback.answer("Больше уведомлений нет")
+        return
+    
+    await callback.message.edit_text(response, parse_mode="HTML", reply_markup=keyboard)
+    await callback.answer()
+
+def format_stats(stats, period, days, alert_type=None):
+    """
+    Формирует текст статистики инцидентов
+    
+    :param stats: Результат DatabaseManager.get_stats
+    :param period: Название периода (day, week, month)
+    :param days: Длина периода в сутках
+    :param alert_type: Тип инцидентов, по которому построена динамика, или None
+    :return: Текст сообщения в формате HTML
+    """
+    title = f" ({html.escape(alert_type)})" if alert_type else ""
+    text = f"📊 <b>Статистика за {STATS_PERIOD_TITLES[period]}{title}</b>\n\n"
+    text += f"<b>Всего инцидентов:</b> {stats['total']}\n\n"
+    
+    if stats["by_type"]:
+        text += "<b>По типам:</b>\n"
+        for row_type, count in stats["by_type"]:
+            text += f"  • {html.escape(row_type)}: {count}\n"
+        text += "\n"
+    
+    if stats["top_ips"]:
+        text += f"<b>Топ-{len(stats['top_ips'])} IP:</b>\n"
+        for idx, (ip, count) in enumerate(stats["top_ips"], 1):
+            text += f"{idx}. {html.escape(ip)} - {count}\n"
+        text += "\n"
+    
+    if stats["hourly"]:
+        # За сутки - по часам, за больший период - по дням
+        if days == 1:
+            text += "<b>По часам (UTC):</b>\n"
+            for bucket, count in stats["hourly"]:
+                text += f"  {format_timestamp(bucket)[11:16]} - {count}\n"
+        else:
+            daily = {}
+            for bucket, count in stats["hourly"]:
+                day = format_timestamp(bucket)[:10]
+                daily[day] = daily.get(day, 0) + count
+            text += "<b>По дням (UTC):</b>\n"
+            for day, count in daily.items():
+                text += f"  {day} - {count}\n"
+    
+    return text
+
+@router.message(Command("stats"))
+async def cmd_stats(message: types.Message, db: AsyncDatabaseManager):
+    """Статистика инцидентов: /stats [day|week|month] [тип]"""
+    period, alert_type = DEFAULT_STATS_PERIOD, None
+    for arg in message.text.split()[1:]:
+        if arg.lower() in STATS_PERIODS:
+            period = arg.lower()
+        else:
+            alert_type = arg.upper()
+    
+    # Период начинается в полночь UTC, чтобы совпадать с суточными счетчиками
+    days = STATS_PERIODS[period]
+    today = int(time.time()) // 86400 * 86400
+    stats = await db.get_stats(today - (days - 1) * 86400, alert_type=alert_type, limit=STATS_TOP_IPS)
+    
+    if not stats["by_type"]:
+        await message.answer("Нет инцидентов за выбранный период.")
+        return
+    
+    await message.answer(format_stats(stats, period, days, alert_type), parse_mode="HTML")
+
+@router.message(Command("export"))
+@authorized_only
+async def cmd_export(message: types.Message, db: AsyncDatabaseManager):
+    """Выгрузка таблицы в сжатый файл: /export [incidents|blocked_ips|whitelist] [jsonl|csv]"""
+    table, fmt = "incidents", DEFAULT_FORMAT
+    for arg in message.text.split()[1:]:
+        if arg in EXPORT_TABLES:
+            table = arg
+        elif arg in FORMATS:
+            fmt = arg
+        else:
+            await message.answer(
+                f"Использование: /export [{'|'.join(EXPORT_TABLES)}] [{'|'.join(FORMATS)}]"
+            )
+            return
+    
+    filename = f"{table}-{time.strftime('%Y%m%d-%H%M%S', time.gmtime())}.{fmt}.gz"
+    with tempfile.TemporaryDirectory(prefix="hids-export-") as workdir:
+        path = os.path.join(workdir, filename)
+        try:
+            # Выгрузка потоковая и выполняется вне событийного цикла
+            count = await db.run(export_table, db.sync, table, path, fmt, True)
+        except (sqlite3.Error, OSError) as e:
+            logger.error(f"Ошибка при выгрузке {table}: {e}")
+            await message.answer(f"❌ Ошибка при выгрузке {table}: {e}")
+            return
+        
+        if os.path.getsize(path) > EXPORT_MAX_DOCUMENT_SIZE:
+            await message.answer(
+                f"❌ Файл выгрузки {table} больше 50 МБ и не может быть отправлен ботом. "
+                f"Используйте на сервере: python -m database.transfer export {table} {filename}"
+            )
+            return
+        
+        await message.answer_document(
+            types.FSInputFile(path, filename=filename),
+            caption=f"📦 {table}: {count} строк ({fmt}, gzip)"
+        )
+
+def parse_ip_list(args):
+    """
+    Разбирает список IP-адресов команды /block или /unblock
+    
+    :param args: Аргументы команды (адреса через пробел, запятую или с новой строки)
+    :return: Кортеж (корректные адреса без повторов, некорректные)
+    """
+    targets, invalid = {}, []
+    for arg in args.replace(",", " ").split():
+        try:
+            _, _, target = parse_target(arg)
+        except ValueError:
+            invalid.append(arg)
+            continue
+        targets.setdefault(target, None)
+    return list(targets), invalid
+
+def format_invalid_ips(invalid):
+    """
+    Формирует строку с некорректными адресами для ответа
+    
+    :param invalid: Некорректные адреса
+    :return: Строка для ответа (пустая, если таких адресов нет)
+    """
+    if not invalid:
+        return ""
+    shown = ", ".join(html.escape(ip) for ip in invalid[:MAX_INVALID_SHOWN])
+    more = f" и еще {len(invalid) - MAX_INVALID_SHOWN}" if len(invalid) > MAX_INVALID_SHOWN else ""
+    return f"\n⚠️ Пропущены некорректные адреса: {shown}{more}"
+
+def format_rejected_ips(rejected):
+    """
+    Формирует строку с отклоненными адресами для ответа
+    
+    :param rejected: Список (адрес, причина отказа)
+    :return: Строка для ответа (пустая, если таких адресов нет)
+    """
+    if not rejected:
+        return ""
+    shown = ", ".join(f"{html.escape(ip)} ({html.escape(why)})" for ip, why in rejected[:MAX_INVALID_SHOWN])
+    more = f" и еще {len(rejected) - MAX_INVALID_SHOWN}" if len(rejected) > MAX_INVALID_SHOWN else ""
+    return f"\n⛔ Не заблокированы: {shown}{more}"
+
+@router.message(Command("block"))
+@authorized_only
+async def cmd_block(message: types.Message, db: AsyncDatabaseManager):
+    """Блокировка списка адресов: /block [часы] IP [IP ...] (подсети в формате CIDR)"""
+    parts = message.text.split(maxsplit=1)
+    args = parts[1] if len(parts) > 1 else ""
+    
+    hours = 0
+    first = args.split(maxsplit=1)
+    if first and first[0].isdigit():
+        hours = int(first[0])
+        args = first[1] if len(first) > 1 else ""
+    
+    targets, invalid = parse_ip_list(args)
+    if not targets:
+        await message.answer(
+            "Использование: /block [часы] IP [IP ...]\n"
+            "Без количества часов - постоянная блокировка" + format_invalid_ips(invalid),
+            parse_mode="HTML"
+        )
+        return
+    
+    targets, rejected = check_block_targets(targets, db.sync.get_whitelist_ip_set())
+    if not targets:
+        await message.answer(
+            "❌ Нет адресов для блокировки" + format_rejected_ips(rejected) + format_invalid_ips(invalid),
+            parse_mode="HTML"
+        )
+        return
+    
+    # Все адреса блокируются одной транзакцией межсетевого экрана вне событийного цикла
+    loop = asyncio.get_running_loop()
+    reason = "Заблокирован администратором"
+    if not await loop.run_in_executor(None, block_ips, targets, reason, hours * 3600 if hours > 0 else None):
+        await message.answer("❌ Ошибка при блокировке IP (подробности в журнале бота)")
+        return
+    
+    expires_at, status_msg = ban_expiry(hours)
+    await db.add_many_to_blocked(targets, f"{reason} {status_msg}", expires_at)
+    if expires_at and ban_scheduler:
+        ban_scheduler.schedule(expires_at)
+    
+    await message.answer(
+        f"✅ Заблокировано IP-адресов: {len(targets)} {status_msg}"
+        + format_rejected_ips(rejected) + format_invalid_ips(invalid),
+        parse_mode="HTML"
+    )
+
+@router.message(Command("unblock"))
+@authorized_only
+async def cmd_unblock(message: types.Message, db: AsyncDatabaseManager):
+    """Разблокировка списка адресов: /unblock IP [IP ...]"""
+    parts = message.text.split(maxsplit=1)
+    targets, invalid = parse_ip_list(parts[1] if len(parts) > 1 else "")
+    if not targets:
+        await message.answer(
+            "Использование: /unblock IP [IP ...]" + format_invalid_ips(invalid),
+            parse_mode="HTML"
+        )
+        return
+    
+    loop = asyncio.get_running_loop()
+    if not await loop.run_in_executor(None, unblock_ips, targets):
+        await message.answer("❌ Ошибка при разблокировке IP (подробности в журнале бота)")
+        return
+    
+    await db.remove_many_from_blocked(targets)
+    
+    await message.answer(
+        f"✅ Разблокировано IP-адресов: {len(targets)}" + format_invalid_ips(invalid),
+        parse_mode="HTML"
+    )
+
+@router.message(Command("reconcile"))
+@authorized_only
+async def cmd_reconcile(message: types.Message, db: AsyncDatabaseManager):
+    """Сверка межсетевого экрана со списком заблокированных IP: /reconcile"""
+    # Один дамп межсетевого экрана и одна транзакция исправлений - вне событийного цикла
+    loop = asyncio.get_running_loop()
+    result = await loop.run_in_executor(None, reconcile_firewall, db.sync.get_blocked_ip_set())
+    if result is None:
+        await message.answer("❌ Ошибка при сверке межсетевого экрана (подробности в журнале бота)")
+        return
+    
+    await message.answer(
+        "🔄 <b>Сверка межсетевого экрана</b>\n\n"
+        f"<b>Блокировок в межсетевом экране:</b> {result['firewall']}\n"
+        f"<b>Восстановлено из базы данных:</b> {result['added']}\n"
+        f"<b>Снято (нет в базе данных):</b> {result['removed']}",
+        parse_mode="HTML"
+    )
+
+def format_duration(seconds):
+    """
+    Форматирует длительность блокировки
+    
+    :param seconds: Длительность в секундах
+    :return: Строка вида "2 ч" или "3 дн."
+    """
+    if seconds % 86400 == 0:
+        return f"{seconds // 86400} дн."
+    if seconds % 3600 == 0:
+        return f"{seconds // 3600} ч"
+    return f"{seconds // 60} мин"
+
+async def apply_auto_bans(bans, db: AsyncDatabaseManager, bot=None, admin_chat_id=None):
+    """
+    Применяет пакет автоматических блокировок (utils.auto_ban.AutoBanEngine)
+    
+    Блокировки с одинаковыми сроком и причиной применяются одной транзакцией
+    межсетевого экрана и одной транзакцией базы данных.
+    
+    :param bans: Список кортежей (адрес или подсеть, длительность в секундах, причина)
+    :param db: Асинхронный объект для работы с базой данных
+    :param bot: Экземпляр бота (для уведомления администратора)
+    :param admin_chat_id: ID чата администратора
+    :return: Список примененных адресов и подсетей
+    """
+    groups = {}
+    for target, duration, reason in bans:
+        groups.setdefault((duration, reason), []).append(target)
+    
+    loop = asyncio.get_running_loop()
+    blocked = []
+    for (duration, reason), targets in groups.items():
+        if not await loop.run_in_executor(None, block_ips, targets, reason, duration):
+            logger.error(f"Не удалось применить автоматическую блокировку: {len(targets)} адресов ({reason})")
+            continue
+        
+        expires_at = now() + duration
+        await db.add_many_to_blocked(targets, f"{reason}, до {format_timestamp(expires_at)} UTC", expires_at)
+        if ban_scheduler:
+            ban_scheduler.schedule(expires_at)
+        blocked.extend((target, duration, reason) for target in targets)
+    
+    applied = [target for target, _, _ in blocked]
+    if not blocked or not bot or not admin_chat_id:
+        return applied
+    
+    lines = [
+        f"<code>{html.escape(target)}</code> на {format_duration(duration)}: {html.escape(reason)}"
+        for target, duration, reason in blocked[:MAX_INVALID_SHOWN]
+    ]
+    if len(blocked) > MAX_INVALID_SHOWN:
+        lines.append(f"... и еще {len(blocked) - MAX_INVALID_SHOWN}")
+    try:
+        await bot.send_message(
+            chat_id=int(admin_chat_id),
+            text=f"🚫 <b>Автоматически заблокировано адресов: {len(blocked)}</b>\n\n" + "\n".join(lines),
+            parse_mode="HTML"
+        )
+    except Exception as e:
+        logger.error(f"Не удалось отправить уведомление об автоматической блокировке: {e}")
+    return applied
+
 @router.callback_query(F.data.startswith("block:"))
 async def callback_block_ip(callback: types.CallbackQuery, state: FSMContext):
     """Обработчик блокировки IP-адреса"""
@@ -136,21 +671,17 @@ async def callback_block_ip(callback: types.CallbackQuery, state: FSMContext):
     await callback.answer()
 
 @router.callback_query(F.data.startswith("unblock:"))
-async def callback_unblock_ip(callback: types.CallbackQuery):
+async def callback_unblock_ip(callback: types.CallbackQuery, db: AsyncDatabaseManager):
     """Обработчик разблокировки IP-адреса"""
     ip = callback.data.split(":", 1)[1]
     
-    # Выполняем разблокировку
-    cmd_executor = CommandExecutor()
-    result = cmd_executor.execute_command(f"sudo iptables -D INPUT -s {ip} -j DROP")
-    
-    if result.strip():
-        await callback.message.answer(f"❌ Ошибка при разблокировке IP {ip}:\n{result}")
+    # Выполняем разблокировку (команды межсетевого экрана - вне событийного цикла)
+    loop = asyncio.get_running_loop()
+    if not await loop.run_in_executor(None, unblock_ip, ip):
+        await callback.message.answer(f"❌ Ошибка при разблокировке IP {ip} (подробности в журнале бота)")
     else:
         # Обновляем статус IP
-        if ip in ip_states:
-            ip_states[ip]["blocked"] = False
-            ip_states[ip]["unblock_time"] = None
+        await db.remove_from_blocked(ip)
         
         await callback.message.answer(f"✅ IP-адрес {ip} разблокирован")
     
@@ -188,7 +719,7 @@ async def callback_trace_ip(callback: types.CallbackQuery):
     await callback.answer()
 
 @router.message(F.text)
-async def handle_ban_period(message: types.Message, state: FSMContext):
+async def handle_ban_period(message: types.Message, state: FSMContext, db: AsyncDatabaseManager):
     """Обработчик периода блокировки"""
     # Получаем сохраненные данные
     data = await state.get_data()
@@ -200,31 +731,23 @@ async def handle_ban_period(message: types.Message, state: FSMContext):
         hours = int(message.text.strip())
         ip = data["ip"]
         
-        # Выполняем блокировку
-        cmd_executor = CommandExecutor()
-        result = cmd_executor.execute_command(f"sudo iptables -A INPUT -s {ip} -j DROP")
+        # Выполняем блокировку; механизм с поддержкой срока (ipset) снимет
+        # временную блокировку сам, BanScheduler - и в остальных случаях
+        loop = asyncio.get_running_loop()
+        blocked = await loop.run_in_executor(
+            None, block_ip, ip, "Заблокирован администратором", hours * 3600 if hours > 0 else None
+        )
         
-        if result.strip():
-            await message.answer(f"❌ Ошибка при блокировке IP {ip}:\n{result}")
+        if not blocked:
+            await message.answer(f"❌ Ошибка при блокировке IP {ip} (подробности в журнале бота)")
             await state.clear()
             return
         
-        # Обновляем статус IP
-        unblock_time = None
-        if hours > 0:
-            unblock_time = datetime.now() + timedelta(hours=hours)
-            
-            # Запускаем таймер разблокировки
-            asyncio.create_task(schedule_unblock(ip, hours))
-            
-            status_msg = f"на {hours} часов (до {unblock_time.strftime('%Y-%m-%d %H:%M:%S')})"
-        else:
-            status_msg = "навсегда"
-        
-        ip_states[ip] = {
-            "blocked": True,
-            "unblock_time": unblock_time
-        }
+        # Срок блокировки хранится в базе данных, снятие - в BanScheduler
+        expires_at, status_msg = ban_expiry(hours)
+        await db.add_to_blocked(ip, f"Заблокирован администратором {status_msg}", expires_at)
+        if expires_at and ban_scheduler:
+            ban_scheduler.schedule(expires_at)
         
         await message.answer(f"✅ IP-адрес {ip} заблокирован {status_msg}")
         
@@ -237,32 +760,172 @@ async def handle_ban_period(message: types.Message, state: FSMContext):
         await message.answer(f"❌ Произошла ошибка: {str(e)}")
         await state.clear()
 
-async def schedule_unblock(ip, hours):
-    """Планирует разблокировку IP через указанное количество часов"""
-    try:
-        # Ждем указанное время
-        await asyncio.sleep(hours * 3600)
-        
-        # Проверяем, всё ещё ли IP заблокирован
-        if ip in ip_states and ip_states[ip].get("blocked", False):
-            # Выполняем разблокировку
+def format_alert_group(group: AlertGroup) -> str:
+    """
+    Формирует текст сообщения для группы уведомлений
+    
+    :param group: Группа уведомлений
+    :return: Текст сообщения в формате HTML
+    """
+    ip = html.escape(group.ip)
+    
+    if group.count == 1:
+        alert_text = (
+            f"🚨 <b>УВЕДОМЛЕНИЕ О ВТОРЖЕНИИ!</b>\n\n"
+            f"🔹 <b>IP-адрес:</b> {ip}\n"
+            f"🔹 <b>Причина:</b> {html.escape(group.reasons[0])}\n"
+            f"🔹 <b>Время:</b> {group.first_seen.strftime('%Y-%m-%d %H:%M:%S')}\n\n"
+        )
+    else:
+        alert_text = (
+            f"🚨 <b>УВЕДОМЛЕНИЕ О ВТОРЖЕНИИ!</b> (×{group.count})\n\n"
+            f"🔹 <b>IP-адрес:</b> {ip}\n"
+            f"🔹 <b>Тип:</b> {html.escape(group.alert_type)}\n"
+            f"🔹 <b>Количество:</b> {group.count}\n"
+            f"🔹 <b>Первое:</b> {group.first_seen.strftime('%Y-%m-%d %H:%M:%S')}\n"
+            f"🔹 <b>Последнее:</b> {group.last_seen.strftime('%Y-%m-%d %H:%M:%S')}\n"
+            f"🔹 <b>Примеры причин:</b>\n"
+        )
+        for reason in group.reasons:
+            alert_text += f"  • {html.escape(reason)}\n"
+        alert_text += "\n"
+    
+    geo_info = group.context.get("geo_info")
+    if geo_info:
+        alert_text += f"🌐 <b>Геолокация:</b>\n{html.escape(geo_info)}\n\n"
+    
+    return alert_text
+
+async def send_alert_group(bot, chat_id, group: AlertGroup):
+    """
+    Отправляет сообщение для группы уведомлений или обновляет уже отправленное
+    
+    :param bot: Экземпляр бота
+    :param chat_id: ID чата для отправки
+    :param group: Группа уведомлений
+    """
+    # Геолокацию определяем один раз для группы (если IP валиден)
+    if "geo_info" not in group.context:
+        group.context["geo_info"] = None
+        ip_validator = IPValidator()
+        if ip_validator.is_valid_ip(group.ip) and group.ip != "127.0.0.1" and group.ip != "0.0.0.0":
             cmd_executor = CommandExecutor()
-            result = cmd_executor.execute_command(f"sudo iptables -D INPUT -s {ip} -j DROP")
+            loop = asyncio.get_running_loop()
+            geo_info = (await loop.run_in_executor(
+                None, cmd_executor.execute_command, f"geoiplookup {group.ip}"
+            )).strip()
             
-            if not result.strip():
-                # Обновляем статус IP
-                ip_states[ip]["blocked"] = False
-                ip_states[ip]["unblock_time"] = None
-                
-                logger.info(f"IP {ip} автоматически разблокирован после {hours} часов блокировки")
+            if geo_info and "IP Address not found" not in geo_info and not geo_info.startswith("Ошибка"):
+                group.context["geo_info"] = geo_info
     
-    except Exception as e:
-        logger.error(f"Ошибка при автоматической разблокировке IP {ip}: {e}")
+    alert_text = format_alert_group(group)
+    
+    # Добавляем кнопки действий
+    keyboard = types.InlineKeyboardMarkup(inline_keyboard=[
+        [
+            types.InlineKeyboardButton(text="🚫 Заблокировать", callback_data=f"block:{group.ip}"),
+            types.InlineKeyboardButton(text="🔍 Подробнее", callback_data=f"whois:{group.ip}")
+        ]
+    ])
+    
+    # Более серьезные уведомления отправляются раньше (см. utils.telegram_outbox)
+    with message_priority(get_alert_severity(group.alert_type)):
+        if group.message_id is None:
+            message = await bot.send_message(
+                chat_id=chat_id,
+                text=alert_text,
+                parse_mode="HTML",
+                reply_markup=keyboard
+            )
+            group.message_id = message.message_id
+        else:
+            await bot.edit_message_text(
+                chat_id=chat_id,
+                message_id=group.message_id,
+                text=alert_text,
+                parse_mode="HTML",
+                reply_markup=keyboard
+            )
+    
+    logger.info(f"Уведомление о вторжении отправлено в Telegram: IP={group.ip}, тип={group.alert_type}, количество={group.count}")
+
+def _get_coalescer(bot, chat_id) -> AlertCoalescer:
+    """Возвращает объединитель уведомлений для чата (создает при первом обращении)"""
+    coalescer = alert_coalescers.get(chat_id)
+    if coalescer is None:
+        coalescer = AlertCoalescer(
+            send=functools.partial(send_alert_group, bot, chat_id),
+            window=ALERT_COALESCE_WINDOW,
+            edit_ttl=ALERT_COALESCE_EDIT_TTL,
+            on_delivered=_spool_delivered,
+            on_released=_spool_released
+        )
+        alert_coalescers[chat_id] = coalescer
+    return coalescer
+
+def format_digest(summary: DigestSummary) -> str:
+    """
+    Формирует текст сводки уведомлений
+    
+    :param summary: Сводка за период
+    :return: Текст сообщения в формате HTML
+    """
+    text = (
+        f"📊 <b>Сводка уведомлений</b> за "
+        f"{summary.started.strftime('%Y-%m-%d %H:%M')} - {summary.finished.strftime('%H:%M')}\n\n"
+        f"🔹 <b>Всего уведомлений:</b> {summary.total}\n"
+        f"🔹 <b>Источников (IP):</b> {summary.unique_ips} "
+        f"(новых: {summary.new_ips}, повторных: {summary.unique_ips - summary.new_ips})\n\n"
+        f"<b>По типам:</b>\n"
+    )
+    for alert_type, count in summary.type_counts:
+        text += f"  • {html.escape(alert_type)}: {count}\n"
+    
+    text += f"\n<b>Топ-{len(summary.top_ips)} IP:</b>\n"
+    for idx, (ip, count, is_new) in enumerate(summary.top_ips, 1):
+        mark = "🆕" if is_new else "🔁"
+        text += f"{idx}. {mark} {html.escape(ip)} - {count}\n"
+    
+    if summary.untracked:
+        text += f"\n<i>Еще {summary.untracked} уведомлений от IP сверх лимита учета</i>\n"
+    
+    return text
+
+async def send_digest(bot, chat_id, summary: DigestSummary):
+    """
+    Отправляет сводку уведомлений
+    
+    :param bot: Экземпляр бота
+    :param chat_id: ID чата для отправки
+    :param summary: Сводка за период
+    """
+    with message_priority(PRIORITY_LOW):
+        await bot.send_message(chat_id=chat_id, text=format_digest(summary), parse_mode="HTML")
+    
+    logger.info(f"Сводка уведомлений отправлена в Telegram: {summary.total} уведомлений, {summary.unique_ips} IP")
+
+async def _get_digest(bot, chat_id) -> AlertDigest:
+    """Возвращает накопитель сводки для чата (создает и запускает при первом обращении)"""
+    digest = alert_digests.get(chat_id)
+    if digest is None:
+        digest = AlertDigest(
+            send=functools.partial(send_digest, bot, chat_id),
+            interval=ALERT_DIGEST_INTERVAL * 60,
+            on_delivered=_spool_delivered,
+            on_released=_spool_released
+        )
+        alert_digests[chat_id] = digest
+        await digest.start()
+    return digest
 
 async def process_hids_alert(alert_info, bot=None, admin_chat_id=None):
     """
     Обрабатывает уведомление от HIDS и отправляет его в Telegram
     
+    Повторяющиеся уведомления (тот же IP и тип) объединяются в одно сообщение
+    со счетчиком в пределах окна ALERT_COALESCE_WINDOW. Если включен режим
+    сводки, уведомления низкой серьезности попадают только в периодическую сводку.
+    
     :param alert_info: Информация об уведомлении
     :param bot: Экземпляр бота
     :param admin_chat_id: ID чата администратора
@@ -272,44 +935,30 @@ async def process_hids_alert(alert_info, bot=None, admin_chat_id=None):
         return
     
     try:
-        ip = alert_info.get('ip', 'N/A')
-        reason = alert_info.get('reason', 'Неизвестная причина')
-        timestamp = alert_info.get('timestamp', datetime.now())
-        
-        # Формируем сообщение
-        alert_text = (
-            f"🚨 <b>УВЕДОМЛЕНИЕ О ВТОРЖЕНИИ!</b>\n\n"
-            f"🔹 <b>IP-адрес:</b> {ip}\n"
-            f"🔹 <b>Причина:</b> {reason}\n"
-            f"🔹 <b>Время:</b> {timestamp.strftime('%Y-%m-%d %H:%M:%S')}\n\n"
-        )
+        ip = str(alert_info.get('ip', 'N/A'))
+        reason = str(alert_info.get('reason', 'Неизвестная причина'))
+        alert_type = get_alert_type(alert_info)
+        spool_id = alert_info.get('spool_id')
         
-        # Добавляем геолокацию (если IP валиден)
-        ip_validator = IPValidator()
-        if ip_validator.is_valid_ip(ip) and ip != "127.0.0.1" and ip != "0.0.0.0":
-            cmd_executor = CommandExecutor()
-            geo_info = cmd_executor.execute_command(f"geoiplookup {ip}").strip()
-            
-            if geo_info and "IP Address not found" not in geo_info:
-                alert_text += f"🌐 <b>Геолокация:</b>\n{geo_info}\n\n"
-        
-        # Добавляем кнопки действий
-        keyboard = types.InlineKeyboardMarkup(inline_keyboard=[
-            [
-                types.InlineKeyboardButton(text="🚫 Заблокировать", callback_data=f"block:{ip}"),
-                types.InlineKeyboardButton(text="🔍 Подробнее", callback_data=f"whois:{ip}")
-            ]
-        ])
-        
-        # Отправляем уведомление
-        await bot.send_message(
-            chat_id=admin_chat_id,
-            text=alert_text,
-            parse_mode="HTML",
-            reply_markup=keyboard
-        )
+        # Уведомления низкой серьезности - в периодическую сводку
+        if ALERT_DIGEST_INTERVAL > 0 and get_alert_severity(alert_type) < ALERT_DIGEST_SEVERITY:
+            digest = await _get_digest(bot, admin_chat_id)
+            digest.add(ip, alert_type, spool_id)
+            return
         
-        logger.info(f"Уведомление о вторжении отправлено в Telegram: IP={ip}, причина={reason}")
+        timestamp = get_alert_time(alert_info)
+        _get_coalescer(bot, admin_chat_id).add(ip, alert_type, reason, timestamp, spool_id)
     
     except Exception as e:
-        logger.error(f"Ошибка при отправке уведомления в Telegram: {e}") 
\ No newline at end of file
+        logger.error(f"Ошибка при обработке уведомления: {e}")
+        if alert_info.get('spool_id') is not None:
+            _spool_released([alert_info['spool_id']])
+
+async def flush_pending_alerts():
+    """Немедленно отправляет все накопленные уведомления (объединяемые и сводки)"""
+    for coalescer in list(alert_coalescers.values()):
+        await coalescer.flush_all()
+    
+    for digest in list(alert_digests.values()):
+        await digest.stop()
+    alert_digests.clear()
@@ -3,87 +3,90 @@
 
 """
 Модуль для прослушивания уведомлений от HIDS через UNIX-сокет.
+
+Слушатель работает в событийном цикле бота (loop.create_unix_server) и
+обслуживает произвольное число одновременных соединений. Отправитель может
+держать соединение открытым и передавать поток уведомлений, разделенных
+переводом строки (см. utils.frame_decoder). Старый режим "одно соединение -
+одно уведомление" также поддерживается.
+
+Данные читаются напрямую в буфер соединения (asyncio.BufferedProtocol) и
+разбираются из него без промежуточных копий. Принятые уведомления
+помещаются в ограниченную очередь (utils.alert_queue); пока очередь
+заполнена, чтение из соединения приостанавливается.
+
+Кроме уведомлений, отправитель может передать управляющий кадр
+{"cmd": "stats"} (ответ - строка JSON с метриками слушателя и очереди) или
+{"cmd": "reset_stats"} (сброс метрик). Их использует нагрузочный режим
+test_hids_alert.py.
 """
 
 import os
 import json
-import socket
-import threading
+import time
 import logging
 import asyncio
-import time
-from typing import Callable, Dict, Any, Optional
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Set, Tuple, Union
+
+from utils.alert_queue import AlertQueue
+from utils.metrics import LoopLagMonitor
+from utils.frame_decoder import FrameDecoder, FrameTooLargeError
 
 # Настройка логирования
 logger = logging.getLogger(__name__)
 
+# Размер буфера, в который читаются отбрасываемые данные разорванного соединения
+DISCARD_BUFFER_SIZE = 4096
+
 class HIDSListener:
     """
     Класс для прослушивания уведомлений от HIDS через UNIX-сокет.
-    
+
     Атрибуты:
         socket_path: Путь к UNIX-сокету
-        db_manager: Объект для работы с базой данных
-        callback: Асинхронная функция для обработки уведомлений
+        alert_queue: Очередь, в которую помещаются принятые уведомления
+        loop_monitor: Измеритель задержки событийного цикла (для метрик)
     """
-    
-    def __init__(self, socket_path: str, db_manager, callback: Callable = None):
+
+    def __init__(self, socket_path: str, alert_queue: AlertQueue,
+                 loop_monitor: Optional[LoopLagMonitor] = None):
         """
         Инициализация слушателя HIDS.
-        
+
         Args:
             socket_path: Путь к UNIX-сокету
-            db_manager: Объект для работы с базой данных
-            callback: Асинхронная функция для обработки уведомлений
+            alert_queue: Очередь, в которую помещаются принятые уведомления
+            loop_monitor: Измеритель задержки событийного цикла (для метрик)
         """
         self.socket_path = socket_path
-        self.db_manager = db_manager
-        self.callback = callback
+        self.alert_queue = alert_queue
+        self.loop_monitor = loop_monitor
         self.running = False
-        self.thread = None
-        self.loop = None
-        
-    def start(self):
-        """Запускает прослушивание в отдельном потоке."""
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._connections: Set["_AlertProtocol"] = set()
+
+        # Метрики
+        self.accepted = 0
+        self.received = 0
+        self.invalid = 0
+
+    async def start(self) -> None:
+        """Запускает UNIX-сервер в текущем событийном цикле."""
         if self.running:
             logger.warning("Слушатель HIDS уже запущен")
             return
-        
-        self.running = True
-        self.thread = threading.Thread(target=self._run_listener)
-        self.thread.daemon = True
-        self.thread.start()
-        logger.info("Слушатель HIDS запущен")
-        
-    def stop(self):
-        """Останавливает прослушивание."""
-        self.running = False
-        if self.thread:
-            self.thread.join(timeout=1.0)
-            self.thread = None
-        
-        # Удаляем сокет, если он существует
-        if os.path.exists(self.socket_path):
-            try:
-                os.unlink(self.socket_path)
-                logger.info(f"Сокет удален: {self.socket_path}")
-            except OSError as e:
-                logger.error(f"Ошибка при удалении сокета: {e}")
-        
-        logger.info("Слушатель HIDS остановлен")
-        
-    def _run_listener(self):
-        """Основной метод прослушивания (запускается в отдельном потоке)."""
+
         # Создаем директорию для сокета, если она не существует
         socket_dir = os.path.dirname(self.socket_path)
-        if not os.path.exists(socket_dir):
+        if socket_dir and not os.path.exists(socket_dir):
             try:
                 os.makedirs(socket_dir, exist_ok=True)
                 logger.info(f"Создана директория для сокета: {socket_dir}")
             except OSError as e:
                 logger.error(f"Не удалось создать директорию для сокета: {e}")
                 return
-        
+
         # Удаляем старый сокет, если он существует
         if os.path.exists(self.socket_path):
             try:
@@ -91,92 +94,235 @@ class HIDSListener:
             except OSError as e:
                 logger.error(f"Не удалось удалить существующий сокет: {e}")
                 return
-                
-        # Создаем и настраиваем сокет
-        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
-        server.bind(self.socket_path)
-        server.listen(5)
-        
-        # Устанавливаем неблокирующий режим
-        server.setblocking(False)
+
+        loop = asyncio.get_running_loop()
+        self._server = await loop.create_unix_server(lambda: _AlertProtocol(self), path=self.socket_path)
         os.chmod(self.socket_path, 0o777)  # Разрешаем доступ всем пользователям
-        
+        self.running = True
+
         logger.info(f"Сокет создан и прослушивается: {self.socket_path}")
-        
-        # Создаем событийный цикл для этого потока
-        self.loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(self.loop)
-        
-        # Основной цикл прослушивания
-        while self.running:
+
+    async def stop(self) -> None:
+        """Останавливает сервер и закрывает все соединения."""
+        self.running = False
+
+        if self._server:
+            self._server.close()
+
+            # Закрываем открытые соединения, иначе wait_closed будет ждать их завершения
+            connections = list(self._connections)
+            for connection in connections:
+                connection.close()
+
+            await self._server.wait_closed()
+            self._server = None
+
+            # Дожидаемся передачи в очередь уже принятых уведомлений
+            drains = [connection.drain_task for connection in connections if connection.drain_task]
+            if drains:
+                await asyncio.gather(*drains, return_exceptions=True)
+
+        # Удаляем сокет, если он существует
+        if os.path.exists(self.socket_path):
             try:
-                # Пытаемся принять подключение
-                readable, _, _ = select.select([server], [], [], 1.0)
-                
-                if server in readable:
-                    client, _ = server.accept()
-                    
-                    # Принимаем данные
-                    data = b""
-                    client.settimeout(1.0)
-                    
-                    while True:
-                        try:
-                            chunk = client.recv(4096)
-                            if not chunk:
-                                break
-                            data += chunk
-                        except socket.timeout:
-                            break
-                        
-                    client.close()
-                    
-                    if data:
-                        # Обрабатываем полученные данные
-                        self._process_data(data)
-            
-            except Exception as e:
-                logger.error(f"Ошибка при прослушивании сокета: {e}")
-                time.sleep(1.0)  # Чтобы избежать высокой загрузки CPU в случае ошибки
-        
-        # Закрываем сокет
-        server.close()
-        
-        # Закрываем событийный цикл
-        if self.loop:
-            self.loop.close()
-            
-    def _process_data(self, data: bytes):
+                os.unlink(self.socket_path)
+                logger.info(f"Сокет удален: {self.socket_path}")
+            except OSError as e:
+                logger.error(f"Ошибка при удалении сокета: {e}")
+
+        logger.info("Слушатель HIDS остановлен")
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Возвращает метрики слушателя и очереди уведомлений.
+
+        Returns:
+            Словарь с количеством соединений и кадров, метриками очереди и
+            задержкой событийного цикла
+        """
+        return {
+            "connections": len(self._connections),
+            "accepted": self.accepted,
+            "received": self.received,
+            "invalid": self.invalid,
+            "queue": self.alert_queue.stats(),
+            "loop_lag": self.loop_monitor.snapshot() if self.loop_monitor else {},
+        }
+
+    def handle_command(self, command: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Выполняет управляющую команду.
+
+        Args:
+            command: Управляющий кадр ({"cmd": "stats"} или {"cmd": "reset_stats"})
+
+        Returns:
+            Ответ на команду
         """
-        Обрабатывает полученные данные.
-        
+        cmd = command.get("cmd")
+        if cmd == "reset_stats":
+            self.accepted = len(self._connections)
+            self.received = 0
+            self.invalid = 0
+            self.alert_queue.reset_stats()
+            if self.loop_monitor:
+                self.loop_monitor.reset()
+            return {"ok": True}
+        if cmd == "stats":
+            return {"ok": True, "stats": self.stats()}
+
+        logger.warning(f"Неизвестная команда: {cmd}")
+        return {"ok": False, "error": f"unknown command: {cmd}"}
+
+    def _parse_frame(self, frame: Union[memoryview, bytes]) -> Optional[Dict[str, Any]]:
+        """
+        Разбирает один кадр.
+
         Args:
-            data: Полученные двоичные данные
+            frame: Один кадр (JSON-документ уведомления)
+
+        Returns:
+            Информация об уведомлении или None, если кадр некорректен
         """
         try:
-            # Декодируем JSON
-            alert_info = json.loads(data.decode('utf-8'))
-            
+            # Декодируем JSON прямо из буфера соединения
+            alert_info = json.loads(str(frame, 'utf-8'))
+
+            # Управляющие кадры передаются как есть
+            if isinstance(alert_info, dict) and "cmd" in alert_info:
+                return alert_info
+
             # Проверяем наличие необходимых полей
-            if not all(key in alert_info for key in ['ip', 'reason']):
+            if not isinstance(alert_info, dict) or not all(key in alert_info for key in ['ip', 'reason']):
                 logger.error(f"Получены некорректные данные: {alert_info}")
-                return
-            
+                self.invalid += 1
+                return None
+
             # Логируем уведомление
-            logger.info(f"Получено уведомление от HIDS: IP={alert_info['ip']}, причина={alert_info['reason']}")
-            
-            # Добавляем уведомление в базу данных
-            self.db_manager.add_incident(alert_info['ip'], alert_info['reason'])
-            
-            # Вызываем callback-функцию, если она задана
-            if self.callback:
-                asyncio.run_coroutine_threadsafe(self.callback(alert_info), self.loop)
-        
-        except json.JSONDecodeError as e:
+            logger.debug(f"Получено уведомление от HIDS: IP={alert_info['ip']}, причина={alert_info['reason']}")
+            return alert_info
+
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
             logger.error(f"Не удалось декодировать JSON: {e}")
-        
+
         except Exception as e:
             logger.error(f"Ошибка при обработке данных: {e}")
 
-# Добавляем import select для работы с сокетами неблокирующего режима
-import select 
\ No newline at end of file
+        self.invalid += 1
+        return None
+
+
+class _AlertProtocol(asyncio.BufferedProtocol):
+    """Обслуживает одно соединение отправителя."""
+
+    def __init__(self, listener: HIDSListener):
+        """
+        Инициализация соединения.
+
+        Args:
+            listener: Слушатель, принявший соединение
+        """
+        self.listener = listener
+        self.decoder = FrameDecoder()
+        self.transport: Optional[asyncio.Transport] = None
+        # Уведомления (с временем получения), не поместившиеся в заполненную очередь
+        self.pending: Deque[Tuple[Dict[str, Any], float]] = deque()
+        self.drain_task: Optional[asyncio.Task] = None
+        self.eof = False
+
+    def connection_made(self, transport: asyncio.BaseTransport) -> None:
+        self.transport = transport
+        self.listener._connections.add(self)
+        self.listener.accepted += 1
+
+    def connection_lost(self, exc: Optional[Exception]) -> None:
+        self.listener._connections.discard(self)
+
+    def get_buffer(self, sizehint: int) -> memoryview:
+        try:
+            return self.decoder.get_buffer(sizehint)
+        except FrameTooLargeError as e:
+            # Исключение из get_buffer asyncio считает фатальной ошибкой
+            # транспорта, поэтому соединение разрываем сами
+            logger.error(f"Соединение закрыто: {e}")
+            self.transport.abort()
+            # asyncio все равно прочитает данные в возвращенный буфер
+            # (buffer_updated их отбросит)
+            return memoryview(bytearray(DISCARD_BUFFER_SIZE))
+
+    def buffer_updated(self, nbytes: int) -> None:
+        if self.transport.is_closing():
+            # Данные после разрыва соединения (см. get_buffer)
+            return
+        for frame in self.decoder.buffer_updated(nbytes):
+            self._handle_frame(frame)
+
+    def eof_received(self) -> bool:
+        # Данные без завершающего перевода строки (старый режим)
+        frame = self.decoder.finish()
+        if frame:
+            self._handle_frame(frame)
+
+        self.eof = True
+        # Пока есть ожидающие уведомления, соединение закроется после их передачи
+        return self.drain_task is not None
+
+    def close(self) -> None:
+        """Закрывает соединение."""
+        if self.transport and not self.transport.is_closing():
+            self.transport.close()
+
+    def _handle_frame(self, frame: Union[memoryview, bytes]) -> None:
+        """
+        Обрабатывает один кадр: уведомление или управляющую команду.
+
+        Args:
+            frame: Один кадр
+        """
+        received_at = time.monotonic()
+        alert_info = self.listener._parse_frame(frame)
+        if alert_info is None:
+            return
+
+        if "cmd" in alert_info:
+            response = self.listener.handle_command(alert_info)
+            if not self.transport.is_closing():
+                self.transport.write(json.dumps(response).encode('utf-8') + b"\n")
+            return
+
+        self.listener.received += 1
+        self._enqueue(alert_info, received_at)
+
+    def _enqueue(self, alert_info: Dict[str, Any], received_at: float) -> None:
+        """
+        Передает уведомление в очередь или приостанавливает чтение, если она заполнена.
+
+        Args:
+            alert_info: Информация об уведомлении
+            received_at: Время получения уведомления (time.monotonic)
+        """
+        if not self.pending:
+            try:
+                self.listener.alert_queue.put_nowait(alert_info, received_at)
+                return
+            except asyncio.QueueFull:
+                pass
+
+        # Очередь заполнена: перестаем читать из сокета, пока она не освободится
+        self.pending.append((alert_info, received_at))
+        if self.drain_task is None:
+            self.transport.pause_reading()
+            self.drain_task = asyncio.get_running_loop().create_task(self._drain())
+
+    async def _drain(self) -> None:
+        """Передает отложенные уведомления в очередь и возобновляет чтение."""
+        try:
+            while self.pending:
+                await self.listener.alert_queue.put(*self.pending.popleft())
+        finally:
+            self.drain_task = None
+
+        if self.eof:
+            self.close()
+        elif not self.transport.is_closing():
+            self.transport.resume_reading()
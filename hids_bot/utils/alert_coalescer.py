@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Модуль для объединения повторяющихся уведомлений HIDS.
+
+Уведомления с одинаковыми IP и типом, пришедшие в течение окна объединения,
+сворачиваются в одну группу. По окончании окна группа отправляется одним
+сообщением со счетчиком; последующие уведомления той же группы обновляют
+(редактируют) это сообщение, пока группа не простаивает дольше edit_ttl.
+
+Для уведомлений из спула (см. database.alert_spool) объединитель сообщает,
+какие записи доставлены (on_delivered), а какие так и не удалось отправить
+до закрытия группы (on_released).
+"""
+
+import time
+import asyncio
+import logging
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Окно объединения и время жизни группы по умолчанию (в секундах)
+DEFAULT_WINDOW = 10.0
+DEFAULT_EDIT_TTL = 600.0
+
+# Количество сохраняемых примеров причин
+DEFAULT_MAX_SAMPLES = 3
+
+
+class AlertGroup:
+    """
+    Группа однотипных уведомлений от одного IP-адреса.
+
+    Атрибуты:
+        ip: IP-адрес источника
+        alert_type: Тип уведомлений
+        count: Общее количество уведомлений в группе
+        pending: Количество уведомлений, еще не отраженных в сообщении
+        first_seen: Время первого уведомления
+        last_seen: Время последнего уведомления
+        reasons: Примеры причин (без повторов)
+        message_id: ID отправленного сообщения (None, если еще не отправлено)
+        context: Данные обработчика, которые нужно сохранить между отправками
+        spool_ids: ID записей спула для уведомлений, еще не отраженных в сообщении
+    """
+
+    def __init__(self, ip: str, alert_type: str, first_seen: datetime):
+        self.ip = ip
+        self.alert_type = alert_type
+        self.count = 0
+        self.pending = 0
+        self.first_seen = first_seen
+        self.last_seen = first_seen
+        self.reasons: List[str] = []
+        self.message_id: Optional[int] = None
+        self.context: Dict[str, Any] = {}
+        self.spool_ids: List[int] = []
+
+        # Внутреннее состояние планировщика
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._flushing = False
+        self._flushed_at = 0.0
+
+
+class AlertCoalescer:
+    """
+    Объединяет уведомления по ключу (IP, тип) в пределах окна.
+
+    Атрибуты:
+        send: Асинхронная функция отправки группы; должна сохранить
+            group.message_id после первой отправки
+        window: Окно объединения в секундах (0 - отправлять сразу)
+        edit_ttl: Время простоя, после которого группа закрывается
+        max_samples: Количество сохраняемых примеров причин
+        on_delivered: Функция, вызываемая со списком доставленных ID спула
+        on_released: Функция, вызываемая со списком недоставленных ID спула
+            при закрытии группы
+    """
+
+    def __init__(self, send: Callable[[AlertGroup], Awaitable[None]],
+                 window: float = DEFAULT_WINDOW, edit_ttl: float = DEFAULT_EDIT_TTL,
+                 max_samples: int = DEFAULT_MAX_SAMPLES,
+                 on_delivered: Optional[Callable[[List[int]], None]] = None,
+                 on_released: Optional[Callable[[List[int]], None]] = None):
+        """
+        Инициализирует объединитель.
+
+        Args:
+            send: Асинхронная функция отправки группы
+            window: Окно объединения в секундах
+            edit_ttl: Время простоя, после которого группа закрывается
+            max_samples: Количество сохраняемых примеров причин
+            on_delivered: Функция, вызываемая со списком доставленных ID спула
+            on_released: Функция, вызываемая со списком недоставленных ID спула
+        """
+        self.send = send
+        self.window = max(0.0, window)
+        self.edit_ttl = max(self.window, edit_ttl)
+        self.max_samples = max_samples
+        self.on_delivered = on_delivered
+        self.on_released = on_released
+        self._groups: Dict[Tuple[str, str], AlertGroup] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    def add(self, ip: str, alert_type: str, reason: str, timestamp: datetime,
+            spool_id: Optional[int] = None) -> AlertGroup:
+        """
+        Добавляет уведомление в группу и планирует ее отправку.
+
+        Args:
+            ip: IP-адрес источника
+            alert_type: Тип уведомления
+            reason: Причина уведомления
+            timestamp: Время уведомления
+            spool_id: ID записи в спуле (если уведомление записано в спул)
+
+        Returns:
+            Группа, в которую попало уведомление
+        """
+        key = (ip, alert_type)
+        group = self._groups.get(key)
+        if group is None:
+            group = AlertGroup(ip, alert_type, timestamp)
+            self._groups[key] = group
+
+        group.count += 1
+        group.pending += 1
+        if timestamp < group.first_seen:
+            group.first_seen = timestamp
+        if timestamp > group.last_seen:
+            group.last_seen = timestamp
+        if len(group.reasons) < self.max_samples and reason not in group.reasons:
+            group.reasons.append(reason)
+        if spool_id is not None:
+            group.spool_ids.append(spool_id)
+
+        self._schedule(key, group)
+        return group
+
+    async def flush_all(self) -> None:
+        """Немедленно отправляет все группы с неотправленными уведомлениями."""
+        for key, group in list(self._groups.items()):
+            if group._timer:
+                group._timer.cancel()
+                group._timer = None
+            if group.pending and not group._flushing:
+                await self._flush(key, group)
+
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def _schedule(self, key: Tuple[str, str], group: AlertGroup) -> None:
+        """Планирует отправку группы по окончании окна."""
+        if group._timer or group._flushing:
+            return
+
+        loop = asyncio.get_running_loop()
+        if self.window:
+            group._timer = loop.call_later(self.window, self._start_flush, key, group)
+        else:
+            self._start_flush(key, group)
+
+    def _start_flush(self, key: Tuple[str, str], group: AlertGroup) -> None:
+        """Запускает отправку группы в отдельной задаче."""
+        group._timer = None
+        task = asyncio.get_running_loop().create_task(self._flush(key, group))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _flush(self, key: Tuple[str, str], group: AlertGroup) -> None:
+        """Отправляет (или обновляет) сообщение группы."""
+        group._flushing = True
+        sent = group.pending
+        spool_ids, group.spool_ids = group.spool_ids, []
+        success = False
+        try:
+            await self.send(group)
+            group.pending -= sent
+            success = True
+        except Exception as e:
+            # Неотправленные уведомления войдут в следующее сообщение группы
+            logger.error(f"Ошибка при отправке уведомлений для IP {group.ip}: {e}")
+            group.spool_ids = spool_ids + group.spool_ids
+        finally:
+            group._flushing = False
+            group._flushed_at = time.monotonic()
+
+        if success and spool_ids and self.on_delivered:
+            self.on_delivered(spool_ids)
+
+        if success and group.pending:
+            # За время отправки пришли новые уведомления
+            self._schedule(key, group)
+        else:
+            asyncio.get_running_loop().call_later(self.edit_ttl, self._expire, key, group)
+
+    def _expire(self, key: Tuple[str, str], group: AlertGroup) -> None:
+        """Закрывает группу, если она простаивала дольше edit_ttl."""
+        if self._groups.get(key) is not group:
+            return
+        if group._timer or group._flushing:
+            # Группа снова активна - срок будет назначен после следующей отправки
+            return
+
+        remaining = self.edit_ttl - (time.monotonic() - group._flushed_at)
+        if remaining > 0:
+            asyncio.get_running_loop().call_later(remaining, self._expire, key, group)
+            return
+
+        if group.pending:
+            # Уведомления так и не удалось отправить
+            logger.warning(f"Не доставлено уведомлений для IP {group.ip}: {group.pending}")
+            if group.spool_ids and self.on_released:
+                self.on_released(group.spool_ids)
+
+        del self._groups[key]
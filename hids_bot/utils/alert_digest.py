@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Модуль периодической сводки уведомлений HIDS низкой серьезности.
+
+Уведомления не отправляются по отдельности: счетчики по IP и типам
+обновляются по мере поступления, а раз в интервал отправляется одно
+сообщение со сводкой (топ IP, количество по типам, новые и повторные
+источники).
+
+Как и AlertCoalescer, накопитель сообщает, какие записи спула доставлены
+(on_delivered), а какие не удалось отправить (on_released).
+"""
+
+import asyncio
+import heapq
+import logging
+from collections import Counter, OrderedDict
+from datetime import datetime
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Интервал отправки сводки по умолчанию (в секундах)
+DEFAULT_INTERVAL = 600.0
+
+# Количество IP в топе сводки
+DEFAULT_TOP_N = 10
+
+# Максимальное количество различных IP, учитываемых за один период
+MAX_TRACKED_IPS = 100000
+
+# Количество IP, запоминаемых для определения повторных источников
+MAX_KNOWN_IPS = 100000
+
+
+class DigestSummary:
+    """
+    Сводка уведомлений за период.
+
+    Атрибуты:
+        started: Начало периода
+        finished: Конец периода
+        total: Общее количество уведомлений
+        unique_ips: Количество различных IP
+        new_ips: Количество IP, не встречавшихся в предыдущих сводках
+        type_counts: Количество уведомлений по типам (по убыванию)
+        top_ips: Список (ip, количество, новый ли IP) по убыванию количества
+        untracked: Количество уведомлений от IP сверх MAX_TRACKED_IPS
+    """
+
+    def __init__(self, started: datetime, finished: datetime, total: int, unique_ips: int, new_ips: int,
+                 type_counts: List[Tuple[str, int]], top_ips: List[Tuple[str, int, bool]], untracked: int):
+        self.started = started
+        self.finished = finished
+        self.total = total
+        self.unique_ips = unique_ips
+        self.new_ips = new_ips
+        self.type_counts = type_counts
+        self.top_ips = top_ips
+        self.untracked = untracked
+
+
+class AlertDigest:
+    """
+    Накопитель уведомлений для периодической сводки.
+
+    Атрибуты:
+        send: Асинхронная функция отправки сводки
+        interval: Интервал отправки в секундах
+        top_n: Количество IP в топе
+        on_delivered: Функция, вызываемая со списком доставленных ID спула
+        on_released: Функция, вызываемая со списком недоставленных ID спула
+    """
+
+    def __init__(self, send: Callable[[DigestSummary], Awaitable[None]],
+                 interval: float = DEFAULT_INTERVAL, top_n: int = DEFAULT_TOP_N,
+                 on_delivered: Optional[Callable[[List[int]], None]] = None,
+                 on_released: Optional[Callable[[List[int]], None]] = None):
+        """
+        Инициализирует накопитель.
+
+        Args:
+            send: Асинхронная функция отправки сводки
+            interval: Интервал отправки в секундах
+            top_n: Количество IP в топе
+            on_delivered: Функция, вызываемая со списком доставленных ID спула
+            on_released: Функция, вызываемая со списком недоставленных ID спула
+        """
+        self.send = send
+        self.interval = interval
+        self.top_n = top_n
+        self.on_delivered = on_delivered
+        self.on_released = on_released
+
+        # IP из предыдущих сводок (в порядке последнего появления)
+        self._known_ips: "OrderedDict[str, None]" = OrderedDict()
+        self._task: Optional[asyncio.Task] = None
+        self._reset()
+
+    def _reset(self) -> None:
+        """Начинает новый период."""
+        self._started = datetime.now()
+        self._total = 0
+        self._untracked = 0
+        self._ip_counts: Counter = Counter()
+        self._type_counts: Counter = Counter()
+        self._new_ips = 0
+        self._spool_ids: List[int] = []
+
+    def add(self, ip: str, alert_type: str, spool_id: Optional[int] = None) -> None:
+        """
+        Учитывает уведомление в текущем периоде.
+
+        Args:
+            ip: IP-адрес источника
+            alert_type: Тип уведомления
+            spool_id: ID записи в спуле (если уведомление записано в спул)
+        """
+        self._total += 1
+        if spool_id is not None:
+            self._spool_ids.append(spool_id)
+        self._type_counts[alert_type] += 1
+
+        if ip in self._ip_counts:
+            self._ip_counts[ip] += 1
+        elif len(self._ip_counts) < MAX_TRACKED_IPS:
+            self._ip_counts[ip] = 1
+            if ip not in self._known_ips:
+                self._new_ips += 1
+        else:
+            self._untracked += 1
+
+    async def start(self) -> None:
+        """Запускает периодическую отправку сводки."""
+        if not self._task:
+            self._task = asyncio.create_task(self._run(), name="alert-digest")
+
+    async def stop(self) -> None:
+        """Останавливает периодическую отправку и отправляет накопленную сводку."""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    async def flush(self) -> None:
+        """Отправляет сводку за текущий период (если были уведомления) и начинает новый."""
+        if not self._total:
+            self._started = datetime.now()
+            return
+
+        top = heapq.nlargest(self.top_n, self._ip_counts.items(), key=lambda item: item[1])
+        summary = DigestSummary(
+            started=self._started,
+            finished=datetime.now(),
+            total=self._total,
+            unique_ips=len(self._ip_counts),
+            new_ips=self._new_ips,
+            type_counts=self._type_counts.most_common(),
+            top_ips=[(ip, count, ip not in self._known_ips) for ip, count in top],
+            untracked=self._untracked,
+        )
+
+        # Запоминаем источники для определения повторных в следующих периодах
+        for ip in self._ip_counts:
+            self._known_ips[ip] = None
+            self._known_ips.move_to_end(ip)
+        while len(self._known_ips) > MAX_KNOWN_IPS:
+            self._known_ips.popitem(last=False)
+
+        spool_ids = self._spool_ids
+        self._reset()
+
+        try:
+            await self.send(summary)
+        except Exception as e:
+            # Уведомления из спула будут повторены и войдут в следующую сводку
+            logger.error(f"Ошибка при отправке сводки уведомлений: {e}")
+            if spool_ids and self.on_released:
+                self.on_released(spool_ids)
+            return
+
+        if spool_ids and self.on_delivered:
+            self.on_delivered(spool_ids)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush()
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Модуль ограниченной очереди уведомлений HIDS между слушателем сокета и
+обработчиками (запись в БД и отправка в Telegram).
+
+Если очередь заполнена, слушатель ожидает освобождения места и перестает
+читать из сокета, поэтому отправители замедляются, а память бота не растет.
+"""
+
+import time
+import queue
+import asyncio
+import functools
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from utils.metrics import LatencyHistogram
+from utils.alert_types import get_alert_type
+
+logger = logging.getLogger(__name__)
+
+# Размер очереди и количество обработчиков по умолчанию
+DEFAULT_QUEUE_SIZE = 1000
+DEFAULT_WORKERS = 4
+
+
+class AlertQueue:
+    """
+    Ограниченная очередь уведомлений с пулом обработчиков.
+
+    Атрибуты:
+        db_manager: Объект для работы с базой данных
+        callback: Асинхронная функция для обработки уведомлений (alert_info)
+        maxsize: Максимальное количество уведомлений в очереди
+        workers: Количество обработчиков
+        auto_ban: Механизм автоматической блокировки (utils.auto_ban.AutoBanEngine)
+    """
+
+    def __init__(self, db_manager,
+                 callback: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None,
+                 maxsize: int = DEFAULT_QUEUE_SIZE, workers: int = DEFAULT_WORKERS,
+                 auto_ban=None):
+        """
+        Инициализирует очередь.
+
+        Args:
+            db_manager: Объект для работы с базой данных
+            callback: Асинхронная функция для обработки уведомлений
+            maxsize: Максимальное количество уведомлений в очереди
+            workers: Количество обработчиков
+            auto_ban: Механизм автоматической блокировки (None - не блокировать)
+        """
+        self.db_manager = db_manager
+        self.callback = callback
+        self.auto_ban = auto_ban
+        self.maxsize = max(1, maxsize)
+        self.workers = max(1, workers)
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker_tasks: List[asyncio.Task] = []
+
+        # Метрики
+        self.wait_time = LatencyHistogram()
+        self.commit_latency = LatencyHistogram()
+        self.db_time = LatencyHistogram()
+        self.reset_stats()
+
+    async def start(self) -> None:
+        """Создает очередь и запускает обработчики в текущем событийном цикле."""
+        if self._worker_tasks:
+            return
+
+        self._queue = asyncio.Queue(maxsize=self.maxsize)
+        self._worker_tasks = [
+            asyncio.create_task(self._worker(), name=f"alert-worker-{idx}")
+            for idx in range(self.workers)
+        ]
+        logger.info(f"Очередь уведомлений запущена: размер={self.maxsize}, обработчиков={self.workers}")
+
+    async def stop(self, timeout: float = 5.0) -> None:
+        """
+        Дожидается обработки оставшихся уведомлений и останавливает обработчики.
+
+        Args:
+            timeout: Максимальное время ожидания обработки очереди в секундах
+        """
+        if not self._worker_tasks:
+            return
+
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Очередь уведомлений не обработана полностью: осталось {self._queue.qsize()}")
+
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+        logger.info("Очередь уведомлений остановлена")
+
+    def put_nowait(self, alert_info: Dict[str, Any], received_at: Optional[float] = None) -> None:
+        """
+        Помещает уведомление в очередь без ожидания.
+
+        Args:
+            alert_info: Информация об уведомлении
+            received_at: Время получения уведомления из сокета (time.monotonic)
+
+        Raises:
+            asyncio.QueueFull: если очередь заполнена
+        """
+        now = time.monotonic()
+        self._queue.put_nowait((now, received_at or now, alert_info))
+        self._account_enqueued()
+
+    async def put(self, alert_info: Dict[str, Any], received_at: Optional[float] = None) -> None:
+        """
+        Помещает уведомление в очередь, ожидая свободного места.
+
+        Args:
+            alert_info: Информация об уведомлении
+            received_at: Время получения уведомления из сокета (time.monotonic)
+        """
+        try:
+            self.put_nowait(alert_info, received_at)
+        except asyncio.QueueFull:
+            self.full_waits += 1
+            if self.full_waits == 1 or self.full_waits % 1000 == 0:
+                logger.warning(f"Очередь уведомлений заполнена ({self.maxsize}), отправители замедляются")
+            now = time.monotonic()
+            await self._queue.put((now, received_at or now, alert_info))
+            self._account_enqueued()
+
+    def _account_enqueued(self) -> None:
+        """Обновляет счетчики после добавления уведомления в очередь."""
+        self.enqueued += 1
+        depth = self._queue.qsize()
+        if depth > self.max_depth:
+            self.max_depth = depth
+
+    def depth(self) -> int:
+        """
+        Возвращает текущее количество уведомлений в очереди.
+
+        Returns:
+            Количество ожидающих уведомлений
+        """
+        return self._queue.qsize() if self._queue else 0
+
+    def reset_stats(self) -> None:
+        """Сбрасывает счетчики и гистограммы (например, перед нагрузочным тестом)."""
+        self.wait_time.reset()
+        self.commit_latency.reset()
+        self.db_time.reset()
+        self.enqueued = 0
+        self.processed = 0
+        self.failed = 0
+        self.whitelisted = 0
+        self.full_waits = 0
+        self.db_full_waits = 0
+        self.max_depth = self.depth()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Возвращает метрики очереди.
+
+        Returns:
+            Словарь с глубиной очереди, счетчиками, временем ожидания в очереди,
+            временем постановки в очередь записи, задержкой от получения
+            уведомления до фиксации в базе данных и метриками записи
+        """
+        return {
+            "depth": self.depth(),
+            "max_depth": self.max_depth,
+            "maxsize": self.maxsize,
+            "workers": self.workers,
+            "enqueued": self.enqueued,
+            "processed": self.processed,
+            "failed": self.failed,
+            "whitelisted": self.whitelisted,
+            "full_waits": self.full_waits,
+            "db_full_waits": self.db_full_waits,
+            "wait_time": self.wait_time.snapshot(),
+            "commit_latency": self.commit_latency.snapshot(),
+            "db_time": self.db_time.snapshot(),
+            "db": self.db_manager.stats() if hasattr(self.db_manager, "stats") else {},
+            "auto_ban": self.auto_ban.stats() if self.auto_ban else {},
+        }
+
+    def _committed(self, received_at: float, future) -> None:
+        """Учитывает задержку до фиксации инцидента (вызывается из потока записи)."""
+        if not future.cancelled() and future.exception() is None:
+            self.commit_latency.record(time.monotonic() - received_at)
+
+    async def _worker(self) -> None:
+        """Обработчик: забирает уведомления из очереди и обрабатывает их."""
+        while True:
+            enqueued_at, received_at, alert_info = await self._queue.get()
+            try:
+                started = time.monotonic()
+                self.wait_time.record(started - enqueued_at)
+
+                # Добавляем уведомление в базу данных (фиксация выполняется в фоне пакетами).
+                # Если очередь записи заполнена, место ожидается в потоке пула, а не
+                # в событийном цикле: обработчик приостанавливается, очередь уведомлений
+                # заполняется, и слушатель замедляет отправителей
+                alert_type = get_alert_type(alert_info)
+                try:
+                    future = self.db_manager.add_incident(
+                        alert_info['ip'], alert_info['reason'], alert_type=alert_type, block=False
+                    )
+                except queue.Full:
+                    self.db_full_waits += 1
+                    future = await asyncio.get_running_loop().run_in_executor(None, functools.partial(
+                        self.db_manager.add_incident,
+                        alert_info['ip'], alert_info['reason'], alert_type=alert_type
+                    ))
+                self.db_time.record(time.monotonic() - started)
+                if future is None:
+                    self.commit_latency.record(time.monotonic() - received_at)
+                else:
+                    future.add_done_callback(functools.partial(self._committed, received_at))
+
+                # Счетчики автоматической блокировки (в памяти, блокировки применяются пакетами)
+                if self.auto_ban:
+                    self.auto_ban.observe(alert_info['ip'], alert_type)
+
+                # IP из белого списка (проверка по множеству в памяти) - инцидент
+                # сохраняется, но уведомление не отправляется
+                if self.db_manager.is_in_whitelist(alert_info['ip']):
+                    self.whitelisted += 1
+                elif self.callback:
+                    await self.callback(alert_info)
+
+                self.processed += 1
+
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Ошибка при обработке уведомления: {e}")
+
+            finally:
+                self._queue.task_done()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Модуль для определения типа и уровня серьезности уведомлений HIDS.
+
+Новые версии HIDS передают тип в поле "type". Для уведомлений без этого
+поля тип определяется по тексту причины (формулировки из src/modules).
+"""
+
+from datetime import datetime
+from typing import Any, Dict
+
+# Уровни серьезности (совпадают с AlertSystem в src/alert/alert_system.cpp)
+ALERT_SEVERITY = {
+    "BRUTE_FORCE": 5,
+    "ERROR": 4,
+    "FILE_CHANGE": 4,
+    "FAILED_LOGIN": 2,
+    "SUCCESS_LOGIN": 1,
+}
+
+# Тип и уровень для уведомлений, которые не удалось классифицировать
+UNKNOWN_ALERT_TYPE = "UNKNOWN"
+UNKNOWN_SEVERITY = 3
+
+# Начало текста причины -> тип уведомления
+_REASON_PREFIXES = (
+    ("Брутфорс атака", "BRUTE_FORCE"),
+    ("Неудачная попытка входа", "FAILED_LOGIN"),
+    ("Успешный вход", "SUCCESS_LOGIN"),
+    ("Изменен критичный файл", "FILE_CHANGE"),
+)
+
+# Формат времени в уведомлениях HIDS
+ALERT_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def get_alert_type(alert_info: Dict[str, Any]) -> str:
+    """
+    Определяет тип уведомления.
+
+    Args:
+        alert_info: Информация об уведомлении
+
+    Returns:
+        Тип уведомления (BRUTE_FORCE, FAILED_LOGIN, ...) или UNKNOWN
+    """
+    alert_type = alert_info.get("type")
+    if isinstance(alert_type, str) and alert_type:
+        return alert_type.upper()
+
+    reason = str(alert_info.get("reason", ""))
+    for prefix, prefix_type in _REASON_PREFIXES:
+        if reason.startswith(prefix):
+            return prefix_type
+
+    return UNKNOWN_ALERT_TYPE
+
+
+def get_alert_severity(alert_type: str) -> int:
+    """
+    Возвращает уровень серьезности для типа уведомления.
+
+    Args:
+        alert_type: Тип уведомления
+
+    Returns:
+        Уровень серьезности (1 - информационный, 5 - высокий)
+    """
+    return ALERT_SEVERITY.get(alert_type, UNKNOWN_SEVERITY)
+
+
+def get_alert_time(alert_info: Dict[str, Any]) -> datetime:
+    """
+    Возвращает время уведомления.
+
+    Args:
+        alert_info: Информация об уведомлении
+
+    Returns:
+        Время из поля "timestamp" или текущее время, если его нет или оно некорректно
+    """
+    timestamp = alert_info.get("timestamp")
+    if isinstance(timestamp, datetime):
+        return timestamp
+
+    if isinstance(timestamp, str):
+        try:
+            return datetime.strptime(timestamp, ALERT_TIME_FORMAT)
+        except ValueError:
+            pass
+
+    return datetime.now()
@@ -0,0 +1,586 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Модуль автоматической блокировки IP-адресов по входящим уведомлениям HIDS.
+
+Политика читается из config/hids.conf (auto_block_ip, block_duration и
+пороги auto_block_threshold_<ТИП>=количество/окно). Для каждой пары
+(IP, тип уведомления) хранится скользящее окно - кольцевой буфер из
+"количество" последних моментов времени: порог превышен, если самый старый
+момент в буфере не старше окна. Для подсетей (/24 для IPv4, /64 для IPv6),
+где пороги больше, - кольцевой буфер счетчиков по интервалам окна.
+Проверка и обновление - O(1) на уведомление; окна, не получавшие
+уведомлений дольше окна, удаляются.
+
+Решение о блокировке принимается синхронно в обработчике уведомлений, без
+запросов к базе данных и запуска процессов (белый список и заблокированные
+IP проверяются по множествам в памяти DatabaseManager). Сами блокировки
+накапливаются и применяются пакетами в отдельной задаче: одна транзакция
+межсетевого экрана и одна транзакция базы данных на пакет. Пока пакет
+применяется, его адреса не блокируются повторно, а нарушение учитывается
+в истории только после успешного применения.
+
+Повторные нарушители блокируются на срок, умноженный на block_escalation
+за каждую предыдущую автоматическую блокировку (не более
+block_duration_max); история сбрасывается через block_escalation_reset
+секунд без нарушений.
+"""
+
+import time
+import array
+import socket
+import asyncio
+import logging
+import ipaddress
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from utils.alert_types import ALERT_SEVERITY, UNKNOWN_ALERT_TYPE
+
+logger = logging.getLogger(__name__)
+
+# Путь к конфигурации HIDS (бот запускается из каталога hids_bot)
+DEFAULT_CONFIG_PATH = "../config/hids.conf"
+
+# Длительность блокировки по умолчанию (в секундах)
+DEFAULT_BLOCK_DURATION = 3600
+
+# Пороги по умолчанию: тип -> (количество, окно в секундах). Брутфорс HIDS
+# уже обнаруживает сам, неудачные входы считаются по bruteforce_threshold/
+# bruteforce_window; остальные типы без явного порога не блокируются
+DEFAULT_THRESHOLDS: Dict[str, Tuple[int, float]] = {
+    "BRUTE_FORCE": (1, 300.0),
+    "FAILED_LOGIN": (5, 300.0),
+}
+
+# Префиксы подсетей для порога по подсети
+DEFAULT_SUBNET_PREFIX = 24
+DEFAULT_SUBNET_PREFIX6 = 64
+
+# Рост длительности для повторных нарушителей, ее максимум и срок хранения истории (в секундах)
+DEFAULT_ESCALATION = 4.0
+DEFAULT_MAX_DURATION = 30 * 86400
+DEFAULT_ESCALATION_RESET = 7 * 86400
+
+# Количество интервалов приближенного окна подсети
+SUBNET_BUCKETS = 10
+
+# Максимальное количество скользящих окон (при превышении удаляются самые давние)
+DEFAULT_MAX_ENTRIES = 200000
+
+# Задержка применения накопленных блокировок (в секундах)
+DEFAULT_FLUSH_DELAY = 0.2
+
+# Количество простаивающих окон, проверяемых на удаление за одно уведомление
+_EVICT_PER_ALERT = 2
+
+# Ключ подсети: (версия IP, номер подсети)
+SubnetKey = Tuple[int, int]
+
+
+def _parse_threshold(value: str) -> Optional[Tuple[int, float]]:
+    """
+    Разбирает порог "количество/окно" ("10/300"; "0" - не блокировать).
+
+    Raises:
+        ValueError: Если значение некорректно
+    """
+    count, _, window = value.partition("/")
+    count = int(count)
+    if count <= 0:
+        return None
+    return count, float(window) if window else 300.0
+
+
+def read_config(path: str) -> Dict[str, str]:
+    """
+    Читает файл конфигурации HIDS (строки ключ=значение, комментарии после #).
+
+    Args:
+        path: Путь к файлу
+
+    Returns:
+        Словарь параметров (пустой, если файла нет)
+    """
+    values = {}
+    try:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.split("#", 1)[0].strip()
+                if "=" in line:
+                    key, value = line.split("=", 1)
+                    values[key.strip()] = value.strip()
+    except FileNotFoundError:
+        logger.warning(f"Файл конфигурации HIDS не найден: {path}")
+    return values
+
+
+class AutoBanPolicy:
+    """
+    Политика автоматической блокировки.
+
+    Атрибуты:
+        enabled: Включена ли автоматическая блокировка (auto_block_ip)
+        duration: Длительность первой блокировки в секундах (block_duration)
+        thresholds: Тип уведомления -> (количество, окно в секундах)
+        subnet_threshold: Порог для подсети (None - не блокировать подсети)
+        subnet_prefix: Префикс подсети IPv4
+        subnet_prefix6: Префикс подсети IPv6
+        escalation: Множитель длительности для повторных нарушителей
+        max_duration: Максимальная длительность блокировки в секундах
+        escalation_reset: Срок хранения истории нарушений в секундах
+    """
+
+    def __init__(self, enabled: bool = False, duration: int = DEFAULT_BLOCK_DURATION,
+                 thresholds: Optional[Dict[str, Tuple[int, float]]] = None,
+                 subnet_threshold: Optional[Tuple[int, float]] = None,
+                 subnet_prefix: int = DEFAULT_SUBNET_PREFIX, subnet_prefix6: int = DEFAULT_SUBNET_PREFIX6,
+                 escalation: float = DEFAULT_ESCALATION, max_duration: int = DEFAULT_MAX_DURATION,
+                 escalation_reset: float = DEFAULT_ESCALATION_RESET):
+        self.enabled = enabled
+        self.duration = max(1, duration)
+        self.thresholds = dict(DEFAULT_THRESHOLDS if thresholds is None else thresholds)
+        self.subnet_threshold = subnet_threshold
+        self.subnet_prefix = subnet_prefix
+        self.subnet_prefix6 = subnet_prefix6
+        self.escalation = max(1.0, escalation)
+        self.max_duration = max(self.duration, max_duration)
+        self.escalation_reset = escalation_reset
+
+    @classmethod
+    def from_config(cls, values: Dict[str, str]) -> "AutoBanPolicy":
+        """
+        Создает политику из параметров hids.conf.
+
+        Args:
+            values: Параметры (см. read_config)
+
+        Returns:
+            Политика (некорректные параметры пропускаются с записью в журнал)
+        """
+        policy = cls(enabled=values.get("auto_block_ip", "false").lower() in ("1", "true", "yes", "on"))
+
+        def number(key, convert, default):
+            try:
+                return convert(values[key]) if key in values else default
+            except ValueError:
+                logger.error(f"Некорректное значение {key} в конфигурации HIDS: {values[key]}")
+                return default
+
+        policy.duration = max(1, number("block_duration", int, policy.duration))
+        policy.escalation = max(1.0, number("block_escalation", float, policy.escalation))
+        policy.max_duration = max(policy.duration, number("block_duration_max", int, policy.max_duration))
+        policy.escalation_reset = number("block_escalation_reset", float, policy.escalation_reset)
+        policy.subnet_prefix = number("auto_block_subnet_prefix", int, policy.subnet_prefix)
+        policy.subnet_prefix6 = number("auto_block_subnet_prefix6", int, policy.subnet_prefix6)
+
+        # Неудачные входы по умолчанию - по порогу брутфорса ядра HIDS
+        count = number("bruteforce_threshold", int, DEFAULT_THRESHOLDS["FAILED_LOGIN"][0])
+        window = number("bruteforce_window", float, DEFAULT_THRESHOLDS["FAILED_LOGIN"][1])
+        policy.thresholds["FAILED_LOGIN"] = (count, window)
+
+        prefix = "auto_block_threshold_"
+        for key, value in values.items():
+            if not key.startswith(prefix) and key != "auto_block_subnet_threshold":
+                continue
+            try:
+                threshold = _parse_threshold(value)
+            except ValueError:
+                logger.error(f"Некорректный порог {key} в конфигурации HIDS: {value}")
+                continue
+            if key == "auto_block_subnet_threshold":
+                policy.subnet_threshold = threshold
+            elif threshold is None:
+                policy.thresholds.pop(key[len(prefix):].upper(), None)
+            else:
+                policy.thresholds[key[len(prefix):].upper()] = threshold
+
+        unknown = set(policy.thresholds) - set(ALERT_SEVERITY) - {UNKNOWN_ALERT_TYPE}
+        if unknown:
+            logger.warning(f"Пороги автоматической блокировки для неизвестных типов: {', '.join(sorted(unknown))}")
+        return policy
+
+
+def load_policy(path: str = DEFAULT_CONFIG_PATH) -> AutoBanPolicy:
+    """
+    Загружает политику автоматической блокировки из файла конфигурации HIDS.
+
+    Args:
+        path: Путь к hids.conf
+
+    Returns:
+        Политика (выключенная, если файла нет)
+    """
+    return AutoBanPolicy.from_config(read_config(path))
+
+
+class SlidingWindow:
+    """
+    Скользящее окно: кольцевой буфер из count последних моментов времени.
+
+    Атрибуты:
+        times: Моменты последних уведомлений (time.monotonic)
+        pos: Позиция самого старого момента (следующая для записи)
+        last_seen: Момент последнего уведомления
+    """
+
+    __slots__ = ("times", "pos", "last_seen")
+
+    def __init__(self, count: int):
+        self.times = array.array("d", [float("-inf")]) * count
+        self.pos = 0
+        self.last_seen = float("-inf")
+
+    def hit(self, now: float, window: float) -> bool:
+        """
+        Учитывает уведомление.
+
+        Args:
+            now: Момент уведомления
+            window: Окно в секундах
+
+        Returns:
+            True если в окне набралось count уведомлений
+        """
+        times = self.times
+        times[self.pos] = now
+        self.pos = (self.pos + 1) % len(times)
+        self.last_seen = now
+        # После записи самый старый из count последних моментов - на позиции pos
+        return now - times[self.pos] <= window
+
+    def reset(self) -> None:
+        """Очищает окно (после блокировки)."""
+        self.times[:] = array.array("d", [float("-inf")]) * len(self.times)
+
+
+class BucketWindow:
+    """
+    Приближенное скользящее окно для больших порогов (подсети): кольцевой
+    буфер счетчиков по интервалам длиной window / buckets.
+
+    Память не зависит от порога; учитываются уведомления за последние
+    buckets интервалов, то есть окно короче заданного не более чем на один
+    интервал.
+
+    Атрибуты:
+        counts: Количество уведомлений по интервалам
+        count: Порог
+        width: Длина интервала в секундах
+        head: Номер текущего интервала
+        total: Количество уведомлений в окне
+        last_seen: Момент последнего уведомления
+    """
+
+    __slots__ = ("counts", "count", "width", "head", "total", "last_seen")
+
+    def __init__(self, count: int, window: float, buckets: int = SUBNET_BUCKETS):
+        self.counts = array.array("I", [0]) * buckets
+        self.count = count
+        self.width = max(window / buckets, 1e-3)
+        self.head = 0
+        self.total = 0
+        self.last_seen = float("-inf")
+
+    def hit(self, now: float, window: float) -> bool:
+        """
+        Учитывает уведомление.
+
+        Args:
+            now: Момент уведомления
+            window: Окно в секундах (задано при создании)
+
+        Returns:
+            True если в окне набралось count уведомлений
+        """
+        counts = self.counts
+        size = len(counts)
+        bucket = int(now // self.width)
+        if bucket != self.head:
+            # Очищаем интервалы, вышедшие из окна
+            for step in range(1, min(bucket - self.head, size) + 1):
+                idx = (self.head + step) % size
+                self.total -= counts[idx]
+                counts[idx] = 0
+            self.head = bucket
+        counts[bucket % size] += 1
+        self.total += 1
+        self.last_seen = now
+        return self.total >= self.count
+
+    def reset(self) -> None:
+        """Очищает окно (после блокировки)."""
+        self.counts[:] = array.array("I", [0]) * len(self.counts)
+        self.total = 0
+
+
+class AutoBanEngine:
+    """
+    Счетчики уведомлений и применение автоматических блокировок.
+
+    Атрибуты:
+        policy: Политика блокировки
+        apply: Асинхронная функция применения блокировок: получает список
+            (адрес или подсеть, длительность в секундах, причина) и
+            возвращает примененные адреса и подсети
+        is_whitelisted: Проверка IP по белому списку (без запросов к базе)
+        is_blocked: Проверка, заблокирован ли адрес (без запросов к базе)
+        whitelist: Функция, возвращающая адреса белого списка (для проверки подсетей)
+    """
+
+    def __init__(self, policy: AutoBanPolicy,
+                 apply: Callable[[List[Tuple[str, int, str]]], Awaitable[Iterable[str]]],
+                 is_whitelisted: Callable[[str], bool], is_blocked: Callable[[str], bool],
+                 whitelist: Optional[Callable[[], Iterable[str]]] = None,
+                 max_entries: int = DEFAULT_MAX_ENTRIES, flush_delay: float = DEFAULT_FLUSH_DELAY):
+        """
+        Инициализирует механизм автоматической блокировки.
+
+        Args:
+            policy: Политика блокировки
+            apply: Асинхронная функция применения блокировок
+            is_whitelisted: Проверка IP по белому списку
+            is_blocked: Проверка, заблокирован ли адрес
+            whitelist: Функция, возвращающая адреса белого списка
+            max_entries: Максимальное количество скользящих окон каждого вида
+            flush_delay: Задержка применения накопленных блокировок в секундах
+        """
+        self.policy = policy
+        self.apply = apply
+        self.is_whitelisted = is_whitelisted
+        self.is_blocked = is_blocked
+        self.whitelist = whitelist
+        self.max_entries = max(1, max_entries)
+        self.flush_delay = flush_delay
+
+        # Окна простаивают, если не получали уведомлений дольше самого длинного окна
+        windows = [window for _, window in policy.thresholds.values()]
+        if policy.subnet_threshold:
+            windows.append(policy.subnet_threshold[1])
+        self._idle = max(windows, default=0.0)
+
+        # Скользящие окна в порядке последнего уведомления (первыми - самые давние)
+        self._windows: "OrderedDict[Tuple[str, str], SlidingWindow]" = OrderedDict()
+        self._subnet_windows: "OrderedDict[SubnetKey, BucketWindow]" = OrderedDict()
+        # Подсети, заблокированные автоматически: ключ -> подсеть в формате CIDR
+        self._subnet_bans: Dict[SubnetKey, str] = {}
+        # История нарушений: адрес или подсеть -> (количество блокировок, время последней)
+        self._offenses: "OrderedDict[str, Tuple[int, float]]" = OrderedDict()
+
+        # Блокировки, ожидающие применения: адрес или подсеть -> (длительность, причина, момент)
+        self._pending: Dict[str, Tuple[int, str, float]] = {}
+        # Адреса и подсети пакета, который применяется сейчас
+        self._in_flight: Set[str] = set()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+        # Метрики
+        self.observed = 0
+        self.banned = 0
+        self.banned_subnets = 0
+        self.evicted = 0
+        self.failed = 0
+
+    async def start(self) -> None:
+        """Запускает применение блокировок в текущем событийном цикле."""
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            if self._pending:
+                self._wakeup.set()
+            self._task = asyncio.create_task(self._run(), name="auto-ban")
+
+    async def stop(self) -> None:
+        """Применяет накопленные блокировки и останавливает задачу."""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    def observe(self, ip: str, alert_type: str, now: Optional[float] = None) -> Optional[str]:
+        """
+        Учитывает уведомление и при превышении порога ставит блокировку в очередь.
+
+        Args:
+            ip: IP-адрес источника
+            alert_type: Тип уведомления
+            now: Момент уведомления (по умолчанию time.monotonic())
+
+        Returns:
+            Адрес или подсеть, поставленные в очередь на блокировку, или None
+        """
+        policy = self.policy
+        threshold = policy.thresholds.get(alert_type)
+        # Уведомления без порога (например, новые соединения) не учитываются и для подсетей
+        if threshold is None:
+            return None
+
+        self.observed += 1
+        if ip in self._pending or ip in self._in_flight or self.is_whitelisted(ip) or self.is_blocked(ip):
+            return None
+        if now is None:
+            now = time.monotonic()
+
+        # Номер подсети (заодно проверка, что это IP-адрес)
+        try:
+            version, prefix = 4, policy.subnet_prefix
+            packed = socket.inet_pton(socket.AF_INET, ip)
+        except OSError:
+            try:
+                version, prefix = 6, policy.subnet_prefix6
+                packed = socket.inet_pton(socket.AF_INET6, ip)
+            except OSError:
+                return None
+        subnet = (version, int.from_bytes(packed, "big") >> (len(packed) * 8 - prefix))
+
+        banned_subnet = self._subnet_bans.get(subnet)
+        if banned_subnet is not None:
+            if banned_subnet in self._pending or banned_subnet in self._in_flight or self.is_blocked(banned_subnet):
+                return None
+            # Подсеть разблокирована (по сроку или администратором)
+            del self._subnet_bans[subnet]
+
+        target = None
+        count, window = threshold
+        key = (ip, alert_type)
+        counter = self._windows.get(key)
+        if counter is None:
+            counter = self._windows[key] = SlidingWindow(count)
+        else:
+            self._windows.move_to_end(key)
+        if counter.hit(now, window):
+            counter.reset()
+            target = ip
+            self._queue(ip, now, f"Автоблокировка: {alert_type}, {count} за {window:g} с")
+        elif policy.subnet_threshold is not None:
+            target = self._observe_subnet(subnet, ip, now)
+
+        self._evict(now)
+        return target
+
+    async def flush(self) -> None:
+        """Применяет накопленные блокировки."""
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        bans = [(target, duration, reason) for target, (duration, reason, _) in pending.items()]
+        # До возврата из apply адреса пакета не заблокированы ни в памяти
+        # DatabaseManager, ни в очереди - без этого уведомления, пришедшие за
+        # время применения, поставили бы повторную блокировку
+        self._in_flight.update(pending)
+        try:
+            applied = set(await self.apply(bans))
+        except Exception as e:
+            applied = set()
+            logger.error(f"Ошибка при применении автоматических блокировок ({len(bans)}): {e}")
+        finally:
+            self._in_flight.difference_update(pending)
+
+        for target, (_, _, queued_at) in pending.items():
+            if target in applied:
+                self._record_offense(target, queued_at)
+                self.banned += 1
+                if "/" in target:
+                    self.banned_subnets += 1
+            else:
+                # Неудачная блокировка не считается нарушением; подсеть можно заблокировать снова
+                self.failed += 1
+                for key in [key for key, cidr in self._subnet_bans.items() if cidr == target]:
+                    del self._subnet_bans[key]
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Возвращает метрики автоматической блокировки.
+
+        Returns:
+            Словарь с количеством учтенных уведомлений, блокировок и окон
+        """
+        return {
+            "observed": self.observed,
+            "banned": self.banned,
+            "banned_subnets": self.banned_subnets,
+            "failed": self.failed,
+            "windows": len(self._windows),
+            "subnet_windows": len(self._subnet_windows),
+            "offenders": len(self._offenses),
+            "evicted": self.evicted,
+            "pending": len(self._pending),
+            "in_flight": len(self._in_flight),
+        }
+
+    def _observe_subnet(self, subnet: SubnetKey, ip: str, now: float) -> Optional[str]:
+        """Учитывает уведомление в окне подсети."""
+        count, window = self.policy.subnet_threshold
+        counter = self._subnet_windows.get(subnet)
+        if counter is None:
+            counter = self._subnet_windows[subnet] = BucketWindow(count, window)
+        else:
+            self._subnet_windows.move_to_end(subnet)
+        if not counter.hit(now, window):
+            return None
+        counter.reset()
+
+        prefix = self.policy.subnet_prefix if subnet[0] == 4 else self.policy.subnet_prefix6
+        network = ipaddress.ip_network(f"{ip}/{prefix}", strict=False)
+        # Подсеть с адресом из белого списка не блокируется (проверка только при срабатывании)
+        for allowed in (self.whitelist() if self.whitelist else ()):
+            try:
+                if ipaddress.ip_address(allowed) in network:
+                    logger.info(f"Подсеть {network} не заблокирована: содержит {allowed} из белого списка")
+                    return None
+            except ValueError:
+                continue
+
+        cidr = str(network)
+        self._subnet_bans[subnet] = cidr
+        self._queue(cidr, now, f"Автоблокировка подсети: {count} уведомлений за {window:g} с")
+        return cidr
+
+    def _previous_offenses(self, target: str, now: float) -> int:
+        """Возвращает количество предыдущих блокировок в пределах escalation_reset."""
+        offenses, last = self._offenses.get(target, (0, now))
+        return 0 if now - last > self.policy.escalation_reset else offenses
+
+    def _record_offense(self, target: str, now: float) -> None:
+        """Учитывает примененную блокировку в истории нарушений."""
+        offenses = self._previous_offenses(target, now)
+        self._offenses.pop(target, None)
+        self._offenses[target] = (offenses + 1, now)
+
+    def _queue(self, target: str, now: float, reason: str) -> None:
+        """Ставит блокировку в очередь с учетом истории нарушений."""
+        policy = self.policy
+        offenses = self._previous_offenses(target, now)
+        duration = min(int(policy.duration * policy.escalation ** offenses), policy.max_duration)
+        if offenses:
+            reason += f", повторно ({offenses + 1}-й раз)"
+        self._pending[target] = (duration, reason, now)
+        if self._wakeup:
+            self._wakeup.set()
+
+    def _evict(self, now: float) -> None:
+        """Удаляет несколько простаивающих окон и устаревшую историю нарушений."""
+        for windows in (self._windows, self._subnet_windows):
+            for _ in range(_EVICT_PER_ALERT):
+                if not windows:
+                    break
+                key, counter = next(iter(windows.items()))
+                if now - counter.last_seen <= self._idle and len(windows) <= self.max_entries:
+                    break
+                del windows[key]
+                self.evicted += 1
+
+        if self._offenses:
+            target, (_, last) = next(iter(self._offenses.items()))
+            if now - last > self.policy.escalation_reset:
+                del self._offenses[target]
+
+    async def _run(self) -> None:
+        """Применяет накопленные блокировки пакетами."""
+        while True:
+            await self._wakeup.wait()
+            # Короткая задержка собирает в пакет блокировки одной волны атаки
+            await asyncio.sleep(self.flush_delay)
+            self._wakeup.clear()
+            await self.flush()
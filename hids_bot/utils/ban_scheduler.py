@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Модуль снятия временных блокировок IP-адресов по истечении срока.
+
+Срок блокировки хранится в столбце blocked_ips.expires_at, а частичный
+индекс по нему служит очередью с приоритетом: ближайший срок - первая
+запись индекса. Планировщик - одна задача, которая спит до ближайшего
+срока, снимает истекшие блокировки пакетами (одна транзакция базы данных
+и одна транзакция межсетевого экрана на пакет) и снова засыпает. В памяти
+хранится только время следующего пробуждения, поэтому расход памяти и
+таймеров не зависит от количества активных блокировок.
+
+При запуске планировщик сразу снимает блокировки, истекшие, пока бот не
+работал, и продолжает по расписанию из базы данных.
+"""
+
+import asyncio
+import logging
+from typing import Any, Callable, Dict, List, Optional
+
+from database.codec import now
+
+logger = logging.getLogger(__name__)
+
+# Количество блокировок, снимаемых за один пакет
+DEFAULT_BAN_BATCH = 1000
+
+# Максимальное время сна (в секундах): защищает от перевода системных часов
+DEFAULT_MAX_SLEEP = 3600.0
+
+
+class BanScheduler:
+    """
+    Снятие временных блокировок по сроку из базы данных.
+
+    Атрибуты:
+        db_manager: Объект для работы с базой данных
+        unblock: Функция разблокировки списка IP в межсетевом экране
+            (например, utils.system_commands.unblock_ips)
+        batch_size: Количество блокировок, снимаемых за один пакет
+        max_sleep: Максимальное время сна в секундах
+    """
+
+    def __init__(self, db_manager, unblock: Callable[[List[str]], bool],
+                 batch_size: int = DEFAULT_BAN_BATCH, max_sleep: float = DEFAULT_MAX_SLEEP):
+        """
+        Инициализирует планировщик.
+
+        Args:
+            db_manager: Объект для работы с базой данных
+            unblock: Функция разблокировки списка IP в межсетевом экране
+            batch_size: Количество блокировок, снимаемых за один пакет
+            max_sleep: Максимальное время сна в секундах
+        """
+        self.db_manager = db_manager
+        self.unblock = unblock
+        self.batch_size = max(1, batch_size)
+        self.max_sleep = max_sleep
+
+        self._next_due: Optional[int] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+        # Метрики
+        self.expired = 0
+        self.failed = 0
+
+    async def start(self) -> None:
+        """Запускает планировщик в текущем событийном цикле."""
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run(), name="ban-scheduler")
+
+    async def stop(self) -> None:
+        """Останавливает планировщик (сроки блокировок остаются в базе данных)."""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def schedule(self, expires_at: int) -> None:
+        """
+        Учитывает новую временную блокировку (уже записанную в базу данных).
+
+        Планировщик пробуждается, только если новый срок раньше ближайшего.
+
+        Args:
+            expires_at: Время окончания блокировки (секунды эпохи)
+        """
+        if self._wakeup is None:
+            return
+        if self._next_due is None or expires_at < self._next_due:
+            self._next_due = expires_at
+            self._wakeup.set()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Возвращает метрики планировщика.
+
+        Returns:
+            Словарь с количеством снятых блокировок, ошибок и временем следующего снятия
+        """
+        return {
+            "expired": self.expired,
+            "failed": self.failed,
+            "next_due": self._next_due,
+        }
+
+    async def expire_due(self) -> int:
+        """
+        Снимает все блокировки, срок которых истек.
+
+        Returns:
+            Количество снятых блокировок
+        """
+        loop = asyncio.get_running_loop()
+        total = 0
+        while True:
+            ips = await loop.run_in_executor(None, self.db_manager.pop_expired_bans, now(), self.batch_size)
+            if ips:
+                if await loop.run_in_executor(None, self.unblock, ips):
+                    logger.info(f"Снято истекших блокировок: {len(ips)}")
+                else:
+                    # Записи уже удалены из базы; правило останется до следующей
+                    # сверки с межсетевым экраном (ipset снимет запись сам по сроку)
+                    self.failed += len(ips)
+                    logger.error(f"Не удалось разблокировать в межсетевом экране IP с истекшим сроком: {len(ips)}")
+                total += len(ips)
+                self.expired += len(ips)
+            if len(ips) < self.batch_size:
+                return total
+
+    async def _run(self) -> None:
+        """Основной цикл: сон до ближайшего срока и снятие истекших блокировок."""
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                # Событие сбрасывается до чтения срока, чтобы не пропустить
+                # блокировку, добавленную во время запроса
+                self._wakeup.clear()
+                await self.expire_due()
+                self._next_due = await loop.run_in_executor(None, self.db_manager.get_next_ban_expiry)
+            except Exception as e:
+                logger.error(f"Ошибка при снятии истекших блокировок: {e}")
+                self._next_due = None
+
+            timeout = self.max_sleep
+            if self._next_due is not None:
+                timeout = min(max(self._next_due - now(), 0), self.max_sleep)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
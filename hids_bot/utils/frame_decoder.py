@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Модуль для разбора потока уведомлений HIDS на отдельные кадры.
+
+Протокол сокета: каждое уведомление - это JSON-документ, завершающийся
+символом новой строки. Одно соединение может передавать сколько угодно
+уведомлений подряд. Для совместимости со старыми отправителями данные без
+завершающего перевода строки, оставшиеся в буфере при закрытии соединения,
+считаются последним (единственным) кадром.
+
+Данные читаются из сокета напрямую в заранее выделенный буфер
+(asyncio.BufferedProtocol / socket.recv_into), а кадры возвращаются как
+memoryview на этот буфер без промежуточного копирования.
+"""
+
+from typing import Iterator, Optional
+
+# Разделитель кадров
+FRAME_DELIMITER = b"\n"
+
+# Начальный размер буфера соединения (в байтах)
+DEFAULT_BUFFER_SIZE = 64 * 1024
+
+# Максимальный размер одного кадра (в байтах)
+MAX_FRAME_SIZE = 1024 * 1024
+
+
+class FrameTooLargeError(ValueError):
+    """Кадр превышает максимально допустимый размер."""
+
+
+class FrameDecoder:
+    """
+    Инкрементальный разборщик кадров, разделенных переводом строки.
+
+    Использование:
+        buf = decoder.get_buffer()          # куда читать данные
+        nbytes = sock.recv_into(buf)
+        for frame in decoder.buffer_updated(nbytes):
+            ...                             # frame - memoryview на буфер
+
+    Кадры действительны только до следующего вызова get_buffer(), поэтому
+    их нужно разобрать (или скопировать) сразу.
+    """
+
+    def __init__(self, buffer_size: int = DEFAULT_BUFFER_SIZE, max_frame_size: int = MAX_FRAME_SIZE):
+        """
+        Инициализирует разборщик.
+
+        Args:
+            buffer_size: Начальный размер буфера в байтах
+            max_frame_size: Максимальный размер одного кадра в байтах
+        """
+        self.max_frame_size = max_frame_size
+        self._buffer = bytearray(min(buffer_size, max_frame_size + 1))
+        self._view = memoryview(self._buffer)
+        # Необработанные данные находятся в self._buffer[self._start:self._end]
+        self._start = 0
+        self._end = 0
+        # Позиция, с которой продолжается поиск разделителя
+        self._scan_pos = 0
+
+    def get_buffer(self, sizehint: int = -1) -> memoryview:
+        """
+        Возвращает свободную часть буфера для чтения данных из сокета.
+
+        Args:
+            sizehint: Желаемый размер (игнорируется, как допускает asyncio)
+
+        Returns:
+            memoryview на свободную часть буфера
+
+        Raises:
+            FrameTooLargeError: если незавершенный кадр не помещается в буфер
+                максимального размера
+        """
+        if self._end == len(self._buffer):
+            if self._start > 0:
+                self._compact()
+            else:
+                self._grow()
+
+        return self._view[self._end:]
+
+    def buffer_updated(self, nbytes: int) -> Iterator[memoryview]:
+        """
+        Учитывает записанные в буфер данные и возвращает завершенные кадры.
+
+        Args:
+            nbytes: Количество байт, записанных в буфер, полученный из get_buffer()
+
+        Returns:
+            Итератор по завершенным кадрам (без разделителя и пустых строк)
+        """
+        self._end += nbytes
+        return self._frames()
+
+    def _frames(self) -> Iterator[memoryview]:
+        """Выделяет завершенные кадры из необработанной части буфера."""
+        buffer = self._buffer
+
+        while True:
+            end = buffer.find(FRAME_DELIMITER, self._scan_pos, self._end)
+            if end == -1:
+                break
+
+            start = self._start
+            self._start = self._scan_pos = end + 1
+
+            # Пропускаем пустые строки (например, "\r\n" или "\n\n")
+            if end > start and buffer[end - 1] == 0x0D:
+                end -= 1
+            if end > start:
+                yield self._view[start:end]
+
+        if self._start == self._end:
+            # Весь буфер обработан - начинаем заполнять его сначала
+            self._start = self._end = 0
+        self._scan_pos = self._end
+
+    def finish(self) -> Optional[bytes]:
+        """
+        Завершает разбор при закрытии соединения.
+
+        Returns:
+            Оставшиеся данные без разделителя (старый режим "одно соединение -
+            одно уведомление") или None, если буфер пуст
+        """
+        frame = bytes(self._view[self._start:self._end]).strip()
+        self._start = self._end = self._scan_pos = 0
+        return frame or None
+
+    def _compact(self) -> None:
+        """Переносит незавершенный кадр в начало буфера."""
+        pending = self._end - self._start
+        self._view[:pending] = self._view[self._start:self._end]
+        self._start = 0
+        self._end = self._scan_pos = pending
+
+    def _grow(self) -> None:
+        """Увеличивает буфер для кадра, который в него не помещается."""
+        size = len(self._buffer)
+        if size > self.max_frame_size:
+            self._start = self._end = self._scan_pos = 0
+            raise FrameTooLargeError(
+                f"Размер кадра превышает {self.max_frame_size} байт"
+            )
+
+        buffer = bytearray(min(size * 2, self.max_frame_size + 1))
+        buffer[:size] = self._buffer
+        self._view.release()
+        self._buffer = buffer
+        self._view = memoryview(buffer)
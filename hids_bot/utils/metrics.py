@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Модуль с простыми метриками для наблюдения за конвейером уведомлений.
+"""
+
+import math
+import time
+import asyncio
+import logging
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Интервал измерения задержки событийного цикла (в секундах)
+DEFAULT_LAG_INTERVAL = 0.1
+
+# Задержка цикла, о которой сообщается в журнале (в секундах)
+DEFAULT_LAG_WARNING = 0.5
+
+
+class LatencyHistogram:
+    """
+    Гистограмма задержек с логарифмическими корзинами.
+
+    Память постоянна и не зависит от количества измерений, погрешность
+    перцентилей ограничена шагом корзины (по умолчанию 10%).
+    """
+
+    def __init__(self, min_value: float = 1e-6, max_value: float = 60.0, growth: float = 1.1):
+        """
+        Инициализирует гистограмму.
+
+        Args:
+            min_value: Нижняя граница измерений в секундах
+            max_value: Верхняя граница измерений в секундах
+            growth: Отношение границ соседних корзин
+        """
+        self.min_value = min_value
+        self.growth = growth
+        self._log_growth = math.log(growth)
+        self._counts = [0] * (int(math.log(max_value / min_value) / self._log_growth) + 2)
+        self.reset()
+
+    def reset(self) -> None:
+        """Сбрасывает накопленные измерения."""
+        for idx in range(len(self._counts)):
+            self._counts[idx] = 0
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, value: float) -> None:
+        """
+        Добавляет измерение.
+
+        Args:
+            value: Задержка в секундах
+        """
+        if value <= self.min_value:
+            idx = 0
+        else:
+            idx = min(int(math.log(value / self.min_value) / self._log_growth) + 1,
+                      len(self._counts) - 1)
+
+        self._counts[idx] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, percent: float) -> float:
+        """
+        Возвращает оценку перцентиля.
+
+        Args:
+            percent: Перцентиль (0-100)
+
+        Returns:
+            Верхняя граница корзины, содержащей перцентиль, в секундах
+        """
+        if not self.count:
+            return 0.0
+
+        threshold = self.count * percent / 100.0
+        cumulative = 0
+        for idx, bucket_count in enumerate(self._counts):
+            cumulative += bucket_count
+            if cumulative >= threshold and bucket_count:
+                return min(self.min_value * self.growth ** idx, self.max)
+
+        return self.max
+
+    def snapshot(self) -> Dict[str, float]:
+        """
+        Возвращает сводку измерений.
+
+        Returns:
+            Словарь с количеством, средним, p50/p95/p99 и максимумом (в секундах)
+        """
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+            "max": self.max,
+        }
+
+
+class LoopLagMonitor:
+    """
+    Измеритель задержки событийного цикла.
+
+    Фоновая задача засыпает на фиксированный интервал и записывает, насколько
+    позже запланированного она проснулась. Рост задержки означает, что
+    какой-то код блокирует цикл (синхронный ввод-вывод, долгие вычисления).
+    """
+
+    def __init__(self, interval: float = DEFAULT_LAG_INTERVAL, warning: float = DEFAULT_LAG_WARNING):
+        """
+        Инициализирует измеритель.
+
+        Args:
+            interval: Интервал измерения в секундах
+            warning: Задержка, при превышении которой пишется предупреждение, в секундах
+        """
+        self.interval = interval
+        self.warning = warning
+        self.lag = LatencyHistogram()
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        """Запускает измерение в текущем событийном цикле."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="loop-lag-monitor")
+
+    async def stop(self) -> None:
+        """Останавливает измерение."""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def reset(self) -> None:
+        """Сбрасывает накопленные измерения."""
+        self.lag.reset()
+
+    def snapshot(self) -> Dict[str, float]:
+        """
+        Возвращает сводку измерений.
+
+        Returns:
+            Словарь с количеством, средним, p50/p95/p99 и максимумом (в секундах)
+        """
+        return self.lag.snapshot()
+
+    async def _run(self) -> None:
+        """Основной цикл измерения."""
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.monotonic() - expected)
+            self.lag.record(lag)
+            if lag >= self.warning:
+                logger.warning(f"Событийный цикл был заблокирован на {format_latency(lag)}")
+
+
+def format_latency(seconds: float) -> str:
+    """
+    Форматирует задержку в человекочитаемый вид.
+
+    Args:
+        seconds: Задержка в секундах
+
+    Returns:
+        Строка вида "850 мкс", "12.5 мс" или "1.20 с"
+    """
+    if seconds < 1e-3:
+        return f"{seconds * 1e6:.0f} мкс"
+    if seconds < 1.0:
+        return f"{seconds * 1e3:.1f} мс"
+    return f"{seconds:.2f} с"
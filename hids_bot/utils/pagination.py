@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Модуль курсоров для постраничного просмотра инцидентов в Telegram.
+
+Страница определяется ключом (timestamp, id) крайнего инцидента, а не
+номером страницы, поэтому запрос следующей страницы выполняется по
+индексу за постоянное время. Ключ передается в callback_data кнопки
+"вперед/назад", размер которой ограничен 64 байтами, поэтому время и ID
+кодируются в base36: "<время>.<id>".
+"""
+
+import string
+from typing import Optional, Tuple
+
+# Максимальный размер callback_data в Telegram (в байтах)
+MAX_CALLBACK_DATA = 64
+
+# Префикс callback_data кнопок перехода между страницами
+PAGE_CALLBACK_PREFIX = "alerts"
+
+# Направления перехода: к более старым и к более новым инцидентам
+OLDER = "n"
+NEWER = "p"
+
+# Область просмотра "все IP"
+ALL_IPS = "*"
+
+_DIGITS = string.digits + string.ascii_lowercase
+
+
+def _to_base36(value: int) -> str:
+    """Кодирует неотрицательное число в base36."""
+    if value == 0:
+        return "0"
+    digits = []
+    while value:
+        value, remainder = divmod(value, 36)
+        digits.append(_DIGITS[remainder])
+    return "".join(reversed(digits))
+
+
+def encode_cursor(timestamp: int, incident_id: int) -> str:
+    """
+    Кодирует ключ инцидента в курсор.
+
+    Args:
+        timestamp: Время инцидента (секунды эпохи)
+        incident_id: ID инцидента
+
+    Returns:
+        Курсор вида "<время>.<id>" в base36
+    """
+    return f"{_to_base36(timestamp)}.{_to_base36(incident_id)}"
+
+
+def decode_cursor(cursor: str) -> Tuple[int, int]:
+    """
+    Декодирует курсор в ключ инцидента.
+
+    Args:
+        cursor: Курсор, полученный от encode_cursor
+
+    Returns:
+        Кортеж (timestamp, id)
+
+    Raises:
+        ValueError: Если курсор поврежден
+    """
+    timestamp, incident_id = cursor.split(".", 1)
+    return int(timestamp, 36), int(incident_id, 36)
+
+
+def page_callback_data(direction: str, cursor: str, ip: Optional[str] = None) -> Optional[str]:
+    """
+    Формирует callback_data кнопки перехода между страницами.
+
+    Args:
+        direction: OLDER или NEWER
+        cursor: Курсор крайнего инцидента текущей страницы
+        ip: IP-адрес (None - все IP)
+
+    Returns:
+        Строка callback_data или None, если она превышает лимит Telegram
+    """
+    data = f"{PAGE_CALLBACK_PREFIX}:{direction}:{cursor}:{ip or ALL_IPS}"
+    if len(data.encode("utf-8")) > MAX_CALLBACK_DATA:
+        return None
+    return data
+
+
+def parse_page_callback_data(data: str) -> Tuple[str, Tuple[int, int], Optional[str]]:
+    """
+    Разбирает callback_data кнопки перехода между страницами.
+
+    Args:
+        data: Строка callback_data
+
+    Returns:
+        Кортеж (направление, ключ инцидента, IP-адрес или None)
+
+    Raises:
+        ValueError: Если данные повреждены
+    """
+    # IPv6-адрес содержит двоеточия, поэтому он стоит последним
+    _, direction, cursor, scope = data.split(":", 3)
+    if direction not in (OLDER, NEWER):
+        raise ValueError(f"Неизвестное направление: {direction}")
+    return direction, decode_cursor(cursor), None if scope == ALL_IPS else scope
@@ -11,7 +11,9 @@ import logging
 import subprocess
 import configparser
 from pathlib import Path
-from typing import Optional, Tuple, List
+from typing import Dict, Iterable, Optional, Tuple, List
+
+from utils.firewall import FirewallBackend, create_backend, DEFAULT_FIREWALL_BACKEND
 
 # Получаем путь к конфигурационному файлу
 config_path = Path('config.ini')
@@ -19,17 +21,29 @@ if config_path.exists():
     config = configparser.ConfigParser()
     config.read('config.ini')
     IPTABLES_PATH = config.get('HIDS', 'iptables_path', fallback='/sbin/iptables')
+    IP6TABLES_PATH = config.get('HIDS', 'ip6tables_path', fallback='/sbin/ip6tables')
+    IPSET_PATH = config.get('HIDS', 'ipset_path', fallback='/sbin/ipset')
 else:
     IPTABLES_PATH = '/sbin/iptables'
+    IP6TABLES_PATH = '/sbin/ip6tables'
+    IPSET_PATH = '/sbin/ipset'
+
+# Механизм блокировки (создается при первом обращении, см. get_firewall)
+_firewall: Optional[FirewallBackend] = None
 
 logger = logging.getLogger(__name__)
 
-def execute_command(command: List[str]) -> Tuple[bool, str]:
+def execute_command(command: List[str], log_errors: bool = True,
+                    input: Optional[str] = None) -> Tuple[bool, str]:
     """
     Безопасно выполняет команду в системе.
     
     Args:
         command: Список строк с командой и аргументами
+        log_errors: Журналировать ненулевой код возврата (для проверок
+            вида "iptables -C" ненулевой код - обычный ответ "нет")
+        input: Текст для стандартного ввода команды (сценарий
+            iptables-restore или ipset restore)
         
     Returns:
         Кортеж (успех, вывод)
@@ -37,6 +51,7 @@ def execute_command(command: List[str]) -> Tuple[bool, str]:
     try:
         result = subprocess.run(
             command,
+            input=input,
             capture_output=True,
             text=True,
             check=False,
@@ -45,6 +60,8 @@ def execute_command(command: List[str]) -> Tuple[bool, str]:
         
         if result.returncode == 0:
             return True, result.stdout.strip()
+        elif not log_errors:
+            return False, result.stderr.strip()
         else:
             logger.error(f"Ошибка при выполнении команды: {' '.join(command)}")
             logger.error(f"Код ошибки: {result.returncode}, Сообщение: {result.stderr}")
@@ -58,63 +75,101 @@ def execute_command(command: List[str]) -> Tuple[bool, str]:
         logger.error(f"Исключение при выполнении команды {' '.join(command)}: {e}")
         return False, str(e)
 
-def block_ip(ip: str, reason: str = "Заблокировано HIDS") -> bool:
+def get_firewall() -> FirewallBackend:
+    """
+    Возвращает механизм блокировки IP-адресов.
+    
+    Механизм выбирается переменной окружения FIREWALL_BACKEND (auto, ipset
+    или iptables); при FIREWALL_SUDO=1 (по умолчанию) команды выполняются
+    через sudo.
+    
+    Returns:
+        Механизм блокировки (один на процесс)
+    """
+    global _firewall
+    if _firewall is None:
+        use_sudo = os.getenv("FIREWALL_SUDO", "1") != "0"
+        
+        def run(command: List[str], log_errors: bool = True, input: Optional[str] = None) -> Tuple[bool, str]:
+            return execute_command(["sudo", "-n"] + command if use_sudo else command, log_errors, input)
+        
+        _firewall = create_backend(
+            os.getenv("FIREWALL_BACKEND", DEFAULT_FIREWALL_BACKEND), run,
+            iptables=IPTABLES_PATH, ip6tables=IP6TABLES_PATH, ipset=IPSET_PATH
+        )
+    return _firewall
+
+def block_ip(ip: str, reason: str = "Заблокировано HIDS", timeout: Optional[int] = None) -> bool:
     """
-    Блокирует IP-адрес с помощью iptables.
+    Блокирует IP-адрес (см. utils.firewall).
     
     Args:
-        ip: IP-адрес для блокировки
+        ip: IP-адрес или подсеть для блокировки
         reason: Причина блокировки (для комментария)
+        timeout: Длительность блокировки в секундах (None - постоянно); снимается
+            самим межсетевым экраном, если механизм это поддерживает
         
     Returns:
         True если блокировка успешна, иначе False
     """
-    # Проверяем, не заблокирован ли уже этот IP
-    if is_ip_blocked(ip):
-        return True
-    
-    # Формируем команду для iptables
-    command = [
-        IPTABLES_PATH,
-        '-A', 'INPUT',
-        '-s', ip,
-        '-j', 'DROP',
-        '-m', 'comment',
-        '--comment', f"HIDS: {reason}"
-    ]
-    
-    success, _ = execute_command(command)
-    return success
+    return get_firewall().block(ip, timeout, reason)
 
 def unblock_ip(ip: str) -> bool:
     """
-    Разблокирует IP-адрес, удаляя правило iptables.
+    Разблокирует IP-адрес.
     
     Args:
-        ip: IP-адрес для разблокировки
+        ip: IP-адрес или подсеть для разблокировки
         
     Returns:
-        True если разблокировка успешна, иначе False
+        True если разблокировка успешна (в том числе если IP не был заблокирован), иначе False
+    """
+    return get_firewall().unblock(ip)
+
+def block_ips(ips: Iterable[str], reason: str = "Заблокировано HIDS", timeout: Optional[int] = None) -> bool:
     """
-    if not is_ip_blocked(ip):
-        return True
+    Блокирует список IP-адресов одной транзакцией межсетевого экрана.
     
-    # Формируем команду для удаления всех правил, блокирующих указанный IP
-    command = [
-        IPTABLES_PATH,
-        '-D', 'INPUT',
-        '-s', ip,
-        '-j', 'DROP'
-    ]
+    Args:
+        ips: IP-адреса или подсети для блокировки
+        reason: Причина блокировки (для комментария)
+        timeout: Длительность блокировки в секундах (None - постоянно)
+        
+    Returns:
+        True если блокировка успешна, иначе False
+    """
+    return get_firewall().block_many(ips, timeout, reason)
+
+def unblock_ips(ips: Iterable[str]) -> bool:
+    """
+    Разблокирует список IP-адресов одной транзакцией межсетевого экрана.
     
-    success, _ = execute_command(command)
+    Args:
+        ips: IP-адреса или подсети для разблокировки
+        
+    Returns:
+        True если разблокировка успешна, иначе False
+    """
+    return get_firewall().unblock_many(ips)
+
+def reconcile_firewall(ips: Iterable[str]) -> Optional[Dict[str, int]]:
+    """
+    Сверяет межсетевой экран со списком заблокированных IP и исправляет
+    расхождения одной транзакцией (см. FirewallBackend.reconcile).
     
-    # Если правило не найдено, считаем это успехом (IP уже разблокирован)
-    return success
+    Args:
+        ips: IP-адреса, которые должны быть заблокированы (blocked_ips)
+        
+    Returns:
+        Словарь с количеством блокировок в межсетевом экране, добавленных и
+        снятых; None при ошибке
+    """
+    return get_firewall().reconcile(ips, "Восстановлено при сверке")
 
 def is_ip_blocked(ip: str) -> bool:
     """
-    Проверяет, заблокирован ли IP-адрес в iptables.
+    Проверяет, заблокирован ли IP-адрес межсетевым экраном (после сверки -
+    без запуска процессов).
     
     Args:
         ip: IP-адрес для проверки
@@ -122,16 +177,7 @@ def is_ip_blocked(ip: str) -> bool:
     Returns:
         True если IP заблокирован, иначе False
     """
-    # Команда для проверки наличия правила
-    command = [
-        IPTABLES_PATH,
-        '-C', 'INPUT',
-        '-s', ip,
-        '-j', 'DROP'
-    ]
-    
-    success, _ = execute_command(command)
-    return success
+    return get_firewall().is_blocked(ip)
 
 def get_hids_pid() -> Optional[int]:
     """
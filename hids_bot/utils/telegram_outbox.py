@@ -0,0 +1,399 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Модуль исходящей очереди сообщений Telegram.
+
+Все методы Bot API, отправляющие или изменяющие сообщения, проходят через
+OutboxMiddleware (промежуточный слой сессии aiogram), поэтому ограничения
+действуют и для bot.send_message, и для message.answer в обработчиках:
+
+- токен-бакеты на каждый чат (~1 сообщение/с, для групп ~20 в минуту) и
+  общий (~30 сообщений/с);
+- приоритетная очередь: при нехватке токенов первыми отправляются более
+  важные сообщения (BRUTE_FORCE раньше информационных);
+- обработка 429 (retry_after): чат (или весь бот) приостанавливается на
+  указанное время, запрос повторяется.
+
+Приоритет задается контекстным менеджером message_priority().
+
+Ожидающие хранятся в отдельной куче на каждый чат; чаты с доступным
+токеном - в куче по приоритету первого сообщения, чаты, упершиеся в свое
+ограничение, - в куче по времени появления токена. Выдача разрешения
+стоит O(log n) и не просматривает чаты, которые еще не могут отправлять;
+отмененные ожидания удаляются лениво, когда оказываются в начале кучи.
+"""
+
+import time
+import heapq
+import asyncio
+import logging
+import itertools
+import contextlib
+import contextvars
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramNetworkError, TelegramRetryAfter, TelegramServerError
+
+logger = logging.getLogger(__name__)
+
+# Приоритеты сообщений (чем больше, тем раньше отправляется)
+PRIORITY_LOW = 1
+PRIORITY_NORMAL = 3
+PRIORITY_HIGH = 5
+
+# Ограничения Bot API по умолчанию (сообщений в секунду)
+DEFAULT_CHAT_RATE = 1.0
+DEFAULT_GROUP_RATE = 20.0 / 60.0
+DEFAULT_GLOBAL_RATE = 30.0
+
+# Количество повторов одного запроса при 429 и сетевых ошибках
+DEFAULT_MAX_RETRIES = 5
+
+# Методы, отправляющие или изменяющие сообщения в чате
+RATE_LIMITED_METHODS = frozenset({
+    "sendMessage", "sendDocument", "sendPhoto", "sendMediaGroup", "sendAudio",
+    "sendVideo", "sendAnimation", "sendVoice", "sendSticker", "sendLocation",
+    "sendContact", "sendPoll", "sendDice", "copyMessage", "forwardMessage",
+    "editMessageText", "editMessageReplyMarkup", "editMessageCaption",
+    "editMessageMedia",
+})
+
+# Приоритет текущего запроса
+_current_priority: contextvars.ContextVar[int] = contextvars.ContextVar(
+    "outbox_priority", default=PRIORITY_NORMAL
+)
+
+
+@contextlib.contextmanager
+def message_priority(priority: int) -> Iterator[None]:
+    """
+    Задает приоритет сообщений, отправляемых внутри блока with.
+
+    Args:
+        priority: Приоритет (PRIORITY_LOW, PRIORITY_NORMAL, PRIORITY_HIGH или уровень серьезности 1-5)
+    """
+    token = _current_priority.set(priority)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+class TokenBucket:
+    """
+    Токен-бакет с возможностью временной блокировки (flood wait).
+
+    Атрибуты:
+        rate: Скорость пополнения (токенов в секунду)
+        capacity: Максимальное количество токенов
+    """
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        self.rate = rate
+        self.capacity = max(1.0, capacity)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def delay(self, now: float) -> float:
+        """
+        Возвращает время ожидания до появления токена.
+
+        Args:
+            now: Текущее время (time.monotonic)
+
+        Returns:
+            0, если токен доступен, иначе время ожидания в секундах
+        """
+        self._refill(now)
+        wait = max(0.0, self.blocked_until - now)
+        if self.tokens < 1.0:
+            wait = max(wait, (1.0 - self.tokens) / self.rate)
+        return wait
+
+    def take(self, now: float) -> None:
+        """Расходует один токен."""
+        self._refill(now)
+        self.tokens -= 1.0
+
+    def block(self, seconds: float, now: float) -> None:
+        """
+        Блокирует бакет (ответ 429 с retry_after).
+
+        Args:
+            seconds: Длительность блокировки в секундах
+            now: Текущее время (time.monotonic)
+        """
+        self.blocked_until = max(self.blocked_until, now + seconds)
+        self.tokens = 0.0
+        self.updated = now
+
+    def _refill(self, now: float) -> None:
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+
+class TelegramOutbox:
+    """
+    Планировщик отправки сообщений с ограничением скорости и приоритетами.
+
+    Атрибуты:
+        chat_rate: Скорость отправки в личный чат (сообщений в секунду)
+        group_rate: Скорость отправки в группу (сообщений в секунду)
+        global_rate: Общая скорость отправки (сообщений в секунду)
+        max_retries: Количество повторов запроса
+        healthy: False, если последняя попытка отправки завершилась ошибкой
+            (и с тех пор не было успешных запросов к Bot API)
+    """
+
+    def __init__(self, chat_rate: float = DEFAULT_CHAT_RATE, group_rate: float = DEFAULT_GROUP_RATE,
+                 global_rate: float = DEFAULT_GLOBAL_RATE, max_retries: int = DEFAULT_MAX_RETRIES):
+        """
+        Инициализирует исходящую очередь.
+
+        Args:
+            chat_rate: Скорость отправки в личный чат (сообщений в секунду)
+            group_rate: Скорость отправки в группу (сообщений в секунду)
+            global_rate: Общая скорость отправки (сообщений в секунду)
+            max_retries: Количество повторов запроса
+        """
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate
+        self.global_rate = global_rate
+        self.max_retries = max_retries
+        self.healthy = True
+
+        self._global = TokenBucket(global_rate, capacity=global_rate)
+        self._chats: Dict[Any, TokenBucket] = {}
+        # Ожидающие каждого чата: куча (-приоритет, номер, future)
+        self._queues: Dict[Any, List[Tuple[int, int, asyncio.Future]]] = {}
+        # Чаты, готовые к отправке: куча (-приоритет, номер) первого ожидающего и ID чата;
+        # запись устарела, если первый ожидающий чата уже другой
+        self._ready: List[Tuple[int, int, Any]] = []
+        # Чаты, ожидающие токена своего бакета: куча (время появления токена, номер, ID чата)
+        self._sleeping: List[Tuple[float, int, Any]] = []
+        self._seq = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+        # Метрики
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+
+    async def start(self) -> None:
+        """Запускает планировщик в текущем событийном цикле."""
+        if self._task:
+            return
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run(), name="telegram-outbox")
+
+    async def stop(self) -> None:
+        """Останавливает планировщик."""
+        if not self._task:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+        for queue in self._queues.values():
+            for _, _, future in queue:
+                if not future.done():
+                    future.cancel()
+        self._queues.clear()
+        self._ready.clear()
+        self._sleeping.clear()
+
+    async def acquire(self, chat_id: Any, priority: int = PRIORITY_NORMAL) -> None:
+        """
+        Ожидает разрешения на отправку сообщения в чат.
+
+        Args:
+            chat_id: ID чата (None - только общее ограничение)
+            priority: Приоритет сообщения
+        """
+        if not self._task:
+            # Планировщик не запущен (например, при остановке бота)
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        entry = (-priority, next(self._seq), future)
+        queue = self._queues.setdefault(chat_id, [])
+        heapq.heappush(queue, entry)
+        if queue[0] is entry:
+            # Новый первый ожидающий чата (прежняя запись в _ready устарела)
+            heapq.heappush(self._ready, (entry[0], entry[1], chat_id))
+            self._wakeup.set()
+        await future
+
+    def report_retry_after(self, chat_id: Any, retry_after: float) -> None:
+        """
+        Учитывает ответ 429: приостанавливает отправку в чат.
+
+        Args:
+            chat_id: ID чата (None - приостановить всю отправку)
+            retry_after: Время ожидания из ответа Bot API в секундах
+        """
+        now = time.monotonic()
+        if chat_id is None:
+            self._global.block(retry_after, now)
+        else:
+            self._chat_bucket(chat_id).block(retry_after, now)
+        self.retried += 1
+        if self._wakeup:
+            self._wakeup.set()
+
+    def report_result(self, success: bool) -> None:
+        """
+        Учитывает результат отправки.
+
+        Args:
+            success: True, если запрос выполнен успешно
+        """
+        if success:
+            self.sent += 1
+            if not self.healthy:
+                logger.info("Отправка сообщений в Telegram восстановлена")
+        else:
+            self.failed += 1
+        self.healthy = success
+
+    def report_reachable(self) -> None:
+        """Учитывает успешный запрос, не связанный с отправкой (например, getUpdates)."""
+        if not self.healthy:
+            logger.info("Связь с Telegram восстановлена")
+            self.healthy = True
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Возвращает метрики исходящей очереди.
+
+        Returns:
+            Словарь с количеством ожидающих, отправленных и повторенных сообщений
+        """
+        return {
+            "waiting": sum(1 for queue in self._queues.values() for _, _, future in queue if not future.done()),
+            "sent": self.sent,
+            "retried": self.retried,
+            "failed": self.failed,
+            "healthy": self.healthy,
+        }
+
+    def _chat_bucket(self, chat_id: Any) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            # Отрицательные ID - группы и каналы, для них ограничение строже
+            is_group = str(chat_id).startswith("-")
+            bucket = TokenBucket(self.group_rate if is_group else self.chat_rate)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    async def _run(self) -> None:
+        """Выдает разрешения ожидающим в порядке приоритета."""
+        while True:
+            timeout = self._grant()
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def _grant(self) -> Optional[float]:
+        """
+        Выдает разрешения всем ожидающим, кому позволяют ограничения.
+
+        Returns:
+            Время до следующей возможной выдачи или None, если ожидающих нет
+        """
+        ready, sleeping = self._ready, self._sleeping
+        while True:
+            now = time.monotonic()
+            # Чаты, в бакете которых появился токен, возвращаются в очередь готовых
+            while sleeping and sleeping[0][0] <= now:
+                chat_id = heapq.heappop(sleeping)[2]
+                queue = self._queues.get(chat_id)
+                if queue:
+                    heapq.heappush(ready, (queue[0][0], queue[0][1], chat_id))
+
+            if not ready:
+                return max(0.0, sleeping[0][0] - now) if sleeping else None
+
+            key, seq, chat_id = ready[0]
+            queue = self._queues.get(chat_id)
+            # Отмененные ожидания удаляются, когда оказываются первыми
+            while queue and queue[0][2].done():
+                heapq.heappop(queue)
+            if not queue:
+                self._queues.pop(chat_id, None)
+                heapq.heappop(ready)
+                continue
+            if queue[0][:2] != (key, seq):
+                heapq.heapreplace(ready, (queue[0][0], queue[0][1], chat_id))
+                continue
+
+            delay = self._chat_bucket(chat_id).delay(now) if chat_id is not None else 0.0
+            if delay > 0:
+                # Чат упирается в свое ограничение: не просматриваем его до появления токена
+                heapq.heappop(ready)
+                heapq.heappush(sleeping, (now + delay, next(self._seq), chat_id))
+                continue
+
+            global_delay = self._global.delay(now)
+            if global_delay > 0:
+                return global_delay
+
+            heapq.heappop(ready)
+            future = heapq.heappop(queue)[2]
+            if queue:
+                heapq.heappush(ready, (queue[0][0], queue[0][1], chat_id))
+            else:
+                del self._queues[chat_id]
+
+            self._global.take(now)
+            if chat_id is not None:
+                self._chat_bucket(chat_id).take(now)
+            future.set_result(None)
+
+
+class OutboxMiddleware(BaseRequestMiddleware):
+    """Промежуточный слой сессии aiogram, пропускающий отправку через TelegramOutbox."""
+
+    def __init__(self, outbox: TelegramOutbox):
+        self.outbox = outbox
+
+    async def __call__(self, make_request, bot, method):
+        if getattr(method, "__api_method__", None) not in RATE_LIMITED_METHODS:
+            response = await make_request(bot, method)
+            self.outbox.report_reachable()
+            return response
+
+        chat_id = getattr(method, "chat_id", None)
+        priority = _current_priority.get()
+        attempt = 0
+
+        while True:
+            await self.outbox.acquire(chat_id, priority)
+            try:
+                response = await make_request(bot, method)
+                self.outbox.report_result(True)
+                return response
+
+            except TelegramRetryAfter as e:
+                attempt += 1
+                logger.warning(f"Превышен лимит Telegram для чата {chat_id}, повтор через {e.retry_after} с")
+                self.outbox.report_retry_after(chat_id, e.retry_after)
+                if attempt > self.outbox.max_retries:
+                    self.outbox.report_result(False)
+                    raise
+
+            except (TelegramNetworkError, TelegramServerError) as e:
+                attempt += 1
+                self.outbox.report_result(False)
+                if attempt > self.outbox.max_retries:
+                    raise
+                delay = min(2 ** attempt, 30)
+                logger.warning(f"Ошибка связи с Telegram ({e}), повтор через {delay} с")
+                await asyncio.sleep(delay)
@@ -1,12 +1,16 @@
 #pragma once
 
 #include <string>
+#include <mutex>
 
 namespace hids {
 namespace telegram {
 
 /**
  * Класс для отправки оповещений в Telegram-бот через UNIX-сокет
+ * 
+ * Соединение с сокетом держится открытым, оповещения передаются потоком
+ * JSON-документов, разделенных переводом строки.
  */
 class TelegramNotifier {
 public:
@@ -17,26 +21,52 @@ public:
      */
     TelegramNotifier(const std::string& socket_path = "/var/run/hids/alert.sock");
 
+    /**
+     * Деструктор (закрывает соединение)
+     */
+    ~TelegramNotifier();
+
+    TelegramNotifier(const TelegramNotifier&) = delete;
+    TelegramNotifier& operator=(const TelegramNotifier&) = delete;
+
     /**
      * Отправляет оповещение о событии
      * 
      * @param ip IP-адрес события
      * @param reason Причина/описание события
+     * @param type Тип события (BRUTE_FORCE, FAILED_LOGIN и т.д.), может быть пустым
      * @return true если оповещение отправлено успешно
      */
-    bool sendAlert(const std::string& ip, const std::string& reason) const;
+    bool sendAlert(const std::string& ip, const std::string& reason,
+                   const std::string& type = "") const;
 
 private:
     std::string m_socket_path;
     
+    // Постоянное соединение с сокетом (-1, если не подключено)
+    mutable int m_socket;
+    mutable std::mutex m_socket_mutex;
+    
     /**
      * Отправляет данные через UNIX-сокет
      * 
-     * @param data Данные для отправки
+     * @param data Данные для отправки (один кадр)
      * @return true если отправка успешна
      */
     bool sendToSocket(const std::string& data) const;
+    
+    /**
+     * Подключается к сокету (вызывается под m_socket_mutex)
+     * 
+     * @return true если соединение установлено
+     */
+    bool connectSocket() const;
+    
+    /**
+     * Закрывает соединение (вызывается под m_socket_mutex)
+     */
+    void closeSocket() const;
 };
 
 } // namespace telegram
-} // namespace hids 
\ No newline at end of file
+} // namespace hids
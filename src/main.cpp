@@ -96,7 +96,7 @@ int main(int /*argc*/, char* /*argv*/[]) {
             
             // Отправляем уведомление в Telegram
             // IP устанавливаем как localhost, так как это локальное событие
-            telegram_notifier->sendAlert("127.0.0.1", message);
+            telegram_notifier->sendAlert("127.0.0.1", message, "FILE_CHANGE");
     });
     
     // Добавляем обработчик событий для модуля логов
@@ -138,7 +138,7 @@ int main(int /*argc*/, char* /*argv*/[]) {
                     }
                 }
                 
-                m_notifier->sendAlert(ip, alert.message);
+                m_notifier->sendAlert(ip, alert.message, alert.type);
             }
         }
     
@@ -10,21 +10,62 @@
 #include <iostream>
 #include <fcntl.h>
 #include <ctime>
+#include <cerrno>
+#include <cstdio>
+#include <sys/select.h>
+#include <sys/time.h>
 
 namespace hids {
 namespace telegram {
 
+namespace {
+
+// Экранирует строку для JSON (перевод строки внутри значения сломал бы кадрирование)
+std::string escapeJson(const std::string& value) {
+    std::string result;
+    result.reserve(value.size());
+    for (unsigned char c : value) {
+        switch (c) {
+            case '"':  result += "\\\""; break;
+            case '\\': result += "\\\\"; break;
+            case '\n': result += "\\n"; break;
+            case '\r': result += "\\r"; break;
+            case '\t': result += "\\t"; break;
+            default:
+                if (c < 0x20) {
+                    char buf[8];
+                    snprintf(buf, sizeof(buf), "\\u%04x", c);
+                    result += buf;
+                } else {
+                    result += static_cast<char>(c);
+                }
+        }
+    }
+    return result;
+}
+
+} // namespace
+
 TelegramNotifier::TelegramNotifier(const std::string& socket_path)
-    : m_socket_path(socket_path)
+    : m_socket_path(socket_path), m_socket(-1)
 {
 }
 
-bool TelegramNotifier::sendAlert(const std::string& ip, const std::string& reason) const {
+TelegramNotifier::~TelegramNotifier() {
+    std::lock_guard<std::mutex> lock(m_socket_mutex);
+    closeSocket();
+}
+
+bool TelegramNotifier::sendAlert(const std::string& ip, const std::string& reason,
+                                 const std::string& type) const {
     // Создаем JSON-строку с информацией о событии
     std::stringstream json_stream;
     json_stream << "{";
-    json_stream << "\"ip\":\"" << ip << "\",";
-    json_stream << "\"reason\":\"" << reason << "\",";
+    json_stream << "\"ip\":\"" << escapeJson(ip) << "\",";
+    json_stream << "\"reason\":\"" << escapeJson(reason) << "\",";
+    if (!type.empty()) {
+        json_stream << "\"type\":\"" << escapeJson(type) << "\",";
+    }
     json_stream << "\"timestamp\":\"" << utils::formatTime(std::time(nullptr)) << "\"";
     json_stream << "}";
     
@@ -36,13 +77,54 @@ bool TelegramNotifier::sendAlert(const std::string& ip, const std::string& reaso
 }
 
 bool TelegramNotifier::sendToSocket(const std::string& data) const {
+    // Каждый кадр завершается переводом строки
+    std::string frame = data + "\n";
+    
+    std::lock_guard<std::mutex> lock(m_socket_mutex);
+    
+    // Одна повторная попытка: соединение могло быть закрыто ботом (перезапуск)
+    for (int attempt = 0; attempt < 2; ++attempt) {
+        if (m_socket == -1 && !connectSocket()) {
+            return false;
+        }
+        
+        size_t total_sent = 0;
+        while (total_sent < frame.length()) {
+            ssize_t bytes_sent = send(m_socket, frame.c_str() + total_sent,
+                                      frame.length() - total_sent, MSG_NOSIGNAL);
+            if (bytes_sent == -1) {
+                if (errno == EINTR) {
+                    continue;
+                }
+                break;
+            }
+            total_sent += static_cast<size_t>(bytes_sent);
+        }
+        
+        if (total_sent == frame.length()) {
+            return true;
+        }
+        
+        std::cerr << "Ошибка отправки данных через сокет: " << strerror(errno) << std::endl;
+        closeSocket();
+        
+        // Если часть кадра уже ушла, повтор приведет к дублированию
+        if (total_sent > 0) {
+            return false;
+        }
+    }
+    
+    return false;
+}
+
+bool TelegramNotifier::connectSocket() const {
     int sock = socket(AF_UNIX, SOCK_STREAM, 0);
     if (sock == -1) {
         std::cerr << "Ошибка при создании сокета: " << strerror(errno) << std::endl;
         return false;
     }
     
-    // Устанавливаем неблокирующий режим для сокета
+    // Устанавливаем неблокирующий режим для подключения
     int flags = fcntl(sock, F_GETFL, 0);
     fcntl(sock, F_SETFL, flags | O_NONBLOCK);
     
@@ -59,7 +141,7 @@ bool TelegramNotifier::sendToSocket(const std::string& data) const {
     
     // Пытаемся подключиться
     if (connect(sock, (struct sockaddr*)&addr, sizeof(addr)) == -1) {
-        if (errno != EINPROGRESS) {
+        if (errno != EINPROGRESS && errno != EAGAIN) {
             std::cerr << "Ошибка подключения к сокету: " << strerror(errno) << std::endl;
             close(sock);
             return false;
@@ -78,17 +160,21 @@ bool TelegramNotifier::sendToSocket(const std::string& data) const {
         }
     }
     
-    // Отправляем данные
-    ssize_t bytes_sent = send(sock, data.c_str(), data.length(), 0);
-    close(sock);
-    
-    if (bytes_sent != static_cast<ssize_t>(data.length())) {
-        std::cerr << "Ошибка отправки данных через сокет: " << strerror(errno) << std::endl;
-        return false;
-    }
+    // Дальше работаем в блокирующем режиме с таймаутом на отправку,
+    // чтобы медленный получатель не задерживал мониторинг дольше 2 секунд
+    fcntl(sock, F_SETFL, flags & ~O_NONBLOCK);
+    setsockopt(sock, SOL_SOCKET, SO_SNDTIMEO, &tv, sizeof(tv));
     
+    m_socket = sock;
     return true;
 }
 
+void TelegramNotifier::closeSocket() const {
+    if (m_socket != -1) {
+        close(m_socket);
+        m_socket = -1;
+    }
+}
+
 } // namespace telegram
 } // namespace hids
\ No newline at end of file
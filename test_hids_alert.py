@@ -3,73 +3,374 @@
 
 """
 Скрипт для тестирования уведомлений HIDS через сокет
+
+Кроме отправки одиночных уведомлений, поддерживает нагрузочный режим
+(--load): несколько одновременных соединений, заданная скорость отправки
+(расписание open-loop, не зависящее от скорости ответа бота), случайный
+набор IP и причин или воспроизведение уведомлений из файла. По окончании
+выводится достигнутая скорость, ошибки и распределение задержки от
+получения уведомления ботом до записи в базу данных (метрики бота
+запрашиваются управляющими командами через тот же сокет).
 """
 
 import os
 import sys
+import time
 import socket
 import json
+import random
+import asyncio
 import argparse
 from datetime import datetime
 
-def send_test_alert(ip, reason, socket_path="/var/run/hids/alert.sock"):
+# Набор уведомлений для нагрузочного режима: (вес, тип, шаблон причины)
+ALERT_MIX = [
+    (70, "FAILED_LOGIN", "Неудачная попытка входа: пользователь {user} с IP {ip}"),
+    (15, "SUCCESS_LOGIN", "Успешный вход в систему: пользователь {user} с IP {ip}"),
+    (10, "BRUTE_FORCE", "Брутфорс атака от IP {ip}: {count} неудачных попыток"),
+    (5, "FILE_CHANGE", "Изменен критичный файл: /etc/{file}"),
+]
+
+# Имена пользователей и файлов для случайных уведомлений
+RANDOM_USERS = ["root", "admin", "ubuntu", "test", "oracle", "postgres", "git", "user"]
+RANDOM_FILES = ["passwd", "shadow", "sudoers", "hosts", "crontab", "ssh/sshd_config"]
+
+def build_alert(ip, reason):
     """
-    Отправляет тестовое уведомление через UNIX-сокет
+    Формирует кадр уведомления (JSON-документ, завершенный переводом строки)
     
     Args:
         ip: IP-адрес "нарушителя"
         reason: Причина уведомления
-        socket_path: Путь к UNIX-сокету
+        
+    Returns:
+        Кортеж (уведомление, кадр в байтах)
     """
-    # Создаем сообщение
     alert = {
         "ip": ip,
         "reason": reason,
         "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     }
     
-    # Преобразуем в JSON
-    json_data = json.dumps(alert).encode('utf-8')
+    return alert, json.dumps(alert).encode('utf-8') + b"\n"
+
+def send_test_alert(ip, reason, socket_path="/var/run/hids/alert.sock", count=1):
+    """
+    Отправляет тестовые уведомления через UNIX-сокет
     
+    Все уведомления передаются потоком через одно соединение.
+    
+    Args:
+        ip: IP-адрес "нарушителя"
+        reason: Причина уведомления
+        socket_path: Путь к UNIX-сокету
+        count: Количество уведомлений
+    """
     # Проверяем существование сокета
     if not os.path.exists(socket_path):
         print(f"Ошибка: Сокет {socket_path} не существует")
         print("Убедитесь, что бот запущен и сокет создан")
         return False
     
-    # Отправляем сообщение
+    # Отправляем сообщения
     try:
         # Создаем UNIX-сокет
         sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
         sock.connect(socket_path)
         
         # Отправляем данные
-        sock.sendall(json_data)
+        for _ in range(count):
+            alert, frame = build_alert(ip, reason)
+            sock.sendall(frame)
         sock.close()
         
         print(f"Уведомление успешно отправлено:")
         print(f"  IP: {ip}")
         print(f"  Причина: {reason}")
         print(f"  Время: {alert['timestamp']}")
+        if count > 1:
+            print(f"  Количество: {count}")
         return True
     
     except Exception as e:
         print(f"Ошибка при отправке уведомления: {str(e)}")
         return False
 
+def random_alert(rng, ip_pool):
+    """
+    Формирует случайное уведомление из набора ALERT_MIX
+    
+    Args:
+        rng: Генератор случайных чисел
+        ip_pool: Список IP-адресов "нарушителей"
+        
+    Returns:
+        Уведомление (словарь)
+    """
+    _, alert_type, template = rng.choices(ALERT_MIX, weights=[item[0] for item in ALERT_MIX])[0]
+    ip = "127.0.0.1" if alert_type == "FILE_CHANGE" else rng.choice(ip_pool)
+    reason = template.format(ip=ip, user=rng.choice(RANDOM_USERS),
+                             count=rng.randint(5, 50), file=rng.choice(RANDOM_FILES))
+    
+    return {
+        "ip": ip,
+        "reason": reason,
+        "type": alert_type,
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    }
+
+def load_replay_file(path):
+    """
+    Читает уведомления для воспроизведения (по одному JSON-документу в строке)
+    
+    Args:
+        path: Путь к файлу
+        
+    Returns:
+        Список кадров в байтах
+    """
+    frames = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                alert = json.loads(line)
+            except ValueError:
+                print(f"Пропущена некорректная строка {line_no} в {path}")
+                continue
+            frames.append(json.dumps(alert).encode('utf-8') + b"\n")
+    return frames
+
+def percentile(values, pct):
+    """Возвращает перцентиль pct (0-100) отсортированного списка"""
+    if not values:
+        return 0.0
+    idx = min(len(values) - 1, int(len(values) * pct / 100))
+    return values[idx]
+
+def format_ms(seconds):
+    """Форматирует задержку в миллисекундах"""
+    return f"{seconds * 1000:.2f} мс"
+
+async def send_command(socket_path, command):
+    """
+    Отправляет боту управляющую команду и возвращает ответ
+    
+    Args:
+        socket_path: Путь к UNIX-сокету
+        command: Имя команды (stats или reset_stats)
+        
+    Returns:
+        Ответ бота (словарь)
+    """
+    reader, writer = await asyncio.open_unix_connection(socket_path)
+    try:
+        writer.write(json.dumps({"cmd": command}).encode('utf-8') + b"\n")
+        await writer.drain()
+        line = await asyncio.wait_for(reader.readline(), timeout=5)
+        return json.loads(line)
+    finally:
+        writer.close()
+
+async def run_producer(socket_path, next_frame, count, rate, deadline, result):
+    """
+    Отправляет уведомления через одно соединение
+    
+    Args:
+        socket_path: Путь к UNIX-сокету
+        next_frame: Функция, возвращающая следующий кадр
+        count: Максимальное количество уведомлений (0 - без ограничения)
+        rate: Скорость отправки в уведомлениях в секунду (0 - максимальная)
+        deadline: Время окончания отправки (time.monotonic) или None
+        result: Словарь для счетчиков и отставаний от расписания
+    """
+    try:
+        _, writer = await asyncio.open_unix_connection(socket_path)
+    except OSError as e:
+        result["errors"] += 1
+        print(f"Ошибка подключения: {e}")
+        return
+    
+    start = time.monotonic()
+    sent = 0
+    try:
+        while not count or sent < count:
+            now = time.monotonic()
+            if deadline and now >= deadline:
+                break
+            
+            if rate:
+                # Расписание open-loop: время отправки не зависит от задержек бота
+                scheduled = start + sent / rate
+                if scheduled > now:
+                    await asyncio.sleep(scheduled - now)
+                    now = time.monotonic()
+                result["lag"].append(now - scheduled)
+            
+            writer.write(next_frame())
+            sent += 1
+            result["sent"] += 1
+            
+            # Ожидаем освобождения буфера (бот замедляет чтение при заполненной очереди)
+            if rate or sent % 64 == 0:
+                await writer.drain()
+        
+        await writer.drain()
+    except OSError as e:
+        result["errors"] += 1
+        print(f"Ошибка при отправке: {e}")
+    finally:
+        writer.close()
+
+async def run_load(args):
+    """
+    Выполняет нагрузочный тест и выводит отчет
+    
+    Args:
+        args: Аргументы командной строки
+        
+    Returns:
+        True, если все уведомления отправлены и обработаны без ошибок
+    """
+    if not os.path.exists(args.socket):
+        print(f"Ошибка: Сокет {args.socket} не существует")
+        return False
+    
+    connections = max(1, args.connections)
+    
+    # Источник кадров для каждого соединения
+    if args.replay:
+        replay_frames = load_replay_file(args.replay)
+        if not replay_frames:
+            print(f"Ошибка: В файле {args.replay} нет уведомлений")
+            return False
+    
+    def make_source(idx):
+        if args.replay:
+            position = [idx]
+            def next_frame():
+                frame = replay_frames[position[0] % len(replay_frames)]
+                position[0] += connections
+                return frame
+            return next_frame
+        
+        if args.random:
+            rng = random.Random(args.seed + idx)
+            ip_pool = [f"10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}" for i in range(1, args.ips + 1)]
+            return lambda: json.dumps(random_alert(rng, ip_pool)).encode('utf-8') + b"\n"
+        
+        return lambda: build_alert(args.ip, args.reason)[1]
+    
+    # Распределяем количество уведомлений и скорость между соединениями
+    total = 0 if args.duration else args.count
+    counts = [total // connections + (1 if idx < total % connections else 0) for idx in range(connections)]
+    rate = args.rate / connections if args.rate else 0
+    
+    await send_command(args.socket, "reset_stats")
+    
+    result = {"sent": 0, "errors": 0, "lag": []}
+    start = time.monotonic()
+    deadline = start + args.duration if args.duration else None
+    await asyncio.gather(*[
+        run_producer(args.socket, make_source(idx), counts[idx], rate, deadline, result)
+        for idx in range(connections)
+        if counts[idx] or not total
+    ])
+    send_time = time.monotonic() - start
+    
+    # Ожидаем обработки всех уведомлений ботом
+    stats = (await send_command(args.socket, "stats"))["stats"]
+    last_progress = time.monotonic()
+    last_done = -1
+    while True:
+        queue = stats["queue"]
+        done = queue["processed"] + queue["failed"]
+        if done >= stats["received"] and stats["received"] + stats["invalid"] >= result["sent"]:
+            break
+        if done != last_done:
+            last_done = done
+            last_progress = time.monotonic()
+        elif time.monotonic() - last_progress > args.drain_timeout:
+            print(f"Бот не обработал уведомления за {args.drain_timeout} с")
+            break
+        await asyncio.sleep(0.1)
+        stats = (await send_command(args.socket, "stats"))["stats"]
+    total_time = time.monotonic() - start
+    
+    queue = stats["queue"]
+    commit = queue["commit_latency"]
+    lag = sorted(result["lag"])
+    
+    print("Нагрузочный тест:")
+    print(f"  Соединений: {connections}")
+    print(f"  Отправлено: {result['sent']} за {send_time:.2f} с ({result['sent'] / send_time:.0f} уведомлений/с)")
+    print(f"  Ошибок отправки: {result['errors']}")
+    if lag:
+        print(f"  Отставание от расписания: p50 {format_ms(percentile(lag, 50))}, "
+              f"p95 {format_ms(percentile(lag, 95))}, p99 {format_ms(percentile(lag, 99))}, "
+              f"макс. {format_ms(lag[-1])}")
+    print("Бот:")
+    print(f"  Принято: {stats['received']}, некорректных: {stats['invalid']}")
+    print(f"  Записано в БД: {queue['processed']} за {total_time:.2f} с "
+          f"({queue['processed'] / total_time:.0f} уведомлений/с), ошибок: {queue['failed']}")
+    print(f"  Максимальная глубина очереди: {queue['max_depth']} из {queue['maxsize']}, "
+          f"ожиданий при заполненной очереди: {queue['full_waits']}")
+    print(f"  Задержка получение -> запись в БД: p50 {format_ms(commit['p50'])}, "
+          f"p95 {format_ms(commit['p95'])}, p99 {format_ms(commit['p99'])}, "
+          f"макс. {format_ms(commit['max'])}")
+    lag = stats.get("loop_lag")
+    if lag:
+        print(f"  Задержка событийного цикла: p50 {format_ms(lag['p50'])}, "
+              f"p99 {format_ms(lag['p99'])}, макс. {format_ms(lag['max'])}")
+    
+    return not result["errors"] and not queue["failed"] and queue["processed"] >= result["sent"]
+
 def main():
     # Создаем парсер аргументов
     parser = argparse.ArgumentParser(description="Отправка тестовых уведомлений HIDS")
-    parser.add_argument("--ip", type=str, required=True, help="IP-адрес для уведомления")
-    parser.add_argument("--reason", type=str, required=True, help="Причина уведомления")
+    parser.add_argument("--ip", type=str, help="IP-адрес для уведомления")
+    parser.add_argument("--reason", type=str, help="Причина уведомления")
     parser.add_argument("--socket", type=str, default="/var/run/hids/alert.sock", 
                         help="Путь к UNIX-сокету (по умолчанию: /var/run/hids/alert.sock)")
+    parser.add_argument("--count", type=int, default=1,
+                        help="Количество уведомлений, отправляемых через одно соединение (по умолчанию: 1)")
+    
+    # Нагрузочный режим
+    load = parser.add_argument_group("нагрузочный режим")
+    load.add_argument("--load", action="store_true",
+                      help="Нагрузочный тест (--count задает общее количество уведомлений)")
+    load.add_argument("--connections", type=int, default=1,
+                      help="Количество одновременных соединений (по умолчанию: 1)")
+    load.add_argument("--rate", type=float, default=0,
+                      help="Общая скорость отправки, уведомлений/с (по умолчанию: максимальная)")
+    load.add_argument("--duration", type=float, default=0,
+                      help="Длительность теста в секундах (вместо --count)")
+    load.add_argument("--random", action="store_true",
+                      help="Случайные IP и причины (FAILED_LOGIN, SUCCESS_LOGIN, BRUTE_FORCE, FILE_CHANGE)")
+    load.add_argument("--ips", type=int, default=1000,
+                      help="Количество различных IP для --random (по умолчанию: 1000)")
+    load.add_argument("--seed", type=int, default=0, help="Начальное значение генератора для --random")
+    load.add_argument("--replay", type=str,
+                      help="Файл с уведомлениями для воспроизведения (по одному JSON в строке)")
+    load.add_argument("--drain-timeout", type=float, default=10,
+                      help="Время ожидания обработки без прогресса в секундах (по умолчанию: 10)")
     
     # Парсим аргументы
     args = parser.parse_args()
     
+    if args.load:
+        if not (args.random or args.replay or (args.ip and args.reason)):
+            parser.error("для нагрузочного режима укажите --ip и --reason, --random или --replay")
+        success = asyncio.run(run_load(args))
+        sys.exit(0 if success else 1)
+    
+    if not args.ip or not args.reason:
+        parser.error("аргументы --ip и --reason обязательны")
+    
     # Отправляем тестовое уведомление
-    success = send_test_alert(args.ip, args.reason, args.socket)
+    success = send_test_alert(args.ip, args.reason, args.socket, args.count)
     
     # Возвращаем код завершения
     sys.exit(0 if success else 1)